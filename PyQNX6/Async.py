@@ -0,0 +1,232 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+asyncio (trollius) clients and servers.
+
+The kernel calls block, so they are kept off the event loop:
+
+    - AsyncQNXClient.Send () is a coroutine. The MsgSend is run in a bounded
+      executor shared by every client, one send at a time per connection, so
+      the replies on a connection come back in the order the sends were made.
+    - AsyncQNXServer receives in a thread of its own and runs each message's
+      handler as a coroutine on the loop. Slow requests overlap, each client
+      stays reply blocked until its handler returns.
+
+e.g.
+    @asyncio.coroutine
+    def Handler (Server, Rcvid, Data):
+	Result = yield From (Lookup (Data))
+	raise Return ((0, Result))
+
+    Server = AsyncQNXServer ("gateway", Handler)
+    Client = yield From (AsyncQNXClient.Open ("gps"))
+    (Status, Reply) = yield From (Client.Send ("where"))
+
+Requires trollius (and futures), the python 2 asyncio.
+'''
+import sys, os, errno, threading, functools, traceback
+
+import trollius as asyncio
+from trollius import From, Return
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQNX6.Message import Message
+from PyQNX6.Client  import QNXClient
+from PyQNX6 import Batch
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+Workers = 8	#: default size of the shared executor
+_Executor = None
+
+def SharedExecutor ():
+    """
+    @return the executor shared by the clients, created on first use with Workers threads.
+    """
+    global _Executor
+    if _Executor == None:
+	_Executor = ThreadPoolExecutor (Workers)
+    return _Executor
+
+
+class AsyncQNXClient (QNXClient):
+    """
+    A QNXClient for asyncio. Send () is a coroutine, the blocking calls run in an executor.
+    @param Executor: The executor for the kernel calls, by default the shared one.
+    @param Loop: The event loop, by default the current one.
+    The remaining parameters are as QNXClient, but WaitFor is False, use Open () to wait for the name.
+    """
+    def __init__ (self, Name, Global=False, RawMode=False, WaitFor=False, ViewMode=False,
+			CodecName="pickle0", Types=None, Executor=None, Loop=None):
+	QNXClient.__init__ (self, Name, Global=Global, RawMode=RawMode, WaitFor=WaitFor,
+			ViewMode=ViewMode, CodecName=CodecName, Types=Types)
+	self.Executor = Executor or SharedExecutor ()
+	self.Loop     = Loop or asyncio.get_event_loop ()
+	self._Lock    = asyncio.Lock (loop=self.Loop)	# one send at a time, in order
+
+    @classmethod
+    @asyncio.coroutine
+    def Open (cls, Name, Executor=None, Loop=None, **Args):
+	"""
+	Coroutine. Wait for the Name to be attached, without blocking the loop, and connect to it.
+	@return the AsyncQNXClient.
+	"""
+	Executor = Executor or SharedExecutor ()
+	Loop     = Loop or asyncio.get_event_loop ()
+	Args ['WaitFor'] = True
+	Client = yield From (Loop.run_in_executor (Executor,
+			functools.partial (cls, Name, Executor=Executor, Loop=Loop, **Args)))
+	raise Return (Client)
+
+    @asyncio.coroutine
+    def Send (self, TxData, RxLen=1024, **Args):
+	"""
+	Coroutine. MsgSend the TxData (see Message.MsgSend for the arguments).
+	@return a tuple with the (MsgSend result and the reply data).
+	In ViewMode the reply is a copy, the buffer is reused by the next send.
+	"""
+	Args ['Copy'] = True
+	with (yield From (self._Lock)):
+	    (Result, Len) = yield From (self.Loop.run_in_executor (self.Executor,
+				functools.partial (self.MsgSend, TxData, RxLen, **Args)))
+	    raise Return ((Result, self.RxData))
+
+    send = Send
+
+    @asyncio.coroutine
+    def Sendv (self, TxParts, RxParts = []):
+	"""
+	Coroutine. MsgSendv the parts.
+	@return The result from the MsgSendv.
+	"""
+	with (yield From (self._Lock)):
+	    Result = yield From (self.Loop.run_in_executor (self.Executor,
+				functools.partial (self.MsgSendv, TxParts, RxParts)))
+	    raise Return (Result)
+
+
+class AsyncQNXServer (Message):
+    """
+    A server for asyncio. One thread receives, the Function is a coroutine run on the loop
+    for each message (or pulse), as Function (Server, Rcvid, Data) and returns (Status, Data)
+    for the reply.
+    @param Limit: The most messages handled at once, further clients stay send blocked.
+    Call Stop () (from a handler or the loop) to stop receiving, Run () returns once the
+    handlers already started are done.
+    """
+    _PULSE_CODE_STOP = 0x7f
+
+    def __init__ (self, Name, Function, Global=False, RawMode=False, CodecName="pickle0", Types=None,
+			Limit=64, Loop=None, Start=False):
+	Message.__init__ (self, Name, Attach=True, Global=Global, RawMode=RawMode, CodecName=CodecName,
+			Types=Types)
+	self.Name     = Name
+	self.Global   = Global
+	self.RawMode  = RawMode
+	self.Function = Function
+	self.Loop     = Loop or asyncio.get_event_loop ()
+	self.Limit    = Limit
+	self.Pending  = 0	# handlers running
+	self.Stopping = False
+	self.Receiving = False
+	self._Slots   = threading.Semaphore (Limit)
+	self._Thread  = None
+	self._Done    = None
+	if Start: self.Start ()
+
+    def _Receiver (self):
+	"""
+	The receive thread. Hands each message to the loop.
+	"""
+	while True:
+	    self._Slots.acquire ()
+	    (Rcvid, Len) = self.MsgReceive (Copy = True)
+	    if Rcvid == -1 or (Rcvid == 0 and self.Stopping):
+		break
+	    # a pulse is a view of the receive buffer, the next receive overwrites it
+	    Data = self.pulse.Copy () if Rcvid == 0 else self.RxData
+	    self.Loop.call_soon_threadsafe (self._Dispatch, Rcvid, Data, self.RxCodec)
+	self._Slots.release ()
+	self.Loop.call_soon_threadsafe (self._Received)
+
+    def _Received (self):
+	self.Receiving = False
+	self._Stopped ()
+
+    def _Dispatch (self, Rcvid, Data, RxCodec):
+	self.Pending += 1
+	asyncio.ensure_future (self._Handle (Rcvid, Data, RxCodec), loop=self.Loop)
+
+    @asyncio.coroutine
+    def _Handle (self, Rcvid, Data, RxCodec):
+	"""
+	Run the Function for a message and reply. If it fails the client gets EIO.
+	"""
+	try:
+	    try:
+		if isinstance (Data, Batch.Request):
+		    (Status, Data) = (0, (yield From (self._Batch (Rcvid, Data))))
+		else:
+		    (Status, Data) = yield From (self.Function (self, Rcvid, Data))
+	    except Exception:
+		traceback.print_exc ()
+		if Rcvid: self.MsgError (errno.EIO, Rcvid)
+		return
+	    if Rcvid:
+		self.MsgReply (Status, Data, Rcvid = Rcvid, CodecName = RxCodec)
+	finally:
+	    self.Pending -= 1
+	    self._Slots.release ()
+	    self._Stopped ()
+
+    @asyncio.coroutine
+    def _Batch (self, Rcvid, Entries):
+	"""
+	Run the Function for each entry of a batch, in turn. See PyQNX6.Batch.Call.
+	"""
+	Result = Batch.Reply (Entries.Codec)
+	for Data in Entries:
+	    try:
+		(Status, Data) = yield From (self.Function (self, Rcvid, Data))
+	    except Exception as e:
+		Result.Fail (errno.EIO, "%s: %s" % (e.__class__.__name__, e))
+		continue
+	    Result.Add (Status, Data)
+	raise Return (Result)
+
+    def _Stopped (self):
+	if self._Done and not self._Done.done () and self.Pending == 0 and not self.Receiving:
+	    self._Done.set_result (None)
+
+    def Start (self):
+	"""
+	Start the receive thread.
+	"""
+	if self.Receiving: return
+	self.Stopping = False
+	self.Receiving = True
+	self._Done    = asyncio.Future (loop=self.Loop)
+	self._Thread  = threading.Thread (target=self._Receiver)
+	self._Thread.daemon = True
+	self._Thread.start ()
+
+    @asyncio.coroutine
+    def Run (self):
+	"""
+	Coroutine. Serve until Stop ().
+	"""
+	self.Start ()
+	yield From (self._Done)
+
+    def Stop (self):
+	"""
+	Stop receiving. The receive thread is woken with a pulse.
+	"""
+	self.Stopping = True
+	if not self.ConnectionOk (): self.ConnectAttach (Chid=self.chid)
+	self.MsgSendPulse (Code=self._PULSE_CODE_STOP)
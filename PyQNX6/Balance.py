@@ -0,0 +1,204 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Client side load balancing. A service run as several replicas, each attached
+under its own name (svc.0, svc.1, ...), is used through one BalancedClient.
+Each Send goes to one replica, chosen by :
+
+    - LEAST       the replica with the fewest requests outstanding (from this process).
+    - TWO_CHOICES two replicas picked at random, the one with fewer outstanding.
+
+ties going to one at random. A replica that fails (the server has gone, or
+it cant be opened) or replies slower than Timeout is ejected for Cooldown
+seconds, the send is tried on another. After the cooldown it is used again,
+and ejected again if it still fails. An error the server replies with
+(MsgError) is the request's, it is returned as it is.
+
+e.g.
+    Service = BalancedClient (BalancedClient.Discover ("svc"))
+    (Result, Reply) = Service.Send (("lookup", Key))
+    for Replica in Service.Replicas: print Replica
+
+Connections come from a ConnectionPool (PyQNX6.Connections), so each thread
+has its own to each replica.
+'''
+import sys, os, time, errno, random, threading
+
+from ctypes import *
+
+from PyQNX6.core import _AttachPath
+from PyQNX6.Connections import ServerGone, SharedPool
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+LEAST       = "least"
+TWO_CHOICES = "p2c"
+
+# the send errors that are the replica's fault, rather than the request's. A replica
+# that cant be opened has failed too, whatever the error.
+ReplicaFailed = ServerGone
+
+
+class Replica (object):
+    """
+    One replica and its figures.
+    Latency is a moving average of the MsgSend time in seconds, None until the first reply.
+    Ejected is the time it may be used again, 0 if it is in use.
+    """
+    def __init__ (self, Name):
+	self.Name        = Name
+	self.Outstanding = 0	# sends not yet replied
+	self.Sent        = 0
+	self.Failed      = 0
+	self.Slow        = 0	# replies slower than the Timeout
+	self.Ejections   = 0
+	self.Ejected     = 0
+	self.Latency     = None
+	self.Max         = 0.0	# the slowest reply
+
+    def Available (self, Now):
+	return self.Ejected <= Now
+
+    def __repr__ (self):
+	Latency = "-" if self.Latency == None else "%.3fms" % (self.Latency * 1000)
+	return "<Replica %s outstanding %d sent %d failed %d slow %d latency %s%s>" % (
+		self.Name, self.Outstanding, self.Sent, self.Failed, self.Slow, Latency,
+		" ejected" if self.Ejected > time.time () else "")
+
+
+class BalancedClient (object):
+    """
+    Spreads sends over replicas of a service.
+    @param Names: The replica names.
+    @param Global: True if the names are registered globally.
+    @param Policy: LEAST or TWO_CHOICES.
+    @param Timeout: Seconds, a reply slower than this ejects the replica (the send isnt interrupted,
+    it is the replicas after it that are spared). None for no limit.
+    @param Cooldown: Seconds a replica stays ejected.
+    @param Retries: After a replica fails the send is tried on this many others. The request
+    may have reached the one that failed, use 0 if it mustnt be repeated (the pool isnt let
+    resend it either).
+    @param Decay: The weight of each new reply in the Latency average.
+    @param Pool: The ConnectionPool, by default the shared one.
+    """
+    def __init__ (self, Names, Global = False, Policy = LEAST, Timeout = None, Cooldown = 5.0,
+			Retries = 1, Decay = 0.2, Pool = None):
+	if Policy not in (LEAST, TWO_CHOICES): raise ValueError ("unknown policy %r" % (Policy,))
+	self.Replicas = [Replica (Name) for Name in Names]
+	self.Global   = Global
+	self.Policy   = Policy
+	self.Timeout  = Timeout
+	self.Cooldown = Cooldown
+	self.Retries  = Retries
+	self.Decay    = Decay
+	self.Pool     = Pool or SharedPool ()
+	self._Lock    = threading.Lock ()
+	if not self.Replicas: raise ValueError ("no replicas")
+
+    @staticmethod
+    def Discover (Prefix, Global = False):
+	"""
+	@return the attached names Prefix.0, Prefix.1 etc (any Prefix.<number>), in order.
+	"""
+	Dir = os.path.dirname (_AttachPath (Prefix, Global))
+	try: Entries = os.listdir (Dir)
+	except OSError: return []
+	Found = [Entry for Entry in Entries
+		 if Entry.startswith (Prefix + ".") and Entry [len (Prefix) + 1:].isdigit ()]
+	return sorted (Found, key = lambda Entry: int (Entry [len (Prefix) + 1:]))
+
+    def _Key (self, Replica):
+	return Replica.Outstanding
+
+    def _Choose (self, Tried):
+	"""
+	Pick a replica, not one already Tried, and count the send as outstanding. Called holding the lock.
+	@return the Replica, or None if every one has been tried.
+	"""
+	Now = time.time ()
+	Candidates = [Replica for Replica in self.Replicas if Replica not in Tried]
+	if not Candidates: return None
+	Available = [Replica for Replica in Candidates if Replica.Available (Now)]
+	if not Available:
+	    # every one is ejected, try the one back soonest rather than fail
+	    Chosen = min (Candidates, key = lambda Replica: Replica.Ejected)
+	elif self.Policy == TWO_CHOICES and len (Available) > 2:
+	    Chosen = min (random.sample (Available, 2), key = self._Key)
+	else:
+	    Lowest = min ([self._Key (Replica) for Replica in Available])
+	    Chosen = random.choice ([Replica for Replica in Available if self._Key (Replica) == Lowest])
+	Chosen.Outstanding += 1
+	Chosen.Sent += 1
+	return Chosen
+
+    def _Eject (self, Replica, Now):
+	if Replica.Ejected <= Now: Replica.Ejections += 1
+	Replica.Ejected = Now + self.Cooldown
+
+    def _Done (self, Replica, Started, Failed):
+	"""
+	Record a send. Called holding the lock.
+	"""
+	Now = time.time ()
+	Replica.Outstanding -= 1
+	if Failed:
+	    Replica.Failed += 1
+	    self._Eject (Replica, Now)
+	    return
+	Elapsed = Now - Started
+	Replica.Max = max (Replica.Max, Elapsed)
+	if Replica.Latency == None: Replica.Latency = Elapsed
+	else: Replica.Latency += self.Decay * (Elapsed - Replica.Latency)
+	if self.Timeout != None and Elapsed > self.Timeout:
+	    Replica.Slow += 1
+	    self._Eject (Replica, Now)
+	else:
+	    Replica.Ejected = 0
+
+    def Send (self, TxData, RxLen = 1024, **Args):
+	"""
+	MsgSend TxData to a replica (see Message.MsgSend for the arguments).
+	@return a tuple with the (MsgSend result and the reply data). If every replica
+	tried failed, the result is -1 with the last error in errno (ctypes.get_errno).
+	"""
+	Tried = []
+	Error = errno.ESRCH
+	while len (Tried) <= self.Retries:
+	    with self._Lock:
+		Chosen = self._Choose (Tried)
+	    if Chosen == None: break
+	    Tried.append (Chosen)
+	    Started = time.time ()
+	    try:
+		self.Pool.Get (Chosen.Name, self.Global)	# opened first, so only the MsgSend is timed
+		Started = time.time ()
+		(Result, Data) = self.Pool.Send (Chosen.Name, TxData, RxLen, self.Global, Resend = False, **Args)
+		Error = get_errno () if Result == -1 else 0
+		Failed = Result == -1 and Error in ReplicaFailed
+	    except EnvironmentError as e:
+		(Result, Data, Error, Failed) = (-1, None, e.errno, True)
+	    with self._Lock:
+		self._Done (Chosen, Started, Failed)
+	    if not Failed: return (Result, Data)
+	set_errno (Error)
+	return (-1, None)
+
+    send = Send
+
+    def Stats (self):
+	"""
+	@return a dict of name -> (outstanding, sent, failed, slow, latency in seconds, ejected).
+	"""
+	Now = time.time ()
+	with self._Lock:
+	    return dict ((Replica.Name, (Replica.Outstanding, Replica.Sent, Replica.Failed, Replica.Slow,
+				       Replica.Latency, not Replica.Available (Now)))
+			 for Replica in self.Replicas)
+
+    def __repr__ (self):
+	return "<BalancedClient %s %s>" % (self.Policy, " ".join ([Replica.Name for Replica in self.Replicas]))
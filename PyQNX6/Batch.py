@@ -0,0 +1,294 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Request batching. Many small calls are framed into one message, the server
+calls its Function for each and returns every result in one reply, so a
+hundred gets cost one round trip rather than a hundred.
+
+e.g.
+    with Client.Batch () as b:
+	Speed = b.Call (("get", "speed"))
+	Limit = b.Call (("get", "limit"))
+    print Speed.Status, Speed.Data
+    (Status, Data) = Limit.Result ()	# raises OSError if the entry failed
+
+QNXServer and QNXServerThreaded (and AsyncQNXServer) unpack a batch and call
+Function (Server, Rcvid, Data) once for each entry, Rcvid is that of the batch.
+The server must not be in RawMode, each entry is encoded with the codec.
+
+A batch is a codec header with the FLAG_BATCH flag, then the entries, each a
+32 bit length and the encoded data. The reply has the same header, then for
+each entry its status, error (0, or an errno) and length, and the encoded data.
+An entry whose Function raised has the error EIO and the exception text as its data
+(the text is sent as is, not encoded, so it doesnt depend on the codec).
+
+The replies of a batch must fit the client's reply buffer (RxLen). Given the expected
+reply size (ReplyBytes) the client sends the calls whose replies will fit in each
+message. The server keeps room for the status of every entry, once an entry's data 
+doesnt fit it fails with E2BIG (it was run) and the entries after it are not run, 
+the client sends those again in a further message.
+
+An entry can not be deferred (Message.Defer), the batch is replied as a whole. 
+A Function that defers in a batch has its entry failed with ENOTSUP.
+'''
+import sys, os, errno, struct
+
+from ctypes import *
+
+from PyQNX6 import Codec
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+_HeaderLen = Codec.HeaderLen
+_Entry = struct.Struct ('<I')		# length
+_Result = struct.Struct ('<iiI')	# status, error, length
+
+# The Function asking the server to stop, as it does outside a batch.
+_StopExceptions = (StopIteration, KeyboardInterrupt, EOFError)
+
+
+class Result (object):
+    """
+    The result of one call in a batch, filled in when the batch is sent.
+    Status and Data are those the server Function returned for it.
+    Error is 0, or the errno if the entry failed (EIO, the Function raised and Data is the
+    exception text. EINTR, the server stopped first. E2BIG, its reply data didnt fit what 
+    was left of the reply buffer. ENOTSUP, the Function deferred it).
+    """
+    __slots__ = ('Status', 'Error', 'Data', 'Done')
+
+    def __init__ (self):
+	self.Status = None
+	self.Error  = 0
+	self.Data   = None
+	self.Done   = False
+
+    def Result (self):
+	"""
+	@return a tuple with the (Status and Data)
+	@raise OSError if the entry failed, or ValueError if the batch hasnt been sent.
+	"""
+	if not self.Done: raise ValueError ("batch not sent")
+	if self.Error: raise OSError (self.Error, "%s %s" % (os.strerror (self.Error), self.Data or ""))
+	return (self.Status, self.Data)
+
+    def __repr__ (self):
+	if not self.Done: return "<Result pending>"
+	return "<Result %s %r%s>" % (self.Status, self.Data, " error %d" % self.Error if self.Error else "")
+
+
+class Batch (object):
+    """
+    Collects calls and sends them as one message. Use Message.Batch () to create one.
+    @param Client: The connected Message (QNXClient).
+    @param CodecName: The codec for the entries, by default the client codec.
+    @param RxLen: The reply buffer. Calls there is no room to reply to are sent again.
+    @param MaxBytes: Send when the entries reach this size, by default RxLen.
+    @param ReplyBytes: The expected size of a call's encoded reply data, send when the 
+    replies would no longer fit RxLen. By default the replies dont bound a message.
+    Leaving the with block sends what is left (not if it ends with an exception).
+    """
+    def __init__ (self, Client, CodecName = None, RxLen = 64 * 1024, MaxBytes = None, ReplyBytes = None):
+	self.Client   = Client
+	self.Codec    = Client.GetCodec (CodecName)
+	self.RxLen    = RxLen
+	self.MaxBytes = MaxBytes or RxLen
+	self.ReplyBytes = ReplyBytes
+	self.Sends    = 0	# messages sent
+	self.Calls    = 0	# entries sent
+	self._Parts   = []	# the encoded data of each call
+	self._Results = []
+	self._Bytes   = _HeaderLen
+	self._Replies = _HeaderLen	# the expected reply size
+
+    def Call (self, Data, ReplyBytes = None):
+	"""
+	Add a call, Data is what the server Function gets.
+	@param ReplyBytes: The expected reply data size of this call, by default the batch's.
+	@return the Result, filled in when the batch is sent.
+	"""
+	Encoded = self.Codec.Encode (Data)
+	if ReplyBytes == None: ReplyBytes = self.ReplyBytes or 0
+	Reply = _Result.size + ReplyBytes
+	if self._Results and (self._Bytes + _Entry.size + len (Encoded) > self.MaxBytes or
+			      self._Replies + Reply > self.RxLen):
+	    self.Send ()
+	self._Parts.append (Encoded)
+	self._Bytes += _Entry.size + len (Encoded)
+	self._Replies += Reply
+	Entry = Result ()
+	self._Results.append (Entry)
+	return Entry
+
+    call = Call
+
+    def Send (self):
+	"""
+	Send the calls collected so far, as one message, and fill in their Results.
+	@return the MsgSend result.
+	"""
+	if not self._Results: return 0
+	(Parts, Results) = (self._Parts, self._Results)
+	(self._Parts, self._Results, self._Bytes, self._Replies) = ([], [], _HeaderLen, _HeaderLen)
+	while True:
+	    Status = self._Send (Parts, Results)
+	    Again = [Index for Index, Entry in enumerate (Results) if Entry.Error == errno.EAGAIN]
+	    if Status == -1 or not Again or len (Again) == len (Results): return Status
+	    # the reply was full, these werent run
+	    Parts   = [Parts [Index] for Index in Again]
+	    Results = [Results [Index] for Index in Again]
+
+    def _Send (self, Parts, Results):
+	Body = "".join ([_Entry.pack (len (Encoded)) + Encoded for Encoded in Parts])
+	Frame = Codec.Header.pack (Codec.CODEC_MAGIC, self.Codec.Id, Codec.FLAG_BATCH, len (Body)) + Body
+	(Status, Len) = self.Client.MsgSend (Frame, self.RxLen, RawMode = True, View = True)
+	self.Sends += 1
+	self.Calls += len (Results)
+	if Status == -1:
+	    Error = get_errno () or errno.EIO
+	    for Entry in Results: (Entry.Error, Entry.Done) = (Error, True)
+	    return Status
+	self._Unpack (self.Client.RxData, Results)
+	return Status
+
+    def _Unpack (self, Reply, Results):
+	Offset, End = Codec.HeaderLen, len (Reply)
+	if End >= Codec.HeaderLen:
+	    (Magic, Id, Flags, Len) = Codec.Header.unpack_from (Reply, 0)
+	    if Magic != Codec.CODEC_MAGIC or not Flags & Codec.FLAG_BATCH: End = 0
+	    else: End = min (End, Codec.HeaderLen + Len)
+	for Entry in Results:
+	    Entry.Done = True
+	    if Offset + _Result.size <= End:
+		(Status, Error, Len) = _Result.unpack_from (Reply, Offset)
+		Offset += _Result.size
+		if Offset + Len <= End:
+		    (Entry.Status, Entry.Error, Entry.Data) = (Status, Error, None)
+		    if Len and Error: Entry.Data = Reply [Offset:Offset + Len].tobytes ()	# the text
+		    elif Len: Entry.Data = self.Codec.Decode (Reply [Offset:Offset + Len].tobytes ())
+		    Offset += Len
+		    continue
+	    Entry.Error = errno.E2BIG		# the reply was cut short
+	    Offset = End
+
+    def __enter__ (self):
+	return self
+
+    def __exit__ (self, Type, Value, Traceback):
+	if Type == None: self.Send ()
+
+    def __len__ (self):
+	return len (self._Results)
+
+
+#####################################
+# the server side
+
+class Request (list):
+    """
+    A received batch, the decoded data of each entry. Codec is the codec it was sent with.
+    """
+    def __init__ (self, Codec, Entries):
+	list.__init__ (self, Entries)
+	self.Codec = Codec
+
+def Unpack (RxCodec, Buffer, Offset, Length):
+    """
+    Decode the entries of a batch, Length bytes at Offset in a (ctypes) buffer.
+    @return the Request.
+    """
+    Entries = []
+    End = Offset + Length
+    while Offset + _Entry.size <= End:
+	(Len,) = _Entry.unpack_from (Buffer, Offset)
+	Offset += _Entry.size
+	if Offset + Len > End: raise ValueError ("batch entry of %d bytes, %d left" % (Len, End - Offset))
+	Entries.append (RxCodec.DecodeFrom (Buffer, Offset, Len))
+	Offset += Len
+    return Request (RxCodec, Entries)
+
+
+class Reply (object):
+    """
+    Builds the reply to a batch, one Add per entry. Replied with MsgReply, as a MessageType is.
+    @param Limit: The client's reply buffer size (msg_info dstmsglen), an entry whose data 
+    doesnt fit is failed with E2BIG and Full is set.
+    @param Entries: The number of entries, room is kept for the status of each.
+    """
+    def __init__ (self, RxCodec, Limit = None, Entries = 0):
+	self.Codec = RxCodec
+	self.Limit = Limit
+	self.Stop  = False	# a Function asked the server to stop
+	self.Full  = False	# the reply is full, the entries left are not run
+	self._Parts = []
+	self._Bytes = Codec.HeaderLen
+	self._Reserve = Entries * _Result.size
+
+    def Add (self, Status, Data = None, Error = 0):
+	self._Append (Status, Error, self.Codec.Encode (Data) if Data != None else "")
+
+    def Fail (self, Error, Text = None):
+	"""
+	Fail an entry. The Text is sent as a str, not with the codec.
+	"""
+	if isinstance (Text, unicode): Text = Text.encode ('utf-8')
+	self._Append (-1, Error, Text or "")
+
+    def _Append (self, Status, Error, Encoded):
+	self._Reserve = max (self._Reserve - _Result.size, 0)
+	if self.Limit and self._Bytes + self._Reserve + _Result.size + len (Encoded) > self.Limit:
+	    if not Error: (Status, Error) = (-1, errno.E2BIG)
+	    Encoded = ""
+	    self.Full = True
+	    if self._Bytes + _Result.size > self.Limit: return
+	self._Parts.append (_Result.pack (Status, Error, len (Encoded)))
+	self._Parts.append (Encoded)
+	self._Bytes += _Result.size + len (Encoded)
+
+    def Pack (self):
+	"""
+	@return the reply as a str.
+	"""
+	Body = "".join (self._Parts)
+	return Codec.Header.pack (Codec.CODEC_MAGIC, self.Codec.Id, Codec.FLAG_BATCH, len (Body)) + Body
+
+
+def Call (Function, Worker, Server, Rcvid, Entries):
+    """
+    Call Function (Worker, Rcvid, Data) for each entry of a batch.
+    An entry that raises fails with EIO, one that defers with ENOTSUP. One raising 
+    StopIteration (etc.) stops the batch, the rest fail with EINTR, and the Reply is 
+    marked Stop. Once the reply is full the rest are not run, they fail with EAGAIN 
+    and the client sends them again.
+    @return the Reply.
+    """
+    Result = Reply (Entries.Codec, Server.info.dstmsglen or None, len (Entries))
+    for Data in Entries:
+	if Result.Stop:
+	    Result.Fail (errno.EINTR)
+	    continue
+	if Result.Full:
+	    Result.Fail (errno.EAGAIN)
+	    continue
+	try:
+	    Returned = Function (Worker, Rcvid, Data)
+	    Deferred = Server._Take (Rcvid)
+	    if Deferred:		# the batch is replied as a whole
+		Server._Cancel ([Deferred], errno.ENOTSUP)
+		Result.Fail (errno.ENOTSUP, "a batch entry can not be deferred")
+		continue
+	    (Status, Data) = Returned
+	except _StopExceptions:
+	    Result.Stop = True
+	    Result.Fail (errno.EINTR)
+	    continue
+	except Exception as e:
+	    Result.Fail (errno.EIO, "%s: %s" % (e.__class__.__name__, e))
+	    continue
+	Result.Add (Status, Data)
+    return Result
@@ -16,16 +16,22 @@ __author__='Andy Rhind (Symmetry Innovations)'
 #####################################
 
 from PyQNX6.core import WaitforAttach
+from PyQNX6 import Schema
 
 class QNXClient (Message):
 
-    def __init__ (self, Name, Global=False, RawMode=False, WaitFor=True):
+    def __init__ (self, Name, Global=False, RawMode=False, WaitFor=True, ViewMode=False,
+			CodecName="pickle0", Types=None):
 	Message.__init__ (self)
 	self.RawMode = RawMode
+	self.ViewMode = ViewMode
+	self.Codec = CodecName
+	self.Types = Schema.Table (Types)
 	self.Global  = Global
 
 	if WaitFor:
-	    WaitforAttach (Name, Global)
+	    # True waits for ever, a number is a timeout in seconds (name_open then fails)
+	    WaitforAttach (Name, Global, None if WaitFor is True else WaitFor)
 
         self.coid = self.name_open (Name, Global)
 	self.Name = Name
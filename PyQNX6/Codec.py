@@ -0,0 +1,170 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Message codecs. Used by Message when not in RawMode, to convert python
+data to and from the bytes that are sent.
+
+Apart from the original (protocol 0 pickle) codec each message starts with
+a small header holding the codec id and the data length, so a server can
+accept messages from clients using different codecs.
+
+    - Pickle0Codec  'pickle0'  id 0  cPickle protocol 0, no header (the original)
+    - PickleCodec   'pickle'   id 1  cPickle highest protocol
+    - MarshalCodec  'marshal'  id 2  marshal, builtin types only
+    - BytesCodec    'bytes'    id 3  a list of length prefixed strings
+    - StructCodec   (user)           a struct format, packed tuples
+
+'''
+import abc, struct, marshal, cPickle
+
+from ctypes import *
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+CODEC_MAGIC = 0xc5	#: first byte of a codec header, never the start of a protocol 0 pickle.
+
+Header = struct.Struct ('<BBHI')	#: magic, codec id, flags, data length
+HeaderLen = Header.size
+
+FLAG_BATCH = 0x0001	#: the data is a batch of entries, see PyQNX6.Batch
+
+
+class Codec (object):
+    """
+    Codec base class. A codec defines Encode and Decode, the base cant be instantiated.
+    Id:   The codec number carried in the header (0..255).
+    Name: The name the codec is registered by.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    Id   = None
+    Name = None
+    Header = True	#: prefix the data with a header
+
+    @abc.abstractmethod
+    def Encode (self, Data):
+	"""
+	@return the str to be sent for Data.
+	"""
+
+    @abc.abstractmethod
+    def Decode (self, Data):
+	"""
+	@return the python data for the received str.
+	"""
+
+    def DecodeFrom (self, Buffer, Offset, Length):
+	"""
+	Decode Length bytes at Offset in a (ctypes) buffer.
+	Codecs able to decode in place override this, the default copies the bytes out.
+	"""
+	return self.Decode (string_at (addressof (Buffer) + Offset, Length))
+
+    def __repr__ (self):
+	return "<codec %s %s>" % (self.Id, self.Name)
+
+
+class Pickle0Codec (Codec):
+    """
+    The original PyQNX6 encoding. cPickle protocol 0 without a header.
+    Decoding stops at the first NUL, as before.
+    """
+    Id   = 0
+    Name = "pickle0"
+    Header = False
+
+    def Encode (self, Data):
+	return cPickle.dumps (Data)
+
+    def Decode (self, Data):
+	return cPickle.loads (Data)
+
+
+class PickleCodec (Codec):
+    """
+    cPickle, using the highest (binary) protocol.
+    """
+    Id   = 1
+    Name = "pickle"
+
+    def __init__ (self, Protocol = cPickle.HIGHEST_PROTOCOL):
+	self.Protocol = Protocol
+
+    def Encode (self, Data):
+	return cPickle.dumps (Data, self.Protocol)
+
+    def Decode (self, Data):
+	return cPickle.loads (Data)
+
+
+class MarshalCodec (Codec):
+    """
+    marshal. Fast but limited to the builtin types.
+    """
+    Id   = 2
+    Name = "marshal"
+
+    def Encode (self, Data):
+	return marshal.dumps (Data)
+
+    def Decode (self, Data):
+	return marshal.loads (Data)
+
+
+class BytesCodec (Codec):
+    """
+    A list of strings, each prefixed with its length.
+    Encode takes a str or a sequence of str, Decode always returns a list.
+    """
+    Id   = 3
+    Name = "bytes"
+    _Len = struct.Struct ('<I')
+
+    def Encode (self, Data):
+	if isinstance (Data, str): Data = [Data]
+	Parts = []
+	for Part in Data:
+	    Parts.append (self._Len.pack (len (Part)))
+	    Parts.append (Part)
+	return "".join (Parts)
+
+    def Decode (self, Data):
+	return self.DecodeFrom (Data, 0, len (Data))
+
+    def DecodeFrom (self, Buffer, Offset, Length):
+	Result = []
+	End = Offset + Length
+	while Offset + 4 <= End:
+	    (Len,) = self._Len.unpack_from (Buffer, Offset)
+	    Offset += 4
+	    Result.append (Buffer [Offset:Offset + Len])
+	    Offset += Len
+	return Result
+
+
+class StructCodec (Codec):
+    """
+    Packs tuples with a struct format. Matches C structures sent by C peers.
+    e.g. StructCodec ('<iid', 16, 'position') for (int x, int y, double t)
+    User codecs should use ids from 16 upwards.
+    """
+    def __init__ (self, Format, Id, Name = None):
+	self.Struct = struct.Struct (Format)
+	self.Id     = Id
+	self.Name   = Name or Format
+
+    def Encode (self, Data):
+	return self.Struct.pack (*Data)
+
+    def Decode (self, Data):
+	return self.Struct.unpack (Data)
+
+    def DecodeFrom (self, Buffer, Offset, Length):
+	return self.Struct.unpack_from (Buffer, Offset)
+
+
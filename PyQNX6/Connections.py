@@ -0,0 +1,288 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Connection pool. Each name_open is a pathname resolution through procnto and
+a connect message to the server, so a QNXClient opened per request pays that
+every time. A ConnectionPool keeps the connections, by (Name, Global, Node),
+and hands them out :
+
+    - Get (Name)       the calling thread's own connection, opened on first use.
+    - Checkout (Name)  an idle connection (or a new one) for a with block.
+    - Send (Name, TxData, ...) a MsgSend on the thread's connection.
+
+The connections of threads that have finished go back to the idle ones, so a
+thread per request reuses them rather than opening its own.
+
+A send failing with ESRCH (the server has gone) or EBADF (a stale coid) closes
+the connection, the next use opens it again (the server may have restarted).
+Send only sends once more if asked (Resend), the request may have been run.
+A connection unused for CheckAfter seconds is checked (ConnectServerInfo) before
+it is handed out, and a checked in one before it is kept.
+
+e.g.
+    Pool = SharedPool ()
+    (Result, Reply) = Pool.Send ("gps", "where")
+
+    with Pool.Checkout ("logger") as Client:
+	Client.MsgSend (("log", Text))
+'''
+import sys, os, time, errno, threading
+
+from ctypes import *
+
+from PyQNX6 import Libc, msg_info_t
+from PyQNX6.Client import QNXClient
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+# the send errors meaning the connection is no use, reopen it.
+ServerGone = (errno.ESRCH, errno.EBADF)
+
+
+class _Checkout (object):
+    """
+    A checked out connection, for a with block. Checked in when the block ends.
+    """
+    def __init__ (self, Pool, Conn):
+	self.Pool = Pool
+	self.Conn = Conn
+
+    def __enter__ (self):
+	return self.Conn
+
+    def __exit__ (self, Type, Value, Traceback):
+	Broken = isinstance (Value, EnvironmentError) and Value.errno in ServerGone
+	self.Pool.Checkin (self.Conn, Broken)	# a MsgSend failing doesnt raise, Checkin checks it
+
+
+class ConnectionPool (object):
+    """
+    Keeps connections to servers by (Name, Global, Node). Thread safe.
+    @param MaxIdle: The idle connections kept for each name, others are closed.
+    @param CheckAfter: Seconds unused after which a connection is checked before it is used.
+    @param WaitFor: Wait for the name when opening, True for ever or a timeout in seconds.
+    @param Open: Opens a connection, as Open (Name, Global, Node), by default a QNXClient.
+    name_open resolves local and global names, for another Node an Open is needed.
+    The remaining arguments (RawMode, ViewMode, CodecName, Types) are given to each QNXClient.
+    """
+    _ConnectServerInfo = Libc ("ConnectServerInfo")
+
+    def __init__ (self, MaxIdle = 8, CheckAfter = 10.0, WaitFor = False, Open = None, **Args):
+	self.MaxIdle    = MaxIdle
+	self.CheckAfter = CheckAfter
+	self.WaitFor    = WaitFor
+	self.Args       = Args
+	self.Open       = Open or self._Open
+	self.Opened     = 0	# name_open calls
+	self.Reused     = 0	# connections handed out again
+	self.Reconnects = 0	# dropped after ESRCH / EBADF, to be reopened
+	self.Closed     = 0	# closed, broken, failed a check or over MaxIdle
+	self._Lock      = threading.Lock ()
+	self._Idle      = {}	# key -> [connection], most recently used last
+	self._Threads   = {}	# thread -> {key: connection}
+	self._Pid       = os.getpid ()
+
+    def _Open (self, Name, Global, Node):
+	if Node: raise ValueError ("%s on node %s: name_open is local or global, give the pool an Open" % (Name, Node))
+	Conn = QNXClient (Name, Global = Global, WaitFor = self.WaitFor, **self.Args)
+	if not Conn.ConnectionOk ():
+	    Error = get_errno () or errno.ENOENT
+	    raise OSError (Error, "name_open %s: %s" % (Name, os.strerror (Error)))
+	return Conn
+
+    def _New (self, Key):
+	Conn = self.Open (*Key)
+	Conn._PoolKey = Key
+	Conn._PoolUsed = time.time ()
+	with self._Lock: self.Opened += 1
+	return Conn
+
+    def _Close (self, Conn):
+	with self._Lock: self.Closed += 1
+	try:
+	    if Conn.ConnectionOk (): Conn.name_close ()
+	except Exception: pass
+
+    def _Forked (self):
+	"""
+	Connections arent inherited by a forked child, forget the parent's.
+	"""
+	if os.getpid () != self._Pid:
+	    with self._Lock:
+		(self._Idle, self._Threads, self._Pid) = ({}, {}, os.getpid ())
+
+    def _Reap (self):
+	"""
+	Move the connections of finished threads to the idle ones. Called holding the lock.
+	@return those over MaxIdle, to be closed.
+	"""
+	Over = []
+	for Thread in [Thread for Thread in self._Threads if not Thread.is_alive ()]:
+	    for Conn in self._Threads.pop (Thread).values ():
+		Idle = self._Idle.setdefault (Conn._PoolKey, [])
+		if len (Idle) < self.MaxIdle: Idle.insert (0, Conn)
+		else: Over.append (Conn)
+	return Over
+
+    def _Drop (self, Key):
+	"""
+	Close the idle connections for Key, the server they were to has gone.
+	"""
+	with self._Lock: Idle = self._Idle.pop (Key, [])
+	for Conn in Idle: self._Close (Conn)
+
+    def Check (self, Conn):
+	"""
+	Health check, without a message to the server.
+	@return True if the connection is still good.
+	"""
+	if not Conn.ConnectionOk (): return False
+	Info = msg_info_t ()
+	return self._ConnectServerInfo (0, Conn.coid, byref (Info)) == Conn.coid
+
+    def _Usable (self, Conn):
+	if time.time () - Conn._PoolUsed < self.CheckAfter: return Conn.ConnectionOk ()
+	return self.Check (Conn)
+
+    def _Take (self, Key):
+	"""
+	@return a good idle connection for Key, or None.
+	"""
+	while True:
+	    with self._Lock:
+		Over = self._Reap ()
+		Idle = self._Idle.get (Key)
+		Conn = Idle.pop () if Idle else None
+	    for Extra in Over: self._Close (Extra)
+	    if Conn == None: return None
+	    if self._Usable (Conn):
+		with self._Lock: self.Reused += 1
+		return Conn
+	    self._Close (Conn)
+
+    def Get (self, Name, Global = False, Node = 0):
+	"""
+	@return the calling thread's connection to Name, opened (or taken from the idle ones)
+	on first use. Only this thread should use it.
+	@raise OSError if it cant be opened.
+	"""
+	self._Forked ()
+	Key = (Name, Global, Node)
+	Thread = threading.current_thread ()
+	Conn = self._Threads.get (Thread, {}).get (Key)
+	if Conn != None:
+	    if self._Usable (Conn): return Conn
+	    self.Discard (Conn)
+	Conn = self._Take (Key) or self._New (Key)
+	with self._Lock:
+	    self._Threads.setdefault (Thread, {}) [Key] = Conn
+	return Conn
+
+    def Checkout (self, Name, Global = False, Node = 0):
+	"""
+	Take a connection to Name for the calling thread, until it is checked in.
+	@return a context manager giving the connection, it is checked in when the with block ends
+	(closed if the block raised ESRCH or EBADF, or the server has gone). Or use its Conn and call Checkin.
+	@raise OSError if it cant be opened.
+	"""
+	self._Forked ()
+	Key = (Name, Global, Node)
+	return _Checkout (self, self._Take (Key) or self._New (Key))
+
+    def Checkin (self, Conn, Broken = False):
+	"""
+	Return a checked out connection. A Broken one, one whose server has gone (see Check)
+	or more than MaxIdle is closed.
+	"""
+	Conn._PoolUsed = time.time ()
+	if not Broken and os.getpid () == self._Pid and self.Check (Conn):
+	    with self._Lock:
+		Idle = self._Idle.setdefault (Conn._PoolKey, [])
+		if len (Idle) < self.MaxIdle:
+		    Idle.append (Conn)
+		    return
+	self._Close (Conn)
+
+    def Discard (self, Conn):
+	"""
+	Close a connection that is no use (e.g. a send failed with ESRCH), the thread's
+	next Get opens another.
+	"""
+	with self._Lock:
+	    Mine = self._Threads.get (threading.current_thread (), {})
+	    if Mine.get (Conn._PoolKey) is Conn: del Mine [Conn._PoolKey]
+	self._Close (Conn)
+
+    def Send (self, Name, TxData, RxLen = 1024, Global = False, Node = 0, Resend = False, **Args):
+	"""
+	MsgSend TxData to Name on the thread's connection (see Message.MsgSend for the arguments).
+	If the server has gone (ESRCH, EBADF) the connection is closed, the next send opens another.
+	@param Resend: Open another connection and send once more at once. Only for requests
+	that are safe to repeat, the server may have run it before it went.
+	@return a tuple with the (MsgSend result and the reply data).
+	@raise OSError if the name cant be opened.
+	"""
+	Args ['Copy'] = True
+	Conn = self.Get (Name, Global, Node)
+	(Result, Len) = Conn.MsgSend (TxData, RxLen, **Args)
+	if Result == -1 and get_errno () in ServerGone:
+	    Error = get_errno ()
+	    self.Discard (Conn)
+	    self._Drop (Conn._PoolKey)
+	    with self._Lock: self.Reconnects += 1
+	    set_errno (Error)
+	    if Resend:
+		Conn = self.Get (Name, Global, Node)
+		(Result, Len) = Conn.MsgSend (TxData, RxLen, **Args)
+	Conn._PoolUsed = time.time ()
+	return (Result, Conn.RxData)
+
+    send = Send
+
+    def Close (self):
+	"""
+	Close every connection, idle or held by a thread.
+	"""
+	with self._Lock:
+	    Conns = [Conn for Idle in self._Idle.values () for Conn in Idle]
+	    Conns += [Conn for Mine in self._Threads.values () for Conn in Mine.values ()]
+	    (self._Idle, self._Threads) = ({}, {})
+	for Conn in Conns: self._Close (Conn)
+
+    def __enter__ (self):
+	return self
+
+    def __exit__ (self, *Exception):
+	self.Close ()
+
+    def Stats (self):
+	"""
+	@return a dict of the counts, and the connections idle and held by threads.
+	"""
+	with self._Lock:
+	    return {'opened': self.Opened, 'reused': self.Reused, 'reconnects': self.Reconnects,
+		    'closed': self.Closed,
+		    'idle': sum ([len (Idle) for Idle in self._Idle.values ()]),
+		    'threads': sum ([len (Mine) for Mine in self._Threads.values ()])}
+
+    def __repr__ (self):
+	return "<ConnectionPool %s>" % " ".join (["%s %s" % Item for Item in sorted (self.Stats ().items ())])
+
+
+_Shared = None
+_SharedLock = threading.Lock ()
+
+def SharedPool ():
+    """
+    @return the process wide pool (default settings), created on first use.
+    """
+    global _Shared
+    with _SharedLock:
+	if _Shared == None:
+	    _Shared = ConnectionPool ()
+    return _Shared
@@ -0,0 +1,328 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+A reactor, in the style of the QNX dispatch_* layer. One channel and one
+thread, everything arrives on the channel and is routed to a callback :
+
+    - messages for several names (Attach), each name with its own Function.
+    - pulses, by code (AddPulseHandler).
+    - timers (Timer, After), the timer and its pulse are set up here.
+    - interrupts (Interrupt), delivered as pulses, unmasked after the callback.
+
+so one thread can serve a whole device driver, rather than a thread per source.
+
+e.g.
+    R = Reactor ()
+    R.Attach ("uart", Serve)		# Serve (Reactor, Rcvid, Data) -> (Status, Data)
+    R.Attach ("uart.ctl", Control)
+    R.Timer (0.1, Poll)			# Poll () every 100ms
+    R.Interrupt (4, Receive, Port)	# Receive (Port) for each interrupt 4
+    R.Run ()				# until Stop ()
+
+The names are attached to the reactor's channel through a dispatch
+(dispatch_create_channel). A client's name_open sends an _IO_CONNECT whose
+handle is the attach's mntid, the reactor replies to it and routes the messages
+on that connection to the name's Function. As for QNXServer a Function may
+return DEFER (see Message.Defer) and batches are called an entry at a time.
+'''
+import sys, os, errno, struct, traceback
+
+from ctypes import *
+
+from PyQNX6 import (Libc, name_attach_t, sigevent, SIGEV_PULSE, PULSE_CODE_DISCONNECT,
+		    PULSE_CODE_MINAVAIL, PULSE_CODE_MAXAVAIL)
+from PyQNX6.Message import Message, DEFER
+from PyQNX6.Resmgr import io_open_t
+from PyQNX6.Time import Timer
+from PyQNX6.Interrupt import Interrupt
+from PyQNX6 import Batch
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+_IO_CONNECT = 0x100
+_Type = struct.Struct ('<H')
+_Handle = struct.Struct ('<I')
+
+# the Function asking the reactor to stop, as it does a QNXServer.
+_StopExceptions = (StopIteration, KeyboardInterrupt, EOFError)
+
+
+class _Name (object):
+    """
+    An attached name.
+    """
+    __slots__ = ('Name', 'Global', 'Function', 'Attach')
+
+    def __init__ (self, Name, Global, Function, Attach):
+	self.Name     = Name
+	self.Global   = Global
+	self.Function = Function
+	self.Attach   = Attach	# the name_attach_t
+
+    def __repr__ (self):
+	return "<Name %s%s>" % (self.Name, " global" if self.Global else "")
+
+
+class Source (object):
+    """
+    A timer or interrupt wired to the reactor, its pulses call Function (*Args).
+    Cancel () stops it.
+    """
+    def __init__ (self, Reactor, Code, Function, Args):
+	self.Reactor  = Reactor
+	self.Code     = Code
+	self.Function = Function
+	self.Args     = Args
+	self.Count    = 0		# pulses handled
+	self.Timer    = None
+	self.Once     = False
+	self.Interrupt = None
+
+    def _Pulse (self, Reactor, Code, Value, Scoid):
+	self.Count += 1
+	try:
+	    self.Function (*self.Args)
+	except Exception:
+	    Reactor.Errors += 1
+	    traceback.print_exc ()
+	if self.Interrupt != None:
+	    self.Interrupt.InterruptUnmask ()
+	elif self.Once:
+	    self.Cancel ()
+
+    def Cancel (self):
+	"""
+	Delete the timer, or detach the interrupt. No more calls are made.
+	"""
+	if self.Timer != None:
+	    self.Timer.timer_delete ()
+	    self.Timer = None
+	if self.Interrupt != None:
+	    self.Interrupt.InterruptDetach ()
+	    self.Interrupt = None
+	if self.Reactor != None:
+	    self.Reactor.RemovePulseHandler (self.Code)
+	    self.Reactor = None
+
+    def __repr__ (self):
+	Kind = "interrupt %s" % self.Interrupt.Irq if self.Interrupt else "timer"
+	return "<Source %s code %d count %d>" % (Kind, self.Code, self.Count)
+
+
+class Reactor (Message):
+    """
+    One channel, one thread, many sources. See the module description.
+    @param Priority: The priority of the timer and interrupt pulses.
+    @param RxLen: The receive buffer.
+    @param Default: The Function for messages on a connection not made by name_open
+    (ConnectAttach to the chid), by default they fail with ENOSYS.
+    The remaining parameters are as QNXServer.
+    """
+    _PULSE_CODE_STOP = 0x7f
+
+    _dispatch_create_channel = Libc ("dispatch_create_channel")
+    _dispatch_destroy        = Libc ("dispatch_destroy")
+
+    def __init__ (self, RawMode=False, ViewMode=False, CodecName="pickle0", Types=None,
+			Priority=10, RxLen=1024, Default=None):
+	Message.__init__ (self, Attach=False, RawMode=RawMode, ViewMode=ViewMode, CodecName=CodecName,
+			Types=Types)
+	self.Priority = Priority
+	self.RxLen    = RxLen
+	self.Default  = Default
+	self.Names    = {}	# name -> _Name
+	self.Running  = False
+	self.Errors   = 0	# Function and callback exceptions
+	self._Mounts  = {}	# mntid -> _Name
+	self._Scoids  = {}	# scoid -> _Name, the connections made by name_open
+	if self.ChannelCreate (self._NTO_CHF_UNBLOCK | self._NTO_CHF_DISCONNECT) == None:
+	    Error = get_errno ()
+	    raise OSError (Error, "ChannelCreate: %s" % os.strerror (Error))
+	self.Dispatch = self._dispatch_create_channel (self.chid, 0)
+	if not self.Dispatch:
+	    Error = get_errno ()
+	    raise OSError (Error, "dispatch_create_channel: %s" % os.strerror (Error))
+	self.Connection = Message ()	# for the pulses
+	self.Connection.ConnectAttach (Chid = self.chid)
+	self.AddPulseHandler (PULSE_CODE_DISCONNECT, self._Disconnect)
+	# the stop pulse has no handler, so MsgReceive returns it and Run sees Running
+
+    #
+    # sources
+    #
+    def Attach (self, Name, Function, Global = False):
+	"""
+	Attach Name to the reactor's channel. Its messages call Function (Reactor, Rcvid, Data),
+	which returns (Status, Data) for the reply, or DEFER.
+	@raise OSError if the name cant be attached.
+	"""
+	Result = self._name_attach (self.Dispatch, Name, 2 if Global else 0)
+	if not Result:
+	    Error = get_errno ()
+	    raise OSError (Error, "name_attach %s: %s" % (Name, os.strerror (Error)))
+	Attach = cast (Result, POINTER (name_attach_t)).contents
+	Entry = self.Names [Name] = _Name (Name, Global, Function, Attach)
+	self._Mounts [Attach.mntid] = Entry
+	return Entry
+
+    def Detach (self, Name):
+	"""
+	Detach Name. Its connections get ENOSYS (or go to the Default).
+	"""
+	Entry = self.Names.pop (Name)
+	del self._Mounts [Entry.Attach.mntid]
+	for Scoid in [Scoid for Scoid, Named in self._Scoids.items () if Named is Entry]:
+	    del self._Scoids [Scoid]
+	self._name_detach (byref (Entry.Attach), 0)
+
+    def _Code (self):
+	"""
+	@return a free user pulse code.
+	"""
+	for Code in range (PULSE_CODE_MINAVAIL + 1, PULSE_CODE_MAXAVAIL):
+	    if Code != self._PULSE_CODE_STOP and self.PulseTable [Code] == None: return Code
+	raise ValueError ("no free pulse codes")
+
+    def _Source (self, Function, Args):
+	Entry = Source (self, self._Code (), Function, Args)
+	self.AddPulseHandler (Entry.Code, Entry._Pulse)
+	return sigevent (SIGEV_PULSE, priority = self.Priority, code = Entry.Code,
+			 coid = self.Connection.coid), Entry
+
+    def Timer (self, Interval, Function, *Args):
+	"""
+	Call Function (*Args) every Interval seconds.
+	@return the Source, Cancel () stops it.
+	"""
+	return self._Timer (Interval, Interval, Function, Args)
+
+    def After (self, Delay, Function, *Args):
+	"""
+	Call Function (*Args) once, after Delay seconds.
+	@return the Source, Cancel () stops it.
+	"""
+	return self._Timer (Delay, 0, Function, Args)
+
+    def _Timer (self, Delay, Interval, Function, Args):
+	(Event, Entry) = self._Source (Function, Args)
+	Entry.Once  = not Interval
+	Entry.Timer = Timer (Event)
+	try:
+	    if Entry.Timer.timer_create () == -1 or Entry.Timer.timer_settime (False, (Delay, Interval)) == -1:
+		Error = get_errno ()
+		raise OSError (Error, "timer: %s" % os.strerror (Error))
+	except Exception:
+	    Entry.Cancel ()
+	    raise
+	return Entry
+
+    def Interrupt (self, Irq, Function, *Args):
+	"""
+	Call Function (*Args) for each interrupt Irq. It is masked until the Function returns.
+	@return the Source, Cancel () detaches it.
+	"""
+	(Event, Entry) = self._Source (Function, Args)
+	Entry.Interrupt = Interrupt (Irq, Event)
+	if Entry.Interrupt.InterruptAttachEvent () == -1:
+	    Error = get_errno ()
+	    Entry.Interrupt = None
+	    Entry.Cancel ()
+	    raise OSError (Error, "InterruptAttachEvent %d: %s" % (Irq, os.strerror (Error)))
+	return Entry
+
+    #
+    # the loop
+    #
+    def _Connect (self, Rcvid, Data, Len):
+	"""
+	A name_open, note which name the connection is to.
+	"""
+	Entry = None
+	if Len >= io_open_t.handle.offset + _Handle.size:
+	    Entry = self._Mounts.get (_Handle.unpack_from (Data, io_open_t.handle.offset) [0])
+	if Entry == None:
+	    self.MsgError (errno.ENOENT, Rcvid)
+	    return
+	self._Scoids [self.info.scoid] = Entry
+	self.MsgReply (0, Rcvid = Rcvid, RawMode = True)
+
+    def _Disconnect (self, Server, Code, Value, Scoid):
+	self._Scoids.pop (Scoid, None)
+	self._ConnectDetach (Scoid)	# the server connection is freed when the server detaches it
+
+    def Once (self):
+	"""
+	Receive and handle one message or pulse.
+	@return the rcvid (0 for a pulse, -1 on an error).
+	"""
+	(Rcvid, Len) = self.MsgReceive (self.RxLen, RawMode = True, View = True)
+	if Rcvid <= 0: return Rcvid		# a pulse without a handler, or an error
+
+	Data = self.RxData
+	if isinstance (Data, memoryview):
+	    if Len >= _Type.size and _Type.unpack_from (Data) [0] == _IO_CONNECT:
+		self._Connect (Rcvid, Data, Len)
+		return Rcvid
+	    if not self.RawMode: Data = self.RxData = self._Decode (Len)
+	    elif not self.ViewMode: Data = self.RxData = Data.tobytes ()
+
+	Entry = self._Scoids.get (self.info.scoid)
+	Function = Entry.Function if Entry != None else self.Default
+	if Function == None:
+	    self.MsgError (errno.ENOSYS, Rcvid)
+	    return Rcvid
+	try:
+	    if isinstance (Data, Batch.Request):	# a Function call per entry
+		Reply = Batch.Call (Function, self, self, Rcvid, Data)
+		if Reply.Stop: self.Running = False
+		Result = (0, Reply)
+	    else:
+		Result = Function (self, Rcvid, Data)
+	except _StopExceptions:
+	    self.Running = False
+	    Result = (-1, None)
+	except Exception:
+	    self.Errors += 1
+	    traceback.print_exc ()
+	    self.MsgError (errno.EIO, Rcvid)
+	    return Rcvid
+	if Result is not DEFER:	# deferred, replied later (see Message.Defer)
+	    (Status, Data) = Result
+	    self.MsgReply (Status, Data, Rcvid = Rcvid)
+	return Rcvid
+
+    def Run (self):
+	"""
+	Handle messages and pulses until Stop () (or a Function raises StopIteration).
+	"""
+	self.Running = True
+	while self.Running:
+	    if self.Once () == -1 and get_errno () not in (errno.EINTR, errno.ETIMEDOUT):
+		Error = get_errno ()
+		raise OSError (Error, "MsgReceive: %s" % os.strerror (Error))
+
+    def Stop (self):
+	"""
+	Stop Run (), from a callback or another thread.
+	"""
+	self.Running = False
+	self.Connection.MsgSendPulse (Priority = self.Priority, Code = self._PULSE_CODE_STOP)
+
+    def Close (self):
+	"""
+	Detach the names, cancel the timers and interrupts, and destroy the channel.
+	"""
+	for Name in self.Names.keys (): self.Detach (Name)
+	for Handler in self.PulseTable:
+	    Entry = getattr (Handler, 'im_self', None)
+	    if isinstance (Entry, Source): Entry.Cancel ()
+	self.Connection.ConnectDetach ()
+	if self.Dispatch:
+	    self._dispatch_destroy (self.Dispatch)
+	    self.Dispatch = None
+	self.ChannelDestroy ()
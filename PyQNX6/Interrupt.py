@@ -1,7 +1,8 @@
 #!/usr/bin/python
 
 #import pdb
-import sys, os
+import sys, os, time, errno, fcntl, threading, traceback
+from array import array
 
 from ctypes import *
 
@@ -10,6 +11,168 @@ from PyQNX6 import *
 	
 #####################################################
 
+_CyclesPerSec = []
+
+def CyclesPerSec ():
+    """
+    Utility: The ClockCycles () rate. Measured (against time.time) the first time on QNX, 
+    the Linux stand-in counts nanoseconds.
+    """
+    if not _CyclesPerSec:
+	Rate = getattr (QNX.lib, "CYCLES_PER_SEC", None)
+	if Rate == None:
+	    ClockCycles = Bind ("ClockCycles")
+	    (Start, Cycles) = (time.time (), ClockCycles ())
+	    time.sleep (0.05)
+	    Rate = (ClockCycles () - Cycles) / (time.time () - Start)
+	_CyclesPerSec.append (float (Rate))
+    return _CyclesPerSec [0]
+
+
+class Histogram (object):
+    """
+    A log bucketed histogram of times, in clock cycles. 
+    Four buckets per power of two (so within 25%), in a fixed array, Add is a few operations. 
+    Not locked, each histogram should be added to by one thread.
+    """
+    Buckets = 4 * 65
+
+    def __init__ (self, Name = None):
+	self.Name   = Name
+	self.Counts = array ('L', [0]) * self.Buckets
+	self.Count  = 0
+	self.Total  = 0
+	self.Max    = 0
+
+    def Add (self, Cycles):
+	Cycles = int (Cycles)
+	if Cycles < 8:
+	    if Cycles < 0: Cycles = 0
+	    self.Counts [Cycles] += 1
+	else:
+	    Bits = Cycles.bit_length ()
+	    self.Counts [(Bits << 2) | ((Cycles >> (Bits - 3)) & 3)] += 1
+	self.Count += 1
+	self.Total += Cycles
+	if Cycles > self.Max: self.Max = Cycles
+
+    def _Upper (self, Index):
+	"""
+	The largest value in bucket Index.
+	"""
+	if Index < 8: return Index
+	Shift = (Index >> 2) - 3
+	return ((5 + (Index & 3)) << Shift) - 1
+
+    def Percentile (self, Percent):
+	"""
+	@return the value (cycles) below which Percent of the samples are. Accurate to the bucket.
+	"""
+	if not self.Count: return 0
+	Target = self.Count * Percent / 100.0
+	Sum = 0
+	for Index in xrange (self.Buckets):
+	    Sum += self.Counts [Index]
+	    if Sum >= Target: return min (self._Upper (Index), self.Max)
+	return self.Max
+
+    def Report (self, Scale = None):
+	"""
+	@param Scale: Seconds per cycle, by default from CyclesPerSec ().
+	@return a dict of count, mean, p50, p99 and max, times in seconds.
+	"""
+	if Scale == None: Scale = 1.0 / CyclesPerSec ()
+	return {'count': self.Count,
+		'mean':  self.Count and self.Total * Scale / self.Count,
+		'p50':   self.Percentile (50) * Scale,
+		'p99':   self.Percentile (99) * Scale,
+		'max':   self.Max * Scale}
+
+    def Reset (self):
+	self.__init__ (self.Name)
+
+    def __repr__ (self):
+	Report = self.Report ()
+	return "<%s n=%d p50=%.1fuS p99=%.1fuS max=%.1fuS>" % (self.Name, Report ['count'], 
+		Report ['p50'] * 1e6, Report ['p99'] * 1e6, Report ['max'] * 1e6)
+
+
+class InterruptStats (object):
+    """
+    The interrupt histograms. Sampled at wake (InterruptWait returns), unmask and handler completion.
+	- Masked:   wake to unmask, the time the interrupt stays masked.
+	- Handler:  the handler run time (one call, a batch when threaded).
+	- Latency:  wake to handler completion.
+	- Interval: wake to wake, the interrupt period and its jitter.
+    """
+    Names = ('Masked', 'Handler', 'Latency', 'Interval')
+
+    def __init__ (self):
+	for Name in self.Names: setattr (self, Name, Histogram (Name))
+	self.Last = None	# the last wake
+
+    def Report (self):
+	"""
+	@return a dict of name -> Histogram.Report ()
+	"""
+	return dict ([(Name, getattr (self, Name).Report ()) for Name in self.Names])
+
+    def Reset (self):
+	self.__init__ ()
+
+
+class InterruptRing (object):
+    """
+    A preallocated ring of interrupt records, a sequence number and a time stamp each.
+    The stamps are ClockCycles () values.
+    Written only by the interrupt (wait) thread, which never blocks or takes a lock:
+    when the ring is full the record is dropped and Overflows counted. 
+    Read by the handler threads, in batches.
+    The sequence numbers count every interrupt, a gap shows the records dropped.
+    """
+    def __init__ (self, Size = 1024):
+	Bits = 1
+	while (1 << Bits) < Size: Bits += 1
+	self.Size      = 1 << Bits
+	self.Mask      = self.Size - 1
+	self.Sequence  = array ('L', [0]) * self.Size
+	self.Stamp     = array ('d', [0.0]) * self.Size
+	self.Head      = 0		# records written
+	self.Tail      = 0		# records read
+	self.Overflows = 0
+	self._Lock     = threading.Lock ()	# between readers only
+
+    def __len__ (self):
+	return self.Head - self.Tail
+
+    def Push (self, Sequence, Stamp):
+	"""
+	Add a record. Only the one writer may call this.
+	@return False if the ring is full and the record was dropped.
+	"""
+	Head = self.Head
+	if Head - self.Tail >= self.Size:
+	    self.Overflows += 1
+	    return False
+	self.Sequence [Head & self.Mask] = Sequence
+	self.Stamp [Head & self.Mask]    = Stamp
+	self.Head = Head + 1
+	return True
+
+    def Drain (self, Max = 64):
+	"""
+	Remove up to Max records.
+	@return a list of (Sequence, Stamp) tuples, oldest first.
+	"""
+	with self._Lock:
+	    Tail = self.Tail
+	    Count = min (self.Head - Tail, Max)
+	    Mask, Sequence, Stamp = self.Mask, self.Sequence, self.Stamp
+	    Batch = [(Sequence [i & Mask], Stamp [i & Mask]) for i in xrange (Tail, Tail + Count)]
+	    self.Tail = Tail + Count
+	return Batch
+
+
 
 
 
@@ -25,6 +188,8 @@ class Interrupt (QNX):
 	    - InterruptMask  ()
 	    - InterruptDetach ()
 	    - InterruptFunction (Fn)
+	    - InterruptThreaded (Fn)
+	    - InterruptPolled (Poll)
    
     For more information on the Events See PyQNX6.core 
     """
@@ -33,6 +198,14 @@ class Interrupt (QNX):
     _NTO_INTR_FLAGS_PROCESS = 4
     _NTO_INTR_FLAGS_END     = 1
 
+    _InterruptAttachEvent = Libc ("InterruptAttachEvent")
+    _InterruptWait        = Libc ("InterruptWait")
+    _InterruptUnmask      = Libc ("InterruptUnmask")
+    _InterruptMask        = Libc ("InterruptMask")
+    _InterruptDetach      = Libc ("InterruptDetach")
+    _ThreadCtl            = Libc ("ThreadCtl")
+    _ClockCycles          = Libc ("ClockCycles")
+
     def __init__ (self, Irq = None, Event = None):
 	"""
 	Instantiates the Interrupt class. 
@@ -50,19 +223,31 @@ class Interrupt (QNX):
 	"""
 	if QNX.lib == None:
 	    QNX.__init__(self)    # init libc
-	self._InterruptAttachEvent = self.lib.InterruptAttachEvent
-	self._InterruptAttachEvent.argtypes = [c_int, POINTER (sigevent), c_int]
-	self._InterruptWait = self.lib.InterruptWait
-	self._InterruptWait.argtypes = [c_int, c_char_p]
-	self._InterruptUnmask = self.lib.InterruptUnmask
-	self._InterruptMask = self.lib.InterruptMask
-	self._InterruptDetach = self.lib.InterruptDetach
-
-	self.lib.ThreadCtl (1, 0)
+
+	self._ThreadCtl (1, 0)
 	self.Id    = -1
 	self.Irq   = Irq
 	self.Event = Event
 	self.Flags = self._NTO_INTR_FLAGS_TRK_MSK
+	self.Ring      = None
+	self.Count     = 0		# interrupts (the last sequence number)
+	self.Errors    = 0		# handler exceptions
+	self.Stopping  = False
+	self.Threads   = []
+	self.Stats     = None		# InterruptStats, see Instrument
+	self.Wakes = self.Polls = self.Work = self.Exhausted = 0	# InterruptPolled counts
+
+    def Instrument (self, Enable = True):
+	"""
+	Collect the latency histograms (self.Stats) in InterruptFunction and InterruptThreaded.
+	@return the InterruptStats, Stats.Report () has the p50, p99 and max times.
+	"""
+	if Enable:
+	    self.Stats = InterruptStats ()
+	    CyclesPerSec ()
+	else:
+	    self.Stats = None
+	return self.Stats
 
 	
     def InterruptAttachEvent (self, Irq = None, Event = None, \
@@ -158,6 +343,7 @@ class Interrupt (QNX):
 	self.Event = sigevent (SIGEV_INTR)
 	self.Id = self.InterruptAttachEvent (Irq, self.Event)
 
+	Clock = self._ClockCycles
 	Continue = True
 	while Continue:
 	    try: 
@@ -166,18 +352,208 @@ class Interrupt (QNX):
 		Continue = False
 		continue
 
+	    Stats = self.Stats
+	    if Stats: Wake = Clock ()
 	    self.InterruptUnmask ()      # clean up the mask
 	    try:
+		if Stats: Unmask = Clock ()
 		Result = Fn ()		# call the fucntion
+		if Stats:
+		    Done = Clock ()
+		    Stats.Masked.Add (Unmask - Wake)
+		    Stats.Handler.Add (Done - Unmask)
+		    Stats.Latency.Add (Done - Wake)
+		    if Stats.Last != None: Stats.Interval.Add (Wake - Stats.Last)
+		    Stats.Last = Wake
 	 	if Result == True:	# if we get a true then stop 
 	    	    Continue = False
 		    _DoCleanup ()
-	    except: 
+	    except Exception: 
 		Continue = False
 		_DoCleanup ()
+		traceback.print_exc ()
 		print "PyQNX6.Interrupt: Error in called InterruptFunction. Exiting"
 		return -1
 	return 0
+
+
+    def InterruptThreaded (self, Fn, Irq=None, Handlers=1, Size=1024, Batch=64):
+	"""
+	InterruptThreaded. Handle the interrupt in threads of its own, away from the wait.
+
+	@param Fn: Called, in a handler thread, with a list of (Sequence, Stamp) records, 
+	    the Stamp is the ClockCycles () at wake.
+	    Returning True stops the interrupt handling.
+	@param Irq: The interrupt to attach to. If not supplied - use the instance Irq.
+	@param Handlers: The number of handler threads.
+	@param Size: The ring size, rounded up to a power of 2.
+	@param Batch: The most records passed to one Fn call.
+	@return the threads, the wait thread first. 
+
+	The wait thread only time stamps each interrupt, unmasks it and records it in 
+	the ring (self.Ring), so a slow Fn never delays the interrupt. If Fn falls behind
+	the ring fills, records are dropped and counted (self.Ring.Overflows), the gaps 
+	in the sequence numbers show which. Exceptions in Fn are printed and counted
+	(self.Errors), handling continues. 
+	Stop () ends it.
+	"""
+	if Irq == None: Irq = self.Irq
+	self.Ring     = InterruptRing (Size)
+	self.Stopping = False
+	self._Sleepers = 0
+	self._SleepLock = threading.Lock ()
+	if not getattr (self, "_Wake", None):
+	    self._Wake = os.pipe ()	# handler threads sleep reading this
+	    fcntl.fcntl (self._Wake [1], fcntl.F_SETFL, os.O_NONBLOCK)
+	Ready = threading.Event ()
+
+	def _Wait ():
+	    self.Event = sigevent (SIGEV_INTR)
+	    self.InterruptAttachEvent (Irq, self.Event)
+	    Ready.set ()
+	    Ring, Wake, Clock = self.Ring, self._Wake [1], self._ClockCycles
+	    while not self.Stopping:
+		if self.InterruptWait () == -1:
+		    if get_errno () == errno.EINTR and self.Id != -1: continue
+		    break
+		Stamp = Clock ()
+		self.InterruptUnmask ()
+		self.Count += 1
+		Ring.Push (self.Count, Stamp)
+		Stats = self.Stats
+		if Stats:
+		    Stats.Masked.Add (Clock () - Stamp)
+		    if Stats.Last != None: Stats.Interval.Add (Stamp - Stats.Last)
+		    Stats.Last = Stamp
+		if self._Sleepers: self._Signal ()
+	    self.Stopping = True
+	    self.InterruptDetach ()
+	    self._Signal (Handlers)
+
+	StatsLock = threading.Lock ()	# between the handler threads
+
+	def _Handle ():
+	    Ring, Wake, Clock = self.Ring, self._Wake [0], self._ClockCycles
+	    while True:
+		Records = Ring.Drain (Batch)
+		if not Records:
+		    if self.Stopping: break
+		    with self._SleepLock: self._Sleepers += 1
+		    if not len (Ring) and not self.Stopping: os.read (Wake, 64)
+		    with self._SleepLock: self._Sleepers -= 1
+		    continue
+		Stats = self.Stats
+		if Stats: Start = Clock ()
+		try:
+		    if Fn (Records) == True: self.Stop ()
+		except Exception:
+		    self.Errors += 1
+		    traceback.print_exc ()
+		if Stats:
+		    Done = Clock ()
+		    with StatsLock:
+			Stats.Handler.Add (Done - Start)
+			for (Sequence, Stamp) in Records: Stats.Latency.Add (Done - Stamp)
+
+	self.Threads = [threading.Thread (target = _Wait)] + \
+		       [threading.Thread (target = _Handle) for i in range (Handlers)]
+	for Thread in self.Threads: 
+	    Thread.daemon = True
+	    Thread.start ()
+	    if Thread is self.Threads [0]: Ready.wait ()
+	return self.Threads
+
+    def InterruptPolled (self, Poll, Irq=None, Budget=64, Threshold=1, Rounds=16):
+	"""
+	InterruptPolled. Hybrid interrupt / polling, for high rate sources (as Linux NAPI).
+
+	@param Poll: Called as Poll (Budget), handles up to Budget items of work and returns how many it did.
+	@param Irq: The interrupt to attach to. If not supplied - use the instance Irq.
+	@param Budget: The most work one Poll call may do.
+	@param Threshold: Back to interrupt mode once a Poll does less than this.
+	@param Rounds: The most Poll calls before the interrupt is unmasked anyway.
+	@return 0 once stopped (Stop ()), -1 if Poll raised an exception.
+
+	The interrupt stays masked after a wake (_NTO_INTR_FLAGS_TRK_MSK) and Poll is called
+	until the work dries up (Threshold) or Rounds calls have been made, then it is unmasked
+	and the thread waits again. Under load one wake handles many interrupts' worth of work. 
+	A larger Threshold or smaller Rounds gives lower latency to other work, a larger 
+	Budget and Rounds more throughput. 
+
+	Counts: self.Wakes, self.Polls, self.Work and self.Exhausted (times Rounds was reached),
+	see PollReport (). Instrument () adds the histograms, Handler is per Poll call.
+	"""
+	if Irq == None: Irq = self.Irq
+	self.Event = sigevent (SIGEV_INTR)
+	self.Id = self.InterruptAttachEvent (Irq, self.Event)
+	self.Stopping = False
+	self.Wakes = self.Polls = self.Work = self.Exhausted = 0
+	Clock = self._ClockCycles
+	Result = 0
+
+	while not self.Stopping:
+	    if self.InterruptWait () == -1:
+		if get_errno () == errno.EINTR and self.Id != -1: continue
+		break
+	    Stats = self.Stats
+	    if Stats: Wake = Clock ()
+	    self.Wakes += 1
+	    try:
+		for Round in xrange (Rounds):
+		    if Stats: Start = Clock ()
+		    Done = Poll (Budget) or 0
+		    self.Polls += 1
+		    self.Work  += Done
+		    if Stats:
+			End = Clock ()
+			Stats.Handler.Add (End - Start)
+			Stats.Latency.Add (End - Wake)
+		    if Done < Threshold or self.Stopping: break
+		else:
+		    self.Exhausted += 1
+	    except Exception:
+		self.Errors += 1
+		traceback.print_exc ()
+		print "PyQNX6.Interrupt: Error in called InterruptPolled. Exiting"
+		self.Stopping = True
+		Result = -1
+
+	    self.InterruptUnmask ()
+	    if Stats:
+		Stats.Masked.Add (Clock () - Wake)
+		if Stats.Last != None: Stats.Interval.Add (Wake - Stats.Last)
+		Stats.Last = Wake
+
+	self.InterruptDetach ()
+	return Result
+
+    def PollReport (self):
+	"""
+	@return a dict of the InterruptPolled counts, with the work per wake and per poll.
+	"""
+	Wakes, Polls, Work = self.Wakes, self.Polls, self.Work
+	return {'wakes': Wakes, 'polls': Polls, 'work': Work, 'exhausted': self.Exhausted,
+		'work_per_wake': Wakes and float (Work) / Wakes,
+		'work_per_poll': Polls and float (Work) / Polls}
+
+    def Stop (self):
+	"""
+	Stop InterruptThreaded or InterruptPolled. The wait thread detaches, at the latest on the next interrupt.
+	"""
+	self.Stopping = True
+	if self.Threads: self._Signal (len (self.Threads))
+
+    def _Signal (self, Count = 1):
+	"""
+	Wake sleeping handler threads. If the pipe is full they are awake anyway.
+	"""
+	try: os.write (self._Wake [1], "w" * Count)
+	except OSError, e:
+	    if e.errno != errno.EAGAIN: raise
+
+    def Join (self, Timeout = None):
+	for Thread in self.Threads:
+	    Thread.join (Timeout)
 		
 
 
@@ -0,0 +1,1088 @@
+#!/usr/bin/python
+"""
+Symmetry Innovations Pty Ltd. admin@symmetry.com.au
+
+Linux stand-in for the QNX kernel calls.
+
+Provides the channel, connection, name, dispatch, message passing, timer, interrupt, port I/O,
+device memory and shared memory entry points of the QNX libc so that the PyQNX6 classes can be run, tested and measured on Linux.
+It is selected by PyQNX6.core.LoadBackend when not running on a QNX target.
+
+Each channel is a shared memory file (in /dev/shm) holding a ring of connection
+slots. A connection owns one slot for its messages and a small ring for its pulses.
+Sender and receiver hand the slot over by changing its state word and wake each
+other with futexes, so the QNX send-blocked / reply-blocked behaviour is kept.
+
+Limits:
+    - a message or reply is at most PYQNX6_MSG_MAX bytes (default 256k).
+    - a connection sends one message at a time, other threads using the
+      same coid queue behind it.
+    - there are PYQNX6_SLOTS connections per channel (default 64).
+"""
+import sys, os, time, mmap, errno, fcntl, struct, platform, threading, atexit
+
+from ctypes import *
+
+from PyQNX6 import (name_attach_t, msg_info_t, pulse_t, sigevent, iovec, itimerspec, 
+		    SIGEV_PULSE, SIGEV_INTR)
+
+try:
+    from thread import get_ident as _gettid
+except ImportError:
+    from threading import get_ident as _gettid
+
+__version__ = '0.1'
+
+ShmDir     = os.environ.get ("PYQNX6_SHM", "/dev/shm")
+NamePrefix = os.path.join (ShmDir, "pyqnx6.name")	#: replaces /dev/name
+MsgMax     = int (os.environ.get ("PYQNX6_MSG_MAX", 256*1024))
+Slots      = int (os.environ.get ("PYQNX6_SLOTS", 64))
+
+_MAGIC        = 0x36584e51
+_PULSE_RING   = 64
+_SIDE_CHANNEL = 0x40000000
+_NTO_CHF_UNBLOCK         = 2
+_NTO_CHF_DISCONNECT      = 8
+_NTO_CHF_COID_DISCONNECT = 0x40
+_PULSE_CODE_DISCONNECT   = -33
+_IO_CONNECT              = 0x100
+
+# the _IO_CONNECT message name_open sends (see PyQNX6.Resmgr.io_open_t), up to the path
+_IoConnect = struct.Struct ('<HHIHHIIIIHHHHBBH')
+
+# connection slot states
+_IDLE, _SEND, _RECEIVE, _REPLY, _ERROR, _DETACHED = range (6)
+
+
+class _pulse_entry_t (Structure):
+    _fields_ = [('code', c_int32),
+		('value', c_int32),
+		('priority', c_int32),
+		('zero', c_int32),
+		('stamp', c_double)]
+
+class _channel_t (Structure):
+    """
+    Channel header, at the start of the channel file.
+    """
+    _fields_ = [('magic', c_uint32),
+		('pid', c_int32),
+		('chid', c_int32),
+		('flags', c_int32),
+		('nslots', c_int32),
+		('slotsize', c_int32),
+		('nconnect', c_int32),	# high water mark of the used slots
+		('doorbell', c_int32),	# futex, the receivers wait on this
+		('destroyed', c_int32),
+		('zero', c_int32*7)]
+
+class _slot_t (Structure):
+    """
+    Connection slot. Followed by slotsize bytes of message data.
+    """
+    _fields_ = [('state', c_int32),	# futex, the sender waits on this
+		('owner', c_int32),
+		('tid', c_int32),
+		('coid', c_int32),
+		('priority', c_int32),
+		('msglen', c_int32),
+		('rxlen', c_int32),
+		('replylen', c_int32),
+		('status', c_int32),
+		('phead', c_uint32),	# pulse ring, written by the sender
+		('ptail', c_uint32),	# pulse ring, written by the receiver
+		('zero', c_int32),
+		('stamp', c_double),
+		('pulses', _pulse_entry_t * _PULSE_RING)]
+
+_DOORBELL = _channel_t.doorbell.offset
+_STATE    = _slot_t.state.offset
+
+
+#####################################
+# futex wakeups
+
+_libc = CDLL (None, use_errno=True)
+_SYS_futex = {'x86_64': 202, 'amd64': 202, 'i386': 240, 'i686': 240,
+	      'aarch64': 98, 'armv7l': 240, 'ppc64le': 221}.get (platform.machine ())
+_FUTEX_WAIT = 0
+_FUTEX_WAKE = 1
+
+class _timespec (Structure):
+    _fields_ = [('tv_sec', c_long), ('tv_nsec', c_long)]
+
+def _FutexWait (Addr, Value, Timeout):
+    """
+    Block while the int at Addr still holds Value, for at most Timeout seconds.
+    @return True if the wait timed out.
+    """
+    if _SYS_futex == None:		# no futex, poll.
+	time.sleep (min (Timeout, 0.0005))
+	return False
+    Ts = _timespec (int (Timeout), int ((Timeout % 1) * 1000000000))
+    Result = _libc.syscall (c_long (_SYS_futex), c_void_p (Addr), c_int (_FUTEX_WAIT),
+			    c_int (Value), byref (Ts), None, c_int (0))
+    return Result == -1 and get_errno () == errno.ETIMEDOUT
+
+def _FutexWake (Addr, Count=1):
+    """
+    Wake up to Count waiters on the int at Addr.
+    """
+    if _SYS_futex != None:
+	_libc.syscall (c_long (_SYS_futex), c_void_p (Addr), c_int (_FUTEX_WAKE),
+		       c_int (Count), None, None, c_int (0))
+
+
+#####################################
+# helpers
+
+def _Address (Obj):
+    """
+    Return the address of a ctypes instance, pointer, byref() or string.
+    """
+    if Obj is None: return 0
+    if isinstance (Obj, (int, long)): return Obj
+    return cast (Obj, c_void_p).value or 0
+
+def _Int (Value):
+    """
+    Return the value of an int or a ctypes c_int argument.
+    """
+    return int (getattr (Value, 'value', Value) or 0)
+
+def _Fail (Error):
+    """
+    Set errno and return the kernel call error value.
+    """
+    set_errno (Error)
+    return -1
+
+def _Alive (Pid):
+    """
+    True if the process is running. One that has exited but not been waited for (a zombie)
+    is dead, its channels are gone as they would be on QNX.
+    """
+    try:
+	os.kill (Pid, 0)
+    except OSError as e:
+	return e.errno != errno.ESRCH
+    try:
+	with open ("/proc/%d/stat" % Pid) as Stat:
+	    return Stat.read ().rpartition (")") [2].split () [0] != "Z"
+    except (IOError, IndexError):
+	return True
+
+_local = threading.local ()
+
+def _Priority ():
+    return getattr (_local, 'priority', 10)
+
+_Token = [0]
+
+def _NextToken ():
+    """
+    A value different from the last one any receiver has seen. Used to ring the doorbell.
+    """
+    _Token [0] += 1
+    return ((os.getpid () << 16) ^ _Token [0]) & 0x7fffffff
+
+
+class _Channel (object):
+    """
+    A mapped channel file. Created by the owner, mapped by every connection to it.
+    """
+    def __init__ (self, Pid, Chid, Flags=0, Create=False):
+	self.Path = os.path.join (ShmDir, "pyqnx6.%d.%d" % (Pid, Chid))
+	self.Owned = Create
+	if Create:
+	    Fd = os.open (self.Path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+	    os.ftruncate (Fd, sizeof (_channel_t) + Slots * self._Stride (MsgMax))
+	else:
+	    Fd = os.open (self.Path, os.O_RDWR)
+	self.Fd  = Fd
+	self.Ino = os.fstat (Fd).st_ino
+	self.Map = mmap.mmap (Fd, os.fstat (Fd).st_size)
+	self.Header = _channel_t.from_buffer (self.Map)
+	if Create:
+	    self.Header.magic    = _MAGIC
+	    self.Header.pid      = Pid
+	    self.Header.chid     = Chid
+	    self.Header.flags    = Flags
+	    self.Header.nslots   = Slots
+	    self.Header.slotsize = MsgMax
+	elif self.Header.magic != _MAGIC:
+	    raise OSError (errno.EINVAL, "Not a channel", self.Path)
+	self.Base   = addressof (self.Header)
+	self.Stride = self._Stride (self.Header.slotsize)
+	self.Slots  = [_slot_t.from_buffer (self.Map, self._Offset (Index))
+			    for Index in xrange (self.Header.nslots)]
+	self.Lock = threading.Lock ()	# receivers, claiming work
+	self.Refs = 0
+
+    def _Stride (self, SlotSize):
+	return sizeof (_slot_t) + ((SlotSize + 7) & ~7)
+
+    def _Offset (self, Index):
+	return sizeof (_channel_t) + Index * self.Stride
+
+    def State (self, Index):
+	"""
+	@return the address of a slot state word (for the futex calls)
+	"""
+	return self.Base + self._Offset (Index) + _STATE
+
+    def Data (self, Index):
+	"""
+	@return the address of a slot message data.
+	"""
+	return self.Base + self._Offset (Index) + sizeof (_slot_t)
+
+    def Ring (self, Count=1):
+	"""
+	Ring the doorbell, wake receivers.
+	"""
+	self.Header.doorbell = _NextToken ()
+	_FutexWake (self.Base + _DOORBELL, Count)
+
+    def Attach (self):
+	"""
+	Claim a free connection slot.
+	@return the slot index or None if the channel is full.
+	"""
+	Pid = os.getpid ()
+	fcntl.flock (self.Fd, fcntl.LOCK_EX)
+	try:
+	    for Index, Slot in enumerate (self.Slots):
+		if Slot.owner == 0 or (Slot.owner != Pid and not _Alive (Slot.owner)):
+		    Slot.state    = _IDLE
+		    Slot.phead    = Slot.ptail = 0
+		    Slot.owner    = Pid
+		    if Index >= self.Header.nconnect:
+			self.Header.nconnect = Index + 1
+		    return Index
+	finally:
+	    fcntl.flock (self.Fd, fcntl.LOCK_UN)
+	return None
+
+    def Close (self):
+	self.Slots = self.Header = None
+	self.Map.close ()
+	os.close (self.Fd)
+
+
+class _Connection (object):
+    def __init__ (self, Coid, Channel, Index):
+	self.Coid      = Coid
+	self.Channel   = Channel
+	self.Index     = Index
+	self.Slot      = Channel.Slots [Index]
+	self.Lock      = threading.Lock ()	# one send at a time
+	self.PulseLock = threading.Lock ()	# one pulse writer at a time
+	self.Slot.coid = Coid
+
+
+_Lock        = threading.RLock ()
+_channels    = {}	# chid -> owned _Channel
+_mapped      = {}	# (pid, chid) -> _Channel
+_connections = {}	# coid -> _Connection
+_names       = {}	# address of name_attach_t -> (name_attach_t, path)
+_next        = {'chid': 1, 'coid': 1, 'timer': 1, 'interrupt': 1, 'mount': 1}
+
+def _Next (Key):
+    Result = _next [Key]
+    _next [Key] += 1
+    return Result
+
+def _Map (Pid, Chid):
+    """
+    Map (or reuse the mapping of) a channel.
+    """
+    Chan = _mapped.get ((Pid, Chid))
+    if Chan != None and not Chan.Owned:
+	try:	Stale = os.stat (Chan.Path).st_ino != Chan.Ino
+	except OSError: Stale = True
+	if Stale:
+	    del _mapped [(Pid, Chid)]
+	    Chan = None
+    if Chan == None:
+	Chan = _mapped [(Pid, Chid)] = _Channel (Pid, Chid)
+    Chan.Refs += 1
+    return Chan
+
+def _Unmap (Chan):
+    Chan.Refs -= 1
+    if Chan.Refs == 0 and not Chan.Owned:
+	if _mapped.get ((Chan.Header.pid, Chan.Header.chid)) is Chan:
+	    del _mapped [(Chan.Header.pid, Chan.Header.chid)]
+	Chan.Close ()
+
+def _Received (Rcvid):
+    """
+    @return (channel, slot index) for a rcvid that is waiting on a reply, else None
+    """
+    Chan = _channels.get (Rcvid >> 16)
+    Index = (Rcvid & 0xffff) - 1
+    if Chan == None or not 0 <= Index < len (Chan.Slots): return None
+    if Chan.Slots [Index].state != _RECEIVE: return None
+    return (Chan, Index)
+
+def _FillInfo (Chan, Index, Info, Len):
+    Slot = Chan.Slots [Index]
+    Info = msg_info_t.from_address (Info)
+    Info.nd = Info.srcnd = 0
+    Info.pid       = Slot.owner
+    Info.tid       = Slot.tid
+    Info.chid      = Chan.Header.chid
+    Info.scoid     = Index + 1
+    Info.coid      = Slot.coid
+    Info.msglen    = Len
+    Info.srcmsglen = Slot.msglen
+    Info.dstmsglen = Slot.rxlen
+    Info.priority  = Slot.priority
+    Info.flags     = 0
+
+def _Pick (Chan):
+    """
+    Choose the next pulse or message to be received. Highest priority then oldest first.
+    @return (slot index, is a pulse) or None
+    """
+    Best = None
+    for Index in xrange (Chan.Header.nconnect):
+	Slot = Chan.Slots [Index]
+	if Slot.phead != Slot.ptail:
+	    Entry = Slot.pulses [Slot.ptail % _PULSE_RING]
+	    Key = (-Entry.priority, Entry.stamp)
+	    if Best == None or Key < Best [0]: Best = (Key, Index, True)
+	if Slot.state == _SEND:
+	    Key = (-Slot.priority, Slot.stamp)
+	    if Best == None or Key < Best [0]: Best = (Key, Index, False)
+    return Best and Best [1:]
+
+
+#####################################
+# channels and connections
+
+def ChannelCreate (Flags):
+    with _Lock:
+	Chid = _Next ('chid')
+	try:
+	    Chan = _Channel (os.getpid (), Chid, _Int (Flags), Create=True)
+	except (OSError, IOError, mmap.error) as e:
+	    return _Fail (e.errno or errno.ENOMEM)
+	Chan.Refs += 1
+	_channels [Chid] = _mapped [(os.getpid (), Chid)] = Chan
+    return Chid
+
+def ChannelDestroy (Chid):
+    with _Lock:
+	Chan = _channels.pop (_Int (Chid), None)
+	if Chan == None: return _Fail (errno.EINVAL)
+	Chan.Header.destroyed = 1
+	Chan.Ring (0x7fffffff)
+	try:	os.unlink (Chan.Path)
+	except OSError: pass
+	# the mapping is kept, threads may still be waking up in MsgReceive.
+    return 0
+
+def ConnectAttach (Nd, Pid, Chid, Index, Flags):
+    Nd, Pid, Chid, Index = _Int (Nd), _Int (Pid), _Int (Chid), _Int (Index)
+    if Nd: return _Fail (errno.ENOTSUP)	# local node only
+    if not Pid: Pid = os.getpid ()
+    with _Lock:
+	try:
+	    Chan = _Map (Pid, Chid)
+	except (OSError, IOError, mmap.error):
+	    return _Fail (errno.ESRCH)
+	Slot = Chan.Attach ()
+	if Slot == None:
+	    _Unmap (Chan)
+	    return _Fail (errno.EAGAIN)
+	Coid = (Index & _SIDE_CHANNEL) | _Next ('coid')
+	_connections [Coid] = _Connection (Coid, Chan, Slot)
+    return Coid
+
+def ConnectDetach (Coid):
+    with _Lock:
+	Conn = _connections.pop (_Int (Coid), None)
+    if Conn == None: return _Fail (errno.EBADF)
+    Chan, Slot = Conn.Channel, Conn.Slot
+    with Conn.Lock:
+	with Conn.PulseLock:
+	    if (Chan.Header.flags & _NTO_CHF_DISCONNECT and not Chan.Header.destroyed
+		    and _Push (Conn, 10, _PULSE_CODE_DISCONNECT, 0)):
+		Slot.state = _DETACHED	# freed by the receiver, after the pulse.
+		Chan.Ring ()
+	    else:
+		Slot.owner = 0
+    with _Lock:
+	_Unmap (Chan)
+    return 0
+
+
+def ConnectServerInfo (Pid, Coid, Info):
+    """
+    Fills in the server of Coid. Only this process's connections, and a connection
+    whose server has gone fails (ESRCH), where QNX would report it until it is used.
+    """
+    Conn = _connections.get (_Int (Coid))
+    if Conn == None: return _Fail (errno.EINVAL)
+    Chan = Conn.Channel
+    if Chan.Header.destroyed or not _Alive (Chan.Header.pid): return _Fail (errno.ESRCH)
+    if Info:
+	Info = msg_info_t.from_address (_Address (Info))
+	Info.nd = Info.srcnd = 0
+	Info.pid   = Chan.Header.pid
+	Info.chid  = Chan.Header.chid
+	Info.scoid = Conn.Index + 1
+	Info.coid  = Conn.Coid
+    return Conn.Coid
+
+
+#####################################
+# names
+
+def _NamePath (Name, Global):
+    if Global: return os.path.join (NamePrefix, "global", Name)
+    return os.path.join (NamePrefix, "local", Name)
+
+def _ReadName (Path):
+    """
+    @return the (pid, chid and mount id) in a name file. The mount id is 0 unless
+    the name was attached to a dispatch.
+    """
+    Fields = [int (x) for x in open (Path).read ().split ()]
+    if len (Fields) == 2: Fields.append (0)
+    (Pid, Chid, Mntid) = Fields
+    return (Pid, Chid, Mntid)
+
+def name_attach (Dpp, Name, Flags):
+    Path = _NamePath (getattr (Name, 'value', Name), _Int (Flags) & 2)
+    try:
+	os.makedirs (os.path.dirname (Path))
+    except OSError: pass
+    try:
+	(Pid, Chid, Mntid) = _ReadName (Path)
+	if _Alive (Pid):
+	    _Fail (errno.EEXIST)
+	    return None
+    except (IOError, ValueError): pass
+
+    Dispatch = _dispatches.get (_Address (Dpp))
+    if Dispatch != None:		# on the dispatch's channel, clients connect with _IO_CONNECT
+	(Chid, Mntid) = (Dispatch.value, _Next ('mount'))
+    else:
+	(Chid, Mntid) = (ChannelCreate (_NTO_CHF_UNBLOCK | _NTO_CHF_DISCONNECT | _NTO_CHF_COID_DISCONNECT), 0)
+	if Chid == -1: return None
+    Temp = "%s.%d" % (Path, os.getpid ())
+    f = open (Temp, "w")
+    if Mntid: f.write ("%d %d %d\n" % (os.getpid (), Chid, Mntid))
+    else: f.write ("%d %d\n" % (os.getpid (), Chid))
+    f.close ()
+    os.rename (Temp, Path)	# appears complete, for Waitfor
+
+    Attach = name_attach_t ()
+    Attach.chid  = Chid
+    Attach.mntid = Mntid
+    Attach.dpp   = _Address (Dpp) or None
+    _names [addressof (Attach)] = (Attach, Path, os.getpid ())
+    return addressof (Attach)
+
+def name_detach (Attach, Flags):
+    Attach, Path, Pid = _names.pop (_Address (Attach), (None, None, None))
+    if Attach == None: return _Fail (errno.EINVAL)
+    try:	os.unlink (Path)
+    except OSError: pass
+    if not Attach.dpp: ChannelDestroy (Attach.chid)	# a dispatch's channel is its owner's
+    return 0
+
+def name_open (Name, Flags):
+    try:
+	Path = _NamePath (getattr (Name, 'value', Name), _Int (Flags) & 2)
+	(Pid, Chid, Mntid) = _ReadName (Path)
+    except (IOError, ValueError):
+	return _Fail (errno.ENOENT)
+    if not _Alive (Pid): return _Fail (errno.ENOENT)
+    Coid = ConnectAttach (0, Pid, Chid, _SIDE_CHANNEL, 0)
+    if Coid == -1 or not Mntid: return Coid
+
+    # attached to a dispatch, the server is told which name with an _IO_CONNECT, as on QNX
+    Msg = create_string_buffer (_IoConnect.pack (_IO_CONNECT, 0, 0, 0, 0, 0, Mntid,
+						 0, 0, 0, 0, 0, 1, 0, 0, 0), _IoConnect.size + 1)
+    if _Send (Coid, [(addressof (Msg), sizeof (Msg))], []) == -1:
+	Error = get_errno ()
+	ConnectDetach (Coid)
+	return _Fail (Error)
+    return Coid
+
+
+#####################################
+# dispatch
+# Only what name_attach needs, a dispatch is the channel the names are attached to.
+
+_dispatches = {}	# address of the dispatch -> its chid (c_int)
+
+def dispatch_create_channel (Chid, Flags):
+    Chid = _Int (Chid)
+    if Chid == -1: Chid = ChannelCreate (_NTO_CHF_UNBLOCK | _NTO_CHF_DISCONNECT)
+    if Chid == -1: return None
+    Dispatch = c_int (Chid)
+    _dispatches [addressof (Dispatch)] = Dispatch
+    return addressof (Dispatch)
+
+def dispatch_destroy (Dpp):
+    if _dispatches.pop (_Address (Dpp), None) == None: return _Fail (errno.EINVAL)
+    return 0
+
+def name_close (Coid):
+    return ConnectDetach (Coid)
+
+
+#####################################
+# messages
+
+def _Gather (Dest, Parts, Limit):
+    """
+    Copy the (address, length) Parts one after the other to Dest, at most Limit bytes.
+    @return the number of bytes copied.
+    """
+    Done = 0
+    for Addr, Len in Parts:
+	Len = max (0, min (Len, Limit - Done))
+	if Len: memmove (Dest + Done, Addr, Len)
+	Done += Len
+    return Done
+
+def _Scatter (Parts, Src, Len):
+    """
+    Copy Len bytes from Src across the (address, length) Parts.
+    @return the number of bytes copied.
+    """
+    Done = 0
+    for Addr, Size in Parts:
+	Size = max (0, min (Size, Len - Done))
+	if Size: memmove (Addr, Src + Done, Size)
+	Done += Size
+    return Done
+
+def _Parts (Iov, Count):
+    """
+    @return the (address, length) parts of an iovec array.
+    """
+    Count = _Int (Count)
+    if Count <= 0: return []
+    return [(v.iov_base or 0, v.iov_len) for v in (iovec * Count).from_address (_Address (Iov))]
+
+def _Send (Coid, Parts, Rparts):
+    Conn = _connections.get (_Int (Coid))
+    if Conn == None: return _Fail (errno.EBADF)
+    Chan, Slot, Index = Conn.Channel, Conn.Slot, Conn.Index
+    if sum ([Len for Addr, Len in Parts]) > Chan.Header.slotsize: return _Fail (errno.EMSGSIZE)
+
+    with Conn.Lock:
+	if Chan.Header.destroyed: return _Fail (errno.ESRCH)
+	Slot.msglen   = _Gather (Chan.Data (Index), Parts, Chan.Header.slotsize)
+	Slot.rxlen    = sum ([Len for Addr, Len in Rparts])
+	Slot.priority = _Priority ()
+	Slot.tid      = _gettid () & 0x7fffffff
+	Slot.stamp    = time.time ()
+	Slot.state    = _SEND			# send blocked
+	Chan.Ring ()
+
+	Addr = Chan.State (Index)
+	while True:
+	    State = Slot.state
+	    if State == _REPLY or State == _ERROR: break
+	    if _FutexWait (Addr, State, 0.5):
+		if Chan.Header.destroyed or not _Alive (Chan.Header.pid):
+		    Slot.state = _IDLE
+		    return _Fail (errno.ESRCH)
+
+	Status = Slot.status
+	if State == _REPLY:
+	    _Scatter (Rparts, Chan.Data (Index), Slot.replylen)
+	Slot.state = _IDLE
+    if State == _ERROR: return _Fail (Status)
+    return Status
+
+def _Receive (Chid, Parts, Info):
+    Chan = _channels.get (_Int (Chid))
+    if Chan == None: return _Fail (errno.ESRCH)
+    Header = Chan.Header
+    while True:
+	Bell = Header.doorbell
+	if Header.destroyed: return _Fail (errno.ESRCH)
+	with Chan.Lock:
+	    Found = _Pick (Chan)
+	    if Found:
+		Index, IsPulse = Found
+		Slot = Chan.Slots [Index]
+		if IsPulse:
+		    Entry = Slot.pulses [Slot.ptail % _PULSE_RING]
+		    Code, Value, Priority = Entry.code, Entry.value, Entry.priority
+		    Slot.ptail = (Slot.ptail + 1) & 0xffffffff
+		    if Slot.state == _DETACHED and Slot.phead == Slot.ptail:
+			Slot.owner = 0
+		else:
+		    Slot.state = _RECEIVE		# reply blocked
+		    Priority = Slot.priority
+	if Found: break
+	_FutexWait (Chan.Base + _DOORBELL, Bell, 1.0)
+
+    _local.priority = Priority		# the receiver runs at the sender's priority, as on QNX
+    if IsPulse:
+	Pulse = pulse_t ()
+	Pulse.code = Code
+	Pulse.sigval.sival_int = Value
+	Pulse.scoid = Index + 1
+	_Scatter (Parts, addressof (Pulse), sizeof (pulse_t))
+	if Info: 
+	    _FillInfo (Chan, Index, _Address (Info), sizeof (pulse_t))
+	    msg_info_t.from_address (_Address (Info)).priority = Priority
+	return 0
+
+    Len = _Scatter (Parts, Chan.Data (Index), Slot.msglen)
+    if Info: _FillInfo (Chan, Index, _Address (Info), Len)
+    return (Chan.Header.chid << 16) | (Index + 1)
+
+def _Reply (Rcvid, Status, Parts):
+    Found = _Received (_Int (Rcvid))
+    if Found == None: return _Fail (errno.ESRCH)
+    Chan, Index = Found
+    Slot = Chan.Slots [Index]
+    Slot.replylen = _Gather (Chan.Data (Index), Parts, min (Slot.rxlen, Chan.Header.slotsize))
+    Slot.status   = _Int (Status)
+    Slot.state    = _REPLY
+    _FutexWake (Chan.State (Index))
+    return 0
+
+def MsgSend (Coid, Smsg, Sbytes, Rmsg, Rbytes):
+    return _Send (Coid, [(_Address (Smsg), _Int (Sbytes))], [(_Address (Rmsg), _Int (Rbytes))])
+
+def MsgSendv (Coid, Siov, Sparts, Riov, Rparts):
+    return _Send (Coid, _Parts (Siov, Sparts), _Parts (Riov, Rparts))
+
+def MsgReceive (Chid, Msg, Bytes, Info):
+    return _Receive (Chid, [(_Address (Msg), _Int (Bytes))], Info)
+
+def MsgReceivev (Chid, Riov, Rparts, Info):
+    return _Receive (Chid, _Parts (Riov, Rparts), Info)
+
+def MsgReply (Rcvid, Status, Msg, Bytes):
+    return _Reply (Rcvid, Status, [(_Address (Msg), _Int (Bytes))])
+
+def MsgReplyv (Rcvid, Status, Riov, Rparts):
+    return _Reply (Rcvid, Status, _Parts (Riov, Rparts))
+
+def MsgError (Rcvid, Error):
+    Found = _Received (_Int (Rcvid))
+    if Found == None: return _Fail (errno.ESRCH)
+    Chan, Index = Found
+    Chan.Slots [Index].status = _Int (Error)
+    Chan.Slots [Index].state  = _ERROR
+    _FutexWake (Chan.State (Index))
+    return 0
+
+def MsgRead (Rcvid, Msg, Bytes, Offset):
+    Found = _Received (_Int (Rcvid))
+    if Found == None: return _Fail (errno.ESRCH)
+    Chan, Index = Found
+    Len = max (0, min (_Int (Bytes), Chan.Slots [Index].msglen - _Int (Offset)))
+    if Len: memmove (_Address (Msg), Chan.Data (Index) + _Int (Offset), Len)
+    return Len
+
+def MsgInfo (Rcvid, Info):
+    Found = _Received (_Int (Rcvid))
+    if Found == None: return _Fail (errno.ESRCH)
+    _FillInfo (Found [0], Found [1], _Address (Info), Found [0].Slots [Found [1]].msglen)
+    return 0
+
+def _Push (Conn, Priority, Code, Value):
+    """
+    Queue a pulse on the connection pulse ring. The caller holds the PulseLock.
+    @return False if the ring is full.
+    """
+    Slot = Conn.Slot
+    if (Slot.phead - Slot.ptail) & 0xffffffff >= _PULSE_RING: return False
+    Entry = Slot.pulses [Slot.phead % _PULSE_RING]
+    Entry.code     = Code
+    Entry.value    = Value
+    Entry.priority = Priority
+    Entry.stamp    = time.time ()
+    Slot.phead = (Slot.phead + 1) & 0xffffffff
+    return True
+
+def MsgSendPulse (Coid, Priority, Code, Value):
+    Conn = _connections.get (_Int (Coid))
+    if Conn == None: return _Fail (errno.EBADF)
+    if Conn.Channel.Header.destroyed: return _Fail (errno.ESRCH)
+    with Conn.PulseLock:
+	if not _Push (Conn, _Int (Priority), _Int (Code), _Int (Value)):
+	    return _Fail (errno.EAGAIN)
+    Conn.Channel.Ring ()
+    return 0
+
+def MsgDeliverEvent (Rcvid, Event):
+    Event = sigevent.from_address (_Address (Event))
+    if Event.sigev_notify != SIGEV_PULSE: return _Fail (errno.ENOTSUP)
+    return MsgSendPulse (Event.sigev_coid, Event.sigev_priority,
+			 Event.sigev_code, Event.sigev_value)
+
+
+#####################################
+# timers
+
+class _Timer (threading.Thread):
+    """
+    A timer_create timer. A thread sleeps until the timer expires and delivers the (pulse) event.
+    A pulse that finds the connection ring full is dropped, as an overrun.
+    """
+    def __init__ (self, Event):
+	threading.Thread.__init__ (self)
+	self.daemon   = True
+	self.Event    = (Event.sigev_coid, Event.sigev_priority, Event.sigev_code, Event.sigev_value)
+	self.Cond     = threading.Condition ()
+	self.Expires  = None		# time.time () of the next expiry, None when disarmed
+	self.Interval = 0
+	self.Deleted  = False
+
+    def Set (self, Expires, Interval):
+	with self.Cond:
+	    self.Expires, self.Interval = Expires, Interval
+	    self.Cond.notify ()
+
+    def run (self):
+	with self.Cond:
+	    while not self.Deleted:
+		if self.Expires == None:
+		    self.Cond.wait ()
+		    continue
+		Delay = self.Expires - time.time ()
+		if Delay > 0:
+		    self.Cond.wait (Delay)
+		    continue
+		MsgSendPulse (*self.Event)
+		if self.Interval:
+		    self.Expires = max (self.Expires + self.Interval, time.time ())
+		else:
+		    self.Expires = None
+
+_timers = {}	# timer id -> _Timer
+
+def timer_create (ClockId, Event, Id):
+    Event = sigevent.from_address (_Address (Event))
+    if Event.sigev_notify != SIGEV_PULSE: return _Fail (errno.ENOTSUP)
+    Timer = _Timer (Event)
+    with _Lock:
+	TimerId = _Next ('timer')
+	_timers [TimerId] = Timer
+    c_int.from_address (_Address (Id)).value = TimerId
+    Timer.start ()
+    return 0
+
+def timer_settime (Id, Flags, Value, Old):
+    Timer = _timers.get (_Int (Id))
+    if Timer == None: return _Fail (errno.EINVAL)
+    Value = itimerspec.from_address (_Address (Value))
+    Start    = Value.it_value.tv_sec + Value.it_value.tv_nsec / 1e9
+    Interval = Value.it_interval.tv_sec + Value.it_interval.tv_nsec / 1e9
+    if not Start:
+	Timer.Set (None, 0)
+    elif _Int (Flags):			# TIMER_ABSTIME
+	Timer.Set (Start, Interval)
+    else:
+	Timer.Set (time.time () + Start, Interval)
+    return 0
+
+def timer_delete (Id):
+    with _Lock:
+	Timer = _timers.pop (_Int (Id), None)
+    if Timer == None: return _Fail (errno.EINVAL)
+    with Timer.Cond:
+	Timer.Deleted = True
+	Timer.Cond.notify ()
+    if Timer is not threading.current_thread ():
+	Timer.join ()		# no pulse once it is deleted
+    return 0
+
+
+#####################################
+# interrupts
+# There is no hardware, InterruptTrigger (Irq) raises a (software) interrupt. As with
+# _NTO_INTR_FLAGS_TRK_MSK the interrupt is masked when it is delivered, until InterruptUnmask.
+# An interrupt raised while masked is held (as a level triggered one) and delivered on unmask.
+# The event is SIGEV_INTR (for InterruptWait) or SIGEV_PULSE.
+
+class _Attach (object):
+    def __init__ (self, Irq, Thread):
+	self.Irq     = Irq
+	self.Thread  = Thread	# the thread the SIGEV_INTR is delivered to
+	self.Masked  = 0
+	self.Held    = False	# raised while masked
+	self.Event   = None	# (coid, priority, code, value) for a SIGEV_PULSE
+
+_IntrCond = threading.Condition ()
+_attaches = {}		# id -> _Attach
+_pending  = {}		# thread -> interrupt events pending
+
+def _Deliver (Attach):
+    """
+    Mask and deliver the interrupt. The caller holds _IntrCond.
+    """
+    Attach.Masked += 1
+    if Attach.Event != None:
+	MsgSendPulse (*Attach.Event)
+	return
+    _pending [Attach.Thread] = _pending.get (Attach.Thread, 0) + 1
+    _IntrCond.notify_all ()
+
+def InterruptTrigger (Irq):
+    """
+    Linux only. Raise interrupt Irq.
+    """
+    with _IntrCond:
+	for Attach in _attaches.values ():
+	    if Attach.Irq != Irq: continue
+	    if Attach.Masked: Attach.Held = True
+	    else: _Deliver (Attach)
+    return 0
+
+def InterruptAttachEvent (Irq, Event, Flags):
+    Event = sigevent.from_address (_Address (Event))
+    if Event.sigev_notify not in (SIGEV_INTR, SIGEV_PULSE): return _Fail (errno.ENOTSUP)
+    Attach = _Attach (_Int (Irq), _gettid ())
+    if Event.sigev_notify == SIGEV_PULSE:
+	Attach.Event = (Event.sigev_coid, Event.sigev_priority, Event.sigev_code, Event.sigev_value)
+    with _IntrCond:
+	Id = _Next ('interrupt')
+	_attaches [Id] = Attach
+    return Id
+
+def InterruptDetach (Id):
+    with _IntrCond:
+	Attach = _attaches.pop (_Int (Id), None)
+	if Attach == None: return _Fail (errno.EINVAL)
+	_IntrCond.notify_all ()
+    return 0
+
+def InterruptWait (Flags, Timeout):
+    Thread = _gettid ()
+    with _IntrCond:
+	while not _pending.get (Thread):
+	    if not [Attach for Attach in _attaches.values () if Attach.Thread == Thread]:
+		return _Fail (errno.EINTR)		# detached
+	    _IntrCond.wait (1.0)
+	_pending [Thread] = 0		# events collapse, as SIGEV_INTR
+    return 0
+
+def InterruptMask (Irq, Id):
+    with _IntrCond:
+	Attach = _attaches.get (_Int (Id))
+	if Attach == None: return _Fail (errno.EINVAL)
+	Attach.Masked += 1
+	return Attach.Masked
+
+def InterruptUnmask (Irq, Id):
+    with _IntrCond:
+	Attach = _attaches.get (_Int (Id))
+	if Attach == None: return _Fail (errno.EINVAL)
+	if Attach.Masked: Attach.Masked -= 1
+	if not Attach.Masked and Attach.Held:
+	    Attach.Held = False
+	    _Deliver (Attach)
+	return Attach.Masked
+
+
+#####################################
+# misc
+
+def ThreadCtl (Cmd, Data):
+    return 0
+
+#####################################
+# port I/O
+# Ports are simulated. Each is a register holding the last value written, unless a
+# device has been attached with AttachPort.
+
+_registers = {}		# port -> value
+_devices   = {}		# port -> (Read, Write)
+
+def AttachPort (Port, Read = None, Write = None):
+    """
+    Linux only. Simulate a device at Port. 
+    Read (Width) returns the value read, Write (Value, Width) is given the value written.
+    Either may be None, for a register.
+    """
+    _devices [Port] = (Read, Write)
+
+def DetachPort (Port):
+    _devices.pop (Port, None)
+    _registers.pop (Port, None)
+
+def _PortIn (Port, Width):
+    Read = _devices.get (Port, (None, None)) [0]
+    if Read: return Read (Width) & ((1 << (8 * Width)) - 1)
+    return _registers.get (Port, 0) & ((1 << (8 * Width)) - 1)
+
+def _PortOut (Port, Value, Width):
+    Write = _devices.get (Port, (None, None)) [1]
+    if Write: Write (Value, Width)
+    else: _registers [Port] = Value
+
+def _Ins (Type):
+    def Ins (Buff, Len, Port):
+	Port, Width = _Int (Port), sizeof (Type)
+	Values = (Type * _Int (Len)).from_address (_Address (Buff))
+	for i in xrange (len (Values)): Values [i] = _PortIn (Port, Width)
+	return _Address (Buff)
+    return Ins
+
+def _Outs (Type):
+    def Outs (Buff, Len, Port):
+	Port, Width = _Int (Port), sizeof (Type)
+	for Value in (Type * _Int (Len)).from_address (_Address (Buff)): _PortOut (Port, Value, Width)
+	return _Address (Buff)
+    return Outs
+
+in8s,  out8s  = _Ins (c_uint8),  _Outs (c_uint8)
+in16s, out16s = _Ins (c_uint16), _Outs (c_uint16)
+in32s, out32s = _Ins (c_uint32), _Outs (c_uint32)
+
+
+#####################################
+# device memory
+# Physical memory is a file, DeviceFile (PYQNX6_DEVICE), the physical address is the offset 
+# in it. The file is created (and grown) as needed, processes mapping it share it.
+
+DeviceFile = os.environ.get ("PYQNX6_DEVICE", os.path.join (ShmDir, "pyqnx6.device"))
+
+_devmaps = {}		# address -> (mmap, length)
+_created = []		# DeviceFile, if this process created it
+
+def mmap_device_memory (Addr, Len, Prot, Flags, Physical):
+    Len, Physical = _Int (Len), _Int (Physical)
+    Base = Physical - Physical % mmap.ALLOCATIONGRANULARITY
+    try:
+	Fd = os.open (DeviceFile, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0600)
+	_created.append ((DeviceFile, os.getpid ()))
+    except OSError:
+	Fd = os.open (DeviceFile, os.O_RDWR)
+    try:
+	if os.fstat (Fd).st_size < Physical + Len: os.ftruncate (Fd, Physical + Len)
+	Map = mmap.mmap (Fd, Physical - Base + Len, offset = Base)
+    except EnvironmentError as e:
+	return _Fail (e.errno)
+    finally:
+	os.close (Fd)
+    Address = addressof (c_char.from_buffer (Map)) + Physical - Base
+    _devmaps [Address] = (Map, Len)
+    return Address
+
+def munmap_device_memory (Addr, Len):
+    Map = _devmaps.pop (_Address (Addr), None)
+    if Map == None: return _Fail (errno.EINVAL)
+    Map [0].close ()
+    return 0
+
+def mmap_device_io (Len, Io):
+    return _Int (Io)		# as on x86, the port number
+
+def munmap_device_io (Io, Len):
+    return 0
+
+
+#####################################
+# shared memory objects are files in ShmDir, as shm_open does on Linux.
+
+def _ShmPath (Name):
+    return os.path.join (ShmDir, Name.lstrip ('/'))
+
+def shm_open (Name, Flags, Mode):
+    try:
+	return os.open (_ShmPath (Name), _Int (Flags), _Int (Mode))
+    except OSError as e:
+	return _Fail (e.errno)
+
+def shm_unlink (Name):
+    try:
+	os.unlink (_ShmPath (Name))
+    except OSError as e:
+	return _Fail (e.errno)
+    return 0
+
+
+#####################################
+
+CYCLES_PER_SEC = 1000000000	#: ClockCycles counts nanoseconds
+_CLOCK_MONOTONIC = 1
+
+def ClockCycles ():
+    """
+    The monotonic clock, in nanoseconds.
+    """
+    Ts = _timespec ()
+    _libc.clock_gettime (_CLOCK_MONOTONIC, byref (Ts))
+    return Ts.tv_sec * 1000000000 + Ts.tv_nsec
+
+def getprio (Pid):
+    return _Priority ()
+
+def setprio (Pid, Priority):
+    Result = _Priority ()
+    _local.priority = _Int (Priority)
+    return Result
+
+
+def _Cleanup ():
+    """
+    Remove the channel and name files created by this process (not by a parent before a fork).
+    """
+    Pid = os.getpid ()
+    for Attach, Path, Owner in _names.values ():
+	if Owner == Pid:
+	    try:	os.unlink (Path)
+	    except OSError: pass
+    for Chan in _channels.values ():
+	if Chan.Header.pid == Pid:
+	    try:	os.unlink (Chan.Path)
+	    except OSError: pass
+    for Path, Owner in _created:
+	if Owner == Pid:
+	    try:	os.unlink (Path)
+	    except OSError: pass
+
+atexit.register (_Cleanup)
+
+
+
+def Benchmark (Count=20000, Size=64):
+    """
+    Round trip benchmark. A forked QNXServer echoes Count messages of Size bytes.
+    """
+    from PyQNX6.Server import QNXServer
+    from PyQNX6.Client import QNXClient
+
+    Name = "pyqnx6bench.%d" % os.getpid ()
+    Pid = os.fork ()
+    if Pid == 0:
+	def Echo (Server, Rcvid, Data):
+	    if Data == "quit": raise StopIteration
+	    return (0, Data)
+	QNXServer (Name, Echo, RawMode=True).Run ()
+	sys.exit (0)
+
+    Client = QNXClient (Name, RawMode=True)
+    Data = "x" * Size
+    Start = time.time ()
+    for i in xrange (Count):
+	Client.MsgSend (Data, Size)
+    Elapsed = time.time () - Start
+    Client.MsgSend ("quit", 16)
+    Client.name_close ()
+    os.waitpid (Pid, 0)
+
+    print "%d x %d bytes: %.1f uS round trip, %d msgs/sec" % \
+		(Count, Size, Elapsed * 1000000 / Count, Count / Elapsed)
+
+
+if __name__ == '__main__':
+    Benchmark ()
@@ -0,0 +1,149 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Device memory. A physical address range (device registers, a frame buffer)
+mapped once with mmap_device_memory and used as :
+
+    - a writable memoryview (View), so a dump or a copy is one slice.
+    - ctypes register structures laid over it (Overlay).
+    - NumPy arrays over it (Array), if NumPy is installed.
+    - explicit single reads and writes of a given width (Read32, Write16, ...)
+
+e.g.
+    class Uart (Structure):
+	_fields_ = [('data', c_uint32), ('status', c_uint32)]
+
+    with DeviceMemory (0xfe201000, 0x1000) as Regs:
+	Uart0 = Regs.Overlay (Uart)
+	while not Regs.Read32 (4) & 1: pass
+	Dump = Regs.View [0:256].tobytes ()
+
+Off target the PyQNX6.Linux stand-in maps a file (see PyQNX6.Linux.DeviceFile).
+'''
+import sys, os
+
+from ctypes import *
+
+from PyQNX6 import QNX, Libc
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+PROT_READ    = 0x100
+PROT_WRITE   = 0x200
+PROT_NOCACHE = 0x800	#: device registers should not be cached
+MAP_SHARED   = 0x001
+
+MAP_FAILED = c_void_p (-1).value
+
+
+class DeviceMemory (QNX):
+    """
+    A mapped physical address range.
+    @param Physical: The physical address.
+    @param Length: The length in bytes.
+    @param Prot: The protection, by default read, write and uncached.
+    @param Flags: mmap flags.
+    @raise OSError if it cant be mapped (permission, no I/O privilege etc).
+    """
+    _mmap_device_memory   = Libc ("mmap_device_memory")
+    _munmap_device_memory = Libc ("munmap_device_memory")
+    _ThreadCtl            = Libc ("ThreadCtl")
+
+    def __init__ (self, Physical, Length, Prot = PROT_READ | PROT_WRITE | PROT_NOCACHE, Flags = 0):
+	if QNX.lib == None:
+	    QNX.__init__(self)    # init libc
+	self._ThreadCtl (1, 0)	# _NTO_TCTL_IO, needed to map device memory
+	self.Physical = Physical
+	self.Length   = Length
+	self.Address  = self._mmap_device_memory (None, Length, Prot, Flags, Physical)
+	if self.Address in (None, -1, MAP_FAILED):
+	    self.Address = None
+	    Error = get_errno ()
+	    raise OSError (Error, "mmap_device_memory %#x: %s" % (Physical, os.strerror (Error)))
+	self.Buffer = (c_char * Length).from_address (self.Address)
+	self.View   = memoryview (self.Buffer)	#: the whole range, writable
+
+    def Close (self):
+	"""
+	Unmap. Views and overlays must not be used afterwards.
+	"""
+	if self.Address != None:
+	    self.View = self.Buffer = None
+	    self._munmap_device_memory (self.Address, self.Length)
+	    self.Address = None
+
+    def __enter__ (self):
+	return self
+
+    def __exit__ (self, *Exception):
+	self.Close ()
+
+    def __len__ (self):
+	return self.Length
+
+    def _Check (self, Offset, Size):
+	if self.Address == None: raise ValueError ("DeviceMemory is closed")
+	if Offset < 0 or Offset + Size > self.Length:
+	    raise IndexError ("offset %#x (%d bytes) outside the %#x byte range" % (Offset, Size, self.Length))
+	return self.Address + Offset
+
+    def Overlay (self, Type, Offset = 0):
+	"""
+	@param Type: A ctypes type, usually a Structure of the device registers.
+	@return a Type instance at Offset, its fields read and write the device.
+	"""
+	return Type.from_address (self._Check (Offset, sizeof (Type)))
+
+    def Array (self, Dtype = 'uint8', Offset = 0, Count = -1):
+	"""
+	@return a NumPy array over the memory (needs NumPy).
+	@param Count: Elements, by default to the end of the range.
+	"""
+	import numpy
+	self._Check (Offset, 0)
+	return numpy.frombuffer (self.Buffer, Dtype, Count, Offset)
+
+    # Single accesses. Each is one load or store of the width, every call, as a
+    # volatile access would be. Offsets should be aligned to the width.
+
+    def _Read (self, Type, Offset):
+	return Type.from_address (self._Check (Offset, sizeof (Type))).value
+
+    def _Write (self, Type, Offset, Value):
+	Type.from_address (self._Check (Offset, sizeof (Type))).value = Value
+
+    def Read8  (self, Offset): return self._Read (c_uint8,  Offset)
+    def Read16 (self, Offset): return self._Read (c_uint16, Offset)
+    def Read32 (self, Offset): return self._Read (c_uint32, Offset)
+    def Read64 (self, Offset): return self._Read (c_uint64, Offset)
+
+    def Write8  (self, Offset, Value): self._Write (c_uint8,  Offset, Value)
+    def Write16 (self, Offset, Value): self._Write (c_uint16, Offset, Value)
+    def Write32 (self, Offset, Value): self._Write (c_uint32, Offset, Value)
+    def Write64 (self, Offset, Value): self._Write (c_uint64, Offset, Value)
+
+    def Read (self, Offset = 0, Length = None):
+	"""
+	@return a str copy of Length bytes at Offset (by default to the end).
+	"""
+	if Length == None: Length = self.Length - Offset
+	return string_at (self._Check (Offset, Length), Length)
+
+    def Write (self, Offset, Data):
+	"""
+	Copy Data (str, bytearray, memoryview etc.) to Offset.
+	"""
+	Length = len (Data) * getattr (Data, 'itemsize', 1)
+	Address = self._Check (Offset, Length)
+	if not isinstance (Data, str):
+	    try: Data = (c_char * Length).from_buffer (Data)
+	    except TypeError: Data = memoryview (Data).tobytes ()
+	memmove (Address, Data, Length)
+
+    def __repr__ (self):
+	return "<DeviceMemory %#x %#x bytes>" % (self.Physical, self.Length)
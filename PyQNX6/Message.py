@@ -6,13 +6,15 @@ QNX Target Project.
 
 
 '''
-import sys, os, time, cPickle
+import sys, os, time, errno, cPickle, struct, threading, weakref, traceback
 
 from ctypes import *
 
-from PyQNX6 import (QNX, name_attach_t, msg_info_t, 
-			pulse_t, sigevent,
+from PyQNX6 import (QNX, Libc, name_attach_t, msg_info_t, 
+			pulse_t, sigevent, iovec,
+			PULSE_CODE_UNBLOCK, PULSE_CODE_DISCONNECT,
 			)  
+from PyQNX6 import Codec, Schema, Batch
 
 __version__ = '0.1'
 __author__='Andy Rhind (Symmetry Innovations)'
@@ -46,7 +48,6 @@ class Connect (QNX):
 	"""
 	Intialise the Connect class. 
 	Uses the QNX class to provide libc connectivity.
-	Defines the ctypes functions. 
 	"""
 	if QNX.lib == None:
 	    QNX.__init__(self)    # init libc
@@ -55,25 +56,20 @@ class Connect (QNX):
 	self.coid = None
 	self.dpp = None
 
-	# channel related methods
-	self._ChannelCreate = self.lib.ChannelCreate
-	self._ChannelCreate.argtypes = [c_int]
-	self._ChannelDestroy = self.lib.ChannelDestroy
-	self._ChannelDestroy.argtypes = [c_int]
-
-	# connect related methods
-	self._ConnectAttach = self.lib.ConnectAttach
-	self._ConnectAttach.argtypes= [c_int, c_int, c_int, 
-	                               c_int, c_int]
-	self._ConnectDetach = self.lib.ConnectDetach
+    # the libc functions, bound once when first used (see PyQNX6.core.Libc)
+    # channel related methods
+    _ChannelCreate  = Libc ("ChannelCreate")
+    _ChannelDestroy = Libc ("ChannelDestroy")
+
+    # connect related methods
+    _ConnectAttach  = Libc ("ConnectAttach")
+    _ConnectDetach  = Libc ("ConnectDetach")
 	
-	# name related methods
-	self._name_attach = self.lib.name_attach
-	self._name_attach.argtypes = [c_int, c_char_p, c_int]
-	self._name_detach = self.lib.name_detach
-	self._name_detach.argtypes = [c_void_p, c_int]
-	self._name_open = self.lib.name_open
-	self._name_open.argtypes = [c_char_p, c_int]
+    # name related methods
+    _name_attach    = Libc ("name_attach")
+    _name_detach    = Libc ("name_detach")
+    _name_open      = Libc ("name_open")
+    _name_close     = Libc ("name_close")
 	
 
     _NTO_CHF_FIXED_PRIORITY  = 1 
@@ -177,9 +173,7 @@ class Connect (QNX):
 	"""
 	__Flag = 0
 	if Global: __Flag = 2  # NAME_FLAG_ATTACH_GLOBAL
-	self._name_attach.restype = c_void_p  # cant use - name_attach_t
-	
-	self.__naresult = self._name_attach (c_int(0),
+	self.__naresult = self._name_attach (None,
 			 c_char_p (Name),
 			 c_int(__Flag))
 
@@ -231,7 +225,7 @@ class Connect (QNX):
 	Closes the Connection.
 	"""
 	if self.coid != None:
-	    __Result = self.lib.name_close (self.coid)
+	    __Result = self._name_close (self.coid)
 	    self.coid = None
 	    return  __Result
 
@@ -239,22 +233,331 @@ class Connect (QNX):
    
 
 
+##########################################################
+#
+# receive / reply buffers
+#
+
+class BufferPool (object):
+    """
+    Message buffers, kept for reuse. Sizes are rounded up to a power of two (at least Minimum)
+    and a freed buffer is kept on the free list of its size, so a buffer grown for one large
+    message is reused rather than a new one allocated (and zeroed) for every message.
+    @param Keep: The most free buffers kept of each size.
+    @param HighWater: The most bytes kept free, buffers freed above it are dropped (trimmed).
+    Each thread has its own pool (see Pool), so there is no locking.
+    """
+    Minimum = 1024
+
+    def __init__ (self, Keep = 4, HighWater = 4 * 1024 * 1024):
+	self.Keep      = Keep
+	self.HighWater = HighWater
+	self.Free      = {}	# size -> list of buffers
+	self.Hits      = 0	# Get from a free list
+	self.Misses    = 0	# Get that allocated
+	self.Trimmed   = 0	# Put that dropped the buffer
+	self.Held      = 0	# bytes in the free lists
+
+    @classmethod
+    def Size (cls, Len):
+	"""
+	@return the size class for Len bytes.
+	"""
+	if Len <= cls.Minimum: return cls.Minimum
+	return 1 << (int (Len) - 1).bit_length ()
+
+    def Get (self, Len):
+	"""
+	@return a buffer of at least Len bytes. A reused buffer still holds its old contents.
+	"""
+	Size = self.Size (Len)
+	Free = self.Free.get (Size)
+	if Free:
+	    self.Hits += 1
+	    self.Held -= Size
+	    return Free.pop ()
+	self.Misses += 1
+	return create_string_buffer (Size)
+
+    def Put (self, Buffer):
+	"""
+	Free a buffer from Get.
+	"""
+	Size = sizeof (Buffer)
+	Free = self.Free.setdefault (Size, [])
+	if len (Free) >= self.Keep or self.Held + Size > self.HighWater:
+	    self.Trimmed += 1
+	    return
+	Free.append (Buffer)
+	self.Held += Size
+
+    def Trim (self, HighWater = 0):
+	"""
+	Drop free buffers, the largest first, until no more than HighWater bytes are held.
+	"""
+	for Size in sorted (self.Free, reverse = True):
+	    Free = self.Free [Size]
+	    while Free and self.Held > HighWater:
+		Free.pop ()
+		self.Held -= Size
+		self.Trimmed += 1
+
+    def Stats (self):
+	"""
+	@return a dict of the counters.
+	"""
+	return {'hits': self.Hits, 'misses': self.Misses, 'trimmed': self.Trimmed, 'held': self.Held,
+		'free': dict ([(Size, len (Free)) for Size, Free in self.Free.items () if Free])}
+
+    def __repr__ (self):
+	return "<BufferPool %d hits %d misses %d trimmed %d bytes held>" % (
+		self.Hits, self.Misses, self.Trimmed, self.Held)
+
+
+_Pools = threading.local ()
+_AllPools = weakref.WeakValueDictionary ()	# thread id -> pool, for PoolStats
+
+def Pool ():
+    """
+    @return the calling thread's BufferPool.
+    """
+    try:
+	return _Pools.pool
+    except AttributeError:
+	_Pools.pool = BufferPool ()
+	_AllPools [threading.current_thread ().ident] = _Pools.pool
+	return _Pools.pool
+
+def PoolStats ():
+    """
+    @return the counters summed over the pools of the running threads.
+    """
+    Total = {'hits': 0, 'misses': 0, 'trimmed': 0, 'held': 0}
+    for Each in _AllPools.values ():
+	for Key in Total: Total [Key] += getattr (Each, Key.capitalize ())
+    return Total
+
+
+##########################################################
+#
+# buffers passed to the vectored functions
+#
+
+class _Py_buffer (Structure):
+    """
+    The start of the Python buffer view, the rest is reserved (it differs between versions).
+    """
+    _fields_ = [('buf', c_void_p),
+		('obj', c_void_p),
+		('len', c_ssize_t),
+		('reserved', c_void_p*16)]
+
+_PyBUF_WRITABLE = 1
+
+_PyObject_GetBuffer = pythonapi.PyObject_GetBuffer
+_PyObject_GetBuffer.argtypes = [py_object, POINTER (_Py_buffer), c_int]
+_PyBuffer_Release = pythonapi.PyBuffer_Release
+_PyBuffer_Release.argtypes = [POINTER (_Py_buffer)]
+
+def _Iov (Parts, Writable = False):
+    """
+    Internal function : Builds an iovec array pointing at the memory of each part. Nothing is copied.
+    @param Parts: a list of str, bytearray, memoryview, array or ctypes instances. 
+    @param Writable: the parts will be written to (receive, reply buffers)
+    @return a tuple with the iovec array and the views to be released by _Release. 
+
+    The parts must not be resized until the views are released. 
+    """
+    Iov   = (iovec * len (Parts)) ()
+    Views = []
+    try:
+	for Index, Part in enumerate (Parts):
+	    if hasattr (Part, "_b_needsfree_"):		# ctypes instance
+		Iov [Index].iov_base = addressof (Part)
+		Iov [Index].iov_len  = sizeof (Part)
+		continue
+	    View = _Py_buffer ()
+	    try:
+		_PyObject_GetBuffer (Part, View, Writable and _PyBUF_WRITABLE)
+	    except TypeError:
+		# old style buffer only (python2 array, mmap) 
+		Base, Len = c_void_p (), c_ssize_t ()
+		if Writable: pythonapi.PyObject_AsWriteBuffer (py_object (Part), byref (Base), byref (Len))
+		else: pythonapi.PyObject_AsReadBuffer (py_object (Part), byref (Base), byref (Len))
+		Iov [Index].iov_base = Base.value
+		Iov [Index].iov_len  = Len.value
+		continue
+	    Views.append (View)
+	    Iov [Index].iov_base = View.buf
+	    Iov [Index].iov_len  = View.len
+    except:
+	_Release (Views)
+	raise
+    return (Iov, Views)
+
+def _Release (Views):
+    """
+    Internal function : Releases the views taken by _Iov.
+    """
+    for View in Views: _PyBuffer_Release (View)
+
+
+# code, sigval.sival_int and scoid of a received pulse_t, read without building one.
+_PulseFields = struct.Struct ("=%dxb%dxi%dxi" % (pulse_t.code.offset,
+		pulse_t.sigval.offset - pulse_t.code.offset - 1,
+		pulse_t.scoid.offset - pulse_t.sigval.offset - 4))
+
+
+class MessageStream (object):
+    """
+    A received message too large for the receive buffer, read in chunks with MsgRead at
+    increasing offsets rather than all at once. See Message.MsgReceive (Stream).
+    Memory used is the chunk size, whatever the message length. The data is raw, no codec
+    is applied. Read it before replying, the client's message is gone after the reply.
+
+    e.g.
+	for Chunk in Server.RxData: Hash.update (Chunk)
+	Server.RxData.ReadInto (open ("upload", "wb"))
+    """
+    def __init__ (self, Server, Rcvid, Length, Head, Chunk = 64 * 1024):
+	self.Server = Server
+	self.Rcvid  = Rcvid
+	self.Length = Length	#: of the whole message
+	self.Offset = 0		#: read so far
+	self.Chunk  = Chunk
+	self._Head  = Head	# what MsgReceive received, returned first
+
+    def __len__ (self):
+	return self.Length
+
+    def __iter__ (self):
+	return self.Chunks ()
+
+    def Chunks (self, Size = None, View = False):
+	"""
+	Generator, the rest of the message in chunks of at most Size bytes.
+	@param View: Yield memoryviews of one reused buffer rather than str copies, 
+	each is valid until the next is read.
+	@raise OSError if a MsgRead fails (the client has gone etc.)
+	"""
+	Size = Size or self.Chunk
+	while self.Offset < len (self._Head):
+	    Data = self._Head [self.Offset:self.Offset + Size]
+	    self.Offset += len (Data)
+	    yield Data
+	if self.Offset >= self.Length: return
+
+	Buffers = Pool ()
+	Buffer = Buffers.Get (Size)
+	try:
+	    while self.Offset < self.Length:
+		Len = self.Server.MsgRead (self.Rcvid, Buffer, min (Size, self.Length - self.Offset),
+					   self.Offset)
+		if Len == -1:
+		    Error = get_errno ()
+		    raise OSError (Error, "MsgRead at %d: %s" % (self.Offset, os.strerror (Error)))
+		if Len == 0: break
+		self.Offset += Len
+		yield memoryview (Buffer) [:Len] if View else string_at (Buffer, Len)
+	finally:
+	    Buffers.Put (Buffer)
+
+    def Read (self, Size = None):
+	"""
+	@return the next chunk (at most Size bytes) as a str, "" at the end.
+	"""
+	for Data in self.Chunks (Size):
+	    return Data
+	return ""
+
+    def ReadInto (self, Target, Size = None):
+	"""
+	Read the rest of the message into Target, a file (anything with write ()) or a 
+	function called as Target (Data, Offset) for each chunk (a memoryview, valid during the call).
+	@return the number of bytes read.
+	"""
+	Start = self.Offset
+	Write = getattr (Target, 'write', None)
+	for Data in self.Chunks (Size, View = True):
+	    if Write: Write (Data)
+	    else: Target (Data, self.Offset - len (Data))
+	return self.Offset - Start
+
+    def __repr__ (self):
+	return "<MessageStream rcvid %d %d of %d bytes>" % (self.Rcvid, self.Offset, self.Length)
+
+
+class _Defer (object):
+    def __repr__ (self):
+	return "DEFER"
+
+DEFER = _Defer ()	#: returned by a server Function that will reply later, see Message.Defer
+
+
+class PendingReply (object):
+    """
+    A message held for a later reply (Message.Defer).
+    """
+    __slots__ = ('Rcvid', 'Scoid', 'Codec', 'Context', 'OnCancel', 'Time')
+
+    def __init__ (self, Rcvid, Scoid, Codec, Context, OnCancel):
+	self.Rcvid    = Rcvid
+	self.Scoid    = Scoid		#: the client connection, for the disconnect pulse
+	self.Codec    = Codec		#: the reply codec, that of the message
+	self.Context  = Context
+	self.OnCancel = OnCancel
+	self.Time     = time.time ()	#: when it was deferred
+
+    def __repr__ (self):
+	return "<PendingReply rcvid %d scoid %d %.3fs>" % (self.Rcvid, self.Scoid, time.time () - self.Time)
+
+
 ##########################################################
 
 class Message (Connect):
     """ 
     Class provides support for Send, Receive and Reply Functions.
-    - MsgSend
-    - MsgReceive
-    - MsgReply
+    - MsgSend,    MsgSendv
+    - MsgReceive, MsgReceivev
+    - MsgReply,   MsgReplyv
     - MsgInfo
     - MsgError
 
+    The 'v' (vectored) functions take lists of buffers - str, bytearray, memoryview, array
+    or ctypes instances - and pass their addresses to the kernel. Nothing is pickled or copied. 
+
+    When not in RawMode the data is converted by a codec (see PyQNX6.Codec), chosen per instance 
+    or per call by name, id or instance. Received data is decoded with the codec named in its header, 
+    and replies use the codec of the message being replied to. 
+    Further codecs are registered with Message.AddCodec().
+
+    Typed messages (see PyQNX6.Schema) are sent and replied as their C layout. Received
+    messages whose type is in the instance Types table are decoded to MessageType instances.
+
+    The receive / reply buffer comes from the thread's BufferPool. A buffer grown past Retain bytes
+    for a large message is given back at the next send or receive, rather than kept by the instance.
+
     """
     rcvid = None
     info  = msg_info_t()
+    Codecs = {}		# codec id -> codec
+    CodecNames = {}	# codec name -> codec
+    Retain = 64 * 1024	# largest buffer kept between messages
+
+    _MsgSend         = Libc ("MsgSend")
+    _MsgSendv        = Libc ("MsgSendv")
+    _MsgReceive      = Libc ("MsgReceive")
+    _MsgReceivev     = Libc ("MsgReceivev")
+    _MsgReply        = Libc ("MsgReply")
+    _MsgReplyv       = Libc ("MsgReplyv")
+    _MsgRead         = Libc ("MsgRead")
+    _MsgError        = Libc ("MsgError")
+    _MsgInfo         = Libc ("MsgInfo")
+    _MsgSendPulse    = Libc ("MsgSendPulse")
+    _MsgDeliverEvent = Libc ("MsgDeliverEvent")
     
-    def __init__ (self, Name = None, Attach = True, Global = False, RawMode = True):
+    def __init__ (self, Name = None, Attach = True, Global = False, RawMode = True, ViewMode = False,
+			CodecName = "pickle0", Types = None, StreamMode = False):
 	"""
 	Instansiate the Message class.
 	Set globals to default values. 
@@ -264,6 +567,12 @@ class Message (Connect):
 	@param Attach: Attach or Open the Name.
 	@param Global: the Name is Global or Local. Default (Local)
         @param RawMode: when sending & receiving use Rawdata, the default data is raw rather than pickled. 
+	@param ViewMode: raw received data is a memoryview of the receive buffer rather than a str.
+	The view is valid until the next send or receive of this instance. A buffer a view was taken
+	of is not given back to the thread's BufferPool, so no other Message can overwrite it.
+	@param CodecName: the codec (name, id or instance) used when not in raw mode.
+	@param Types: MessageType classes to decode on receipt (True for all of them). 
+	@param StreamMode: messages larger than the receive buffer are received as a MessageStream.
   
         The defaults are :
         Attach True - will try to attach else
@@ -273,19 +582,20 @@ class Message (Connect):
 	"""
 	Connect.__init__ (self)
 	self.rcvid = None
+	self.info  = msg_info_t ()	# per instance, threads each have their own
 	self._Buffer = None
 	self._BufferLen = 0
+	self._Viewed   = False		# a view of _Buffer was handed out
 	self.RawMode    = RawMode
+	self.ViewMode   = ViewMode
+	self.StreamMode = StreamMode
+	self.Codec      = CodecName
+	self.RxCodec    = None
+	self.Types      = Schema.Table (Types)
 	self.RxData     = None
-
-	self._MsgSend         = self.lib.MsgSend
-	self._MsgReceive      = self.lib.MsgReceive
-	self._MsgReply        = self.lib.MsgReply
-	self._MsgRead         = self.lib.MsgRead
-	self._MsgError        = self.lib.MsgError
-	self._MsgInfo         = self.lib.MsgInfo
-	self._MsgSendPulse    = self.lib.MsgSendPulse
-	self._MsgDeliverEvent = self.lib.MsgDeliverEvent
+	self.PulseTable = [None] * 256	# pulse code & 0xff -> handler
+	self.Deferred   = {}		# rcvid -> PendingReply, see Defer
+	self._DeferredLock = threading.Lock ()
 
 	if Name:
 	    if Attach :     # attach to a this name
@@ -294,6 +604,77 @@ class Message (Connect):
 		self.name_open (Name, Global)
 
 	
+    @classmethod
+    def AddCodec (cls, NewCodec):
+	"""
+	Register a codec, by its Id and Name. An existing codec with the same Id is replaced.
+	@param NewCodec: a PyQNX6.Codec.Codec instance
+	"""
+	if not 0 <= NewCodec.Id <= 255: raise ValueError ("Codec id must be 0..255")
+	cls.Codecs [NewCodec.Id] = NewCodec
+	cls.CodecNames [NewCodec.Name] = NewCodec
+	return NewCodec
+
+    def GetCodec (self, Name = None):
+	"""
+	@param Name: a codec name, id or instance. None for the instance codec.
+	@return the codec.
+	@raise ValueError if there is no such codec. 
+	"""
+	if Name == None: Name = self.Codec
+	if isinstance (Name, Codec.Codec): return Name
+	Result = self.CodecNames.get (Name) or self.Codecs.get (Name)
+	if Result == None: raise ValueError ("Unknown codec %r" % (Name,))
+	return Result
+
+    def _Encode (self, Data, Name = None):
+	"""
+	Internal function : Encodes Data with the codec, adding the codec header.
+	"""
+	_Codec = self.GetCodec (Name)
+	Data = _Codec.Encode (Data)
+	if not _Codec.Header: return Data
+	return Codec.Header.pack (Codec.CODEC_MAGIC, _Codec.Id, 0, len (Data)) + Data
+
+    def _Coded (self, Len):
+	"""
+	Internal function : True if the first Len bytes of the receive buffer start with a codec header.
+	Checked before the type, no MessageType has a TypeId that reads as one (see Schema).
+	"""
+	return Len >= Codec.HeaderLen and ord (self._Buffer [0]) == Codec.CODEC_MAGIC
+
+    def _Decode (self, Len):
+	"""
+	Internal function : Decodes the first Len bytes of the receive buffer.
+	The codec is taken from the header, without one it is the original pickle encoding.
+	A batch (see PyQNX6.Batch) is decoded to a Batch.Request of its entries.
+	"""
+	if Len >= Codec.HeaderLen:
+	    (Magic, Id, Flags, _Len) = Codec.Header.unpack_from (self._Buffer, 0)
+	    if Magic == Codec.CODEC_MAGIC:
+		self.RxCodec = self.Codecs.get (Id)
+		if self.RxCodec == None: raise ValueError ("Unknown codec %d" % Id)
+		if Flags & Codec.FLAG_BATCH:
+		    return Batch.Unpack (self.RxCodec, self._Buffer, Codec.HeaderLen,
+					min (_Len, Len - Codec.HeaderLen))
+		return self.RxCodec.DecodeFrom (self._Buffer, Codec.HeaderLen, 
+					min (_Len, Len - Codec.HeaderLen))
+	self.RxCodec = self.Codecs [0]
+	return self.RxCodec.Decode (self._Buffer.value [:Len])
+
+
+    def AddPulseHandler (self, Code, Function):
+	"""
+	Handle the pulses with this code in MsgReceive, they are not returned to the caller.
+	@param Code: The pulse code, a user code (0..127) or a system one (PULSE_CODE_UNBLOCK etc).
+	@param Function: Called as Function (Message, Code, Value, Scoid). None removes the handler.
+	"""
+	self.PulseTable [Code & 0xff] = Function
+
+    def RemovePulseHandler (self, Code):
+	self.PulseTable [Code & 0xff] = None
+
+
     def MsgInfo (self, Rcvid=None):
 	"""
 	MsgInfo(), wrapper.
@@ -305,58 +686,120 @@ class Message (Connect):
 	return self.info
    
  
-    def MsgSend (self, TxData, RxLen=1024, RawMode = None):
+    def MsgSend (self, TxData, RxLen=1024, RawMode = None, View = None, Copy = False, CodecName = None):
 	"""
 	MsgSend() wrapper.
 	@param TxData: Data to be transmitted to the connection Id. 
-	@param RxLen: the default rx buffer length
+	@param RxLen: the default rx buffer length, and the most reply bytes taken.
 	@param RawMode: This send and reply data will be raw of pickled. The instance setting is not changd. 
+	@param View: The raw reply is a memoryview (see MsgReceive). The instance ViewMode is the default.
+	It is the RxLen bytes of the reply buffer, cleared before the send as the kernel doesnt say
+	how long the reply was (have the server give the length in the status if it varies).
+	@param Copy: With View, RxData is a str copy of the RxLen bytes instead.
+	@param CodecName: The codec used for this message when not raw. The instance Codec is the default.
 	@return A tuple containg (The result from the MsgSend and the reply length), or (-1, 0) if error. 
 
 	Replied data is held in RxData. 
+	A MessageType instance is sent as is, a typed reply to it is decoded (by the instance Types 
+	table, else by every known type). 
 
 	Sends TxData to the Connection defined by coid.
 	If Raw then the TxData is sent as is else the data is pickled. 
         A buffer is allocated if more size is required. 
-	If specified then replied data is un-cPickle'd. 
+	If specified then replied data is decoded. 
 	
 	"""
 	if self.coid == None: return (-1, 0)
 
 	TempRaw = self.RawMode
 	if RawMode != None: TempRaw = RawMode
+	TempView = self.ViewMode
+	if View != None: TempView = View
+
+	Typed = isinstance (TxData, Schema.MessageType)
+	if Typed:
+	    TxData = TxData.Pack ()
+	    TempRaw = True
 	
-	if not TempRaw:		# pickle this
-	    TxData = cPickle.dumps (TxData)
+	if not TempRaw:		# encode this
+	    TxData = self._Encode (TxData, CodecName)
 	elif type (TxData) != str :
 	    TxData = repr (TxData)
 
 	_Len     = len (TxData)
-	if RxLen > self._BufferLen:
+	if RxLen > self._BufferLen or self._BufferLen > max (RxLen, self.Retain):
 	    self._AllocRxBuffer (RxLen)
 
-	if TempRaw:	# clear the reply buffer if raw reply. 
-	    self._Buffer = (c_char *RxLen) () 
+	if TempRaw:	# clear the reply buffer if raw reply, a short reply leaves no stale bytes
+	    memset (self._Buffer, 0, RxLen)
         Result = self._MsgSend (self.coid, 
 	           c_char_p (TxData), _Len,
 		   self._Buffer, 
-		   self._BufferLen)
+		   RxLen)
 	
 	self.RxData = None
 	if (Result != -1):
+	    if Typed:
+		if self._Coded (RxLen): TempRaw = False		# a coded reply, not a typed one
+		else:
+		    self.RxData = Schema.Decode (self._Buffer, self.Types or None, RxLen)
+		    if self.RxData != None: return (Result, self.RxData.Size)
+
 	    if TempRaw == False:
-		self.RxData = cPickle.loads (self._Buffer.value)
+		self.RxData = self._Decode (RxLen)
 		return (Result, 1) # is always 1
 
+	    if TempView:
+		self.RxData = self._View (RxLen, Copy)
+		return (Result, len (self.RxData))
+
 	    if type (self._Buffer.value) != str :		
 		self.RxData = repr (self._Buffer.value)
 	    else:
-		self.RxData = self._Buffer [:self._BufferLen] #.value
+		self.RxData = self._Buffer [:RxLen] #.value
 	    return (Result, len (self.RxData))
 	else:
 	    return (Result, 0)
 
 
+    def Batch (self, CodecName = None, RxLen = 64 * 1024, MaxBytes = None, ReplyBytes = None):
+	"""
+	Start a batch of calls, sent as one message. See PyQNX6.Batch.
+	@param CodecName: The codec for the calls, by default the instance codec.
+	@param RxLen: The reply buffer, calls whose replies dont fit are sent again in another message.
+	@param MaxBytes: The calls are sent when they reach this size, by default RxLen.
+	@param ReplyBytes: The expected reply size of a call, the calls are sent before their replies overflow RxLen.
+	@return the Batch, use it in a with statement, its Call () adds a call.
+	"""
+	return Batch.Batch (self, CodecName, RxLen, MaxBytes, ReplyBytes)
+
+    batch = Batch
+
+
+    def MsgSendv (self, TxParts, RxParts = []):
+	"""
+	MsgSendv() wrapper. Sends the parts as one message, replied data is scattered into RxParts. 
+	@param TxParts: A list of buffers (str, bytearray, memoryview, array, ctypes) sent one after the other.
+	@param RxParts: A list of writable buffers for the reply.
+	@return The result from the MsgSendv, or -1 if error. 
+
+	e.g. a header structure and a frame, without joining them :
+	    Client.MsgSendv ([Header, Frame], [ReplyHeader])
+	"""
+	if self.coid == None: return -1
+
+	(Tx, TxViews) = _Iov (TxParts)
+	try:
+	    (Rx, RxViews) = _Iov (RxParts, Writable = True)
+	    try:
+		Result = self._MsgSendv (self.coid, Tx, len (TxParts), Rx, len (RxParts))
+	    finally:
+		_Release (RxViews)
+	finally:
+	    _Release (TxViews)
+	return Result
+
+
     def MsgSendPulse (self, Coid=None, Priority=10, Code=0, Value=0):
 	"""
 	MsgSendPulse() wrapper.
@@ -392,29 +835,49 @@ class Message (Connect):
 	return self._MsgDeliverEvent (Rcvid, pointer(Sigevent))
 
 
-    def MsgReceive (self, RxLen= 1024, RawMode = None):
+    def MsgReceive (self, RxLen= 1024, RawMode = None, View = None, Copy = False, Stream = None):
 	"""
 	MsgReceive () wrapper. Perfoms a MsgReceive using the channelid. 
 
 	@param RxLen: The default Rx buffer length.
 	@param RawMode: The received data is raw or pickled and converted as necessary. 
+	@param View: Raw data is a memoryview of the receive buffer. The instance ViewMode is the default. 
+	@param Copy: With View, RxData is a str copy of the message instead. 
+	@param Stream: A message larger than the buffer is not read whole, RxData is a MessageStream
+	of it and its length is returned. The instance StreamMode is the default.
 	@return A tuple with the (rcvid and the length of the received data)
  
 	A persistant receive buffer is allocated. If the receive buffer size is exceeded
-	then a new buffer is allocated and a MsgRead performed.
+	then a new buffer is allocated and a MsgRead performed (unless streaming).
 	If a pulse   is received: a tuple with rcvid and the pulse is returned.
-	If a message is received: a tuple with rcvid and the un-cPickle'd data LENGTH is returned
+	Pulses with a handler (see AddPulseHandler) are handled here and not returned.
+	If a message is received: a tuple with rcvid and the decoded data LENGTH is returned
 	Use self.RxData to process the received data.
+	Messages with a type in the Types table are decoded to their MessageType class.
+
+	In View mode RxData is exactly the message length, binary data (NULs) included.
+	The view is over the receive buffer and is only valid until the next receive, 
+	use Copy=True (or RxData.tobytes()) to keep it. 
 
 	@raise If There is no chid
 	"""
 
 	if self.chid == None: raise "No chid to receive from."
-	if RxLen > self._BufferLen: self._AllocRxBuffer (RxLen)
+	if RxLen > self._BufferLen or self._BufferLen > max (RxLen, self.Retain):
+	    self._AllocRxBuffer (RxLen)
 	
 	self.rcvid = self._MsgReceive (self.chid, self._Buffer,
 	                      int (self._BufferLen), byref (self.info))
 
+	while self.rcvid == 0:
+	    (Code, Value, Scoid) = _PulseFields.unpack_from (self._Buffer)
+	    if not (self.Deferred and self._PendingPulse (Code, Value, Scoid)):
+		Handler = self.PulseTable [Code & 0xff]
+		if Handler == None: break
+		Handler (self, Code, Value, Scoid)
+	    self.rcvid = self._MsgReceive (self.chid, self._Buffer,
+	                      int (self._BufferLen), byref (self.info))
+
 	if self.rcvid == 0:
 	    # We have a pulse. Cast it then return. 
 	    # NB we must add code that will cleanup after a system pulse. 
@@ -423,17 +886,33 @@ class Message (Connect):
 	    return (self.rcvid, self.pulse)
 
 	if self._BufferLen < self.info.srcmsglen:
+	    if (self.StreamMode if Stream == None else Stream) and self.rcvid > 0:
+		self.RxData = MessageStream (self, self.rcvid, self.info.srcmsglen,
+				string_at (self._Buffer, min (self.info.msglen, self._BufferLen)))
+		return (self.rcvid, self.info.srcmsglen)
 	    self._AllocRxBuffer (self.info.srcmsglen)
 	    self.MsgRead (self.rcvid, self._Buffer, int (self.info.srcmsglen), 0)
 
 	if (self.rcvid >= 0): # and (self._BufferLen > 0):
+	    _Len = min (self.info.srcmsglen, self._BufferLen)
+	    if self.Types and not self._Coded (_Len):
+		self.RxData = Schema.Decode (self._Buffer, self.Types, _Len)
+		if self.RxData != None: return (self.rcvid, _Len)
+
 	    TempRaw = self.RawMode
 	    if RawMode != None: TempRaw = RawMode
 
 	    if not TempRaw:
-		self.RxData = cPickle.loads (self._Buffer.value [:self.info.srcmsglen])
+		self.RxData = self._Decode (min (self.info.srcmsglen, self._BufferLen))
 		return (self.rcvid, 1)
 
+	    TempView = self.ViewMode
+	    if View != None: TempView = View
+	    if TempView:
+		_Len = min (self.info.srcmsglen, self._BufferLen)
+		self.RxData = self._View (_Len, Copy)
+		return (self.rcvid, _Len)
+
 	    TempData = self._Buffer.value [:self.info.srcmsglen]
 	    if type (TempData) != str: 
 		self.RxData = repr (TempData)
@@ -444,15 +923,57 @@ class Message (Connect):
 	return (self.rcvid , None)
 
 
+    def MsgReceivev (self, RxParts):
+	"""
+	MsgReceivev () wrapper. Receives the message directly into the RxParts buffers.
+	@param RxParts: A list of writable buffers (bytearray, memoryview, array, ctypes) filled one after the other.
+	@return A tuple with the (rcvid and the length of the received data)
+
+	If a pulse is received: a tuple with rcvid (0) and the pulse is returned. The first part
+	must be large enough to hold a pulse_t.
+	self.info.srcmsglen holds the length sent, MsgRead will fetch any data that didnt fit.
+
+	@raise If There is no chid
+	"""
+	if self.chid == None: raise "No chid to receive from."
+
+	(Rx, Views) = _Iov (RxParts, Writable = True)
+	try:
+	    self.rcvid = self._MsgReceivev (self.chid, Rx, len (RxParts), byref (self.info))
+	finally:
+	    _Release (Views)
+
+	if self.rcvid == 0:
+	    self.pulse = pulse_t ()
+	    memmove (byref (self.pulse), Rx [0].iov_base, sizeof (pulse_t))
+	    self.RxData = self.pulse
+	    return (self.rcvid, self.pulse)
+
+	if self.rcvid == -1: return (self.rcvid, None)
+	return (self.rcvid, self.info.msglen)
+
+
     def _AllocRxBuffer (self, Len):
 	"""
-	Internal function : Allocates/Reallocates a buffer for message handling
+	Internal function : Allocates/Reallocates a buffer for message handling.
+	The buffer comes from the thread's BufferPool, the old one goes back to it.
 	"""
-	if self._Buffer: del (self._Buffer)
-	self._Buffer = create_string_buffer (Len) # andy (c_char *Len) ()
-	self._BufferLen = Len
+	Buffers = Pool ()
+	if self._Buffer is not None and not self._Viewed: Buffers.Put (self._Buffer)
+	self._Viewed = False
+	self._Buffer = Buffers.Get (Len)
+	self._BufferLen = sizeof (self._Buffer)
 	
 
+    def _View (self, Len, Copy = False):
+	"""
+	Internal function : The first Len bytes of the receive buffer, as a memoryview or a str copy.
+	"""
+	if Copy: return string_at (self._Buffer, Len)
+	self._Viewed = True
+	return memoryview (self._Buffer) [:Len]
+
+
     #def GetRxData (self):
 	"""
 	Helper function. Used after a MsgSend call, this will return the 
@@ -464,14 +985,18 @@ class Message (Connect):
 	#    return (None, 0)
 
 
-    def MsgReply (self, Status, Data=None, Rcvid = None, RawMode = None, Len=None):
+    def MsgReply (self, Status, Data=None, Rcvid = None, RawMode = None, Len=None, CodecName = None):
 	"""
-	MsgReply() wrapper. Performs a MsgReply. cPickles the data and replies with the status and data.
+	MsgReply() wrapper. Performs a MsgReply. Encodes the data and replies with the status and data.
 	@param Status: The statis integer value to return to the caller. 
 	@param Data: The data to reply with
 	@param Rcvid: The receiveId to reply to. (optional) 
-	@param RawMode: Reply with the data or pickle it then reply.
+	@param RawMode: Reply with the data or encode it then reply.
 	@param Len: Reply with only len bytes. 
+	@param CodecName: The codec for the reply, by default the one the message was received with.
+	A MessageType instance (or a Batch.Reply) is always replied as is.
+	A deferred message (see Defer) is removed from the Deferred table, MsgReply may be called
+	from any thread for it.
 
 	@return the result of the MsgReply call. See QNX docs. 
 	"""
@@ -485,9 +1010,15 @@ class Message (Connect):
 	
 	TempRaw = self.RawMode
 	if RawMode != None: TempRaw = RawMode
+	if isinstance (Data, (Schema.MessageType, Batch.Reply)):
+	    Data = Data.Pack ()
+	    TempRaw = True
 	
+	if Rcvid == None:  Rcvid = self.rcvid
+	Entry = self._Take (Rcvid)
 	if not TempRaw:
-	    Data = cPickle.dumps (Data)
+	    if CodecName == None: CodecName = Entry.Codec if Entry else self.RxCodec
+	    Data = self._Encode (Data, CodecName)
 	    _Len = len (Data)
 	else:
 	    if hasattr (Data, "_fields_"):
@@ -497,12 +1028,10 @@ class Message (Connect):
 	     	if type (Data) != str:
 		    Data = repr (Data)
 		    _Len = _GetLen (Len, len (Data)) 
-		    print "replyStr: len=", _Len
 		else:
 		    _Len = _GetLen (Len, len (Data))	
 	    #if Len != None:  _Len = len
 
-	if Rcvid == None:  Rcvid = self.rcvid
 	#print "msgreplying- %d %d len=%d \'%s\'" % (Rcvid, Status, _Len, repr (Data)) 
 	_Result    = self._MsgReply (int (Rcvid),
 	                       int (Status),
@@ -512,6 +1041,26 @@ class Message (Connect):
 	return _Result
 
 
+    def MsgReplyv (self, Status, TxParts = [], Rcvid = None):
+	"""
+	MsgReplyv() wrapper. Replies with the status and the parts, as one reply.
+	@param Status: The status integer value to return to the caller. 
+	@param TxParts: A list of buffers (str, bytearray, memoryview, array, ctypes)
+	@param Rcvid: The receiveId to reply to. (optional) 
+
+	@return the result of the MsgReplyv call. See QNX docs. 
+	"""
+	if Rcvid == None:  Rcvid = self.rcvid
+	self._Take (Rcvid)
+
+	(Tx, Views) = _Iov (TxParts)
+	try:
+	    _Result = self._MsgReplyv (int (Rcvid), int (Status), Tx, len (TxParts))
+	finally:
+	    _Release (Views)
+	return _Result
+
+
     def MsgError (self, Error, Rcvid = None):
 	"""
 	MsgError() wrapper. Returns a MsgError to the rcvid.
@@ -522,8 +1071,84 @@ class Message (Connect):
 
 	"""
 	if Rcvid == None:  Rcvid = self.rcvid
+	self._Take (Rcvid)
 	Result    = self._MsgError (int(Rcvid), int (Error))
 			    
 	return Result
 
 
+    ######## deferred replies
+
+    def Defer (self, Rcvid = None, Context = None, OnCancel = None):
+	"""
+	Hold the message just received, to be replied later from any thread (a timer, a pulse 
+	handler, another service's reply) with MsgReply, MsgReplyv or MsgError and its Rcvid.
+	The receive thread is free to receive more meanwhile.
+	e.g.
+	    def Handler (Server, Rcvid, Data):
+		Device.Start (Data, Done = lambda Result: Server.MsgReply (0, Result, Rcvid = Rcvid))
+		return Server.Defer (Rcvid)
+
+	If the client unblocks (_PULSE_CODE_UNBLOCK) it is replied EINTR, if it disconnects the
+	entry is dropped, in both cases OnCancel (Entry, Error) is called. The unblock pulse of a 
+	deferred message is then consumed by MsgReceive, a disconnect pulse is handled or returned 
+	as usual (ConnectDetach its scoid).
+	@param Context: Kept with the entry, Deferred [Rcvid].Context.
+	@return DEFER, for the Function to return so the server doesnt reply.
+	"""
+	if Rcvid == None: Rcvid = self.rcvid
+	Entry = PendingReply (Rcvid, self.info.scoid, self.RxCodec, Context, OnCancel)
+	with self._DeferredLock:
+	    self.Deferred [Rcvid] = Entry
+	return DEFER
+
+    def _Take (self, Rcvid):
+	"""
+	Internal function : Remove a deferred reply from the table.
+	@return its PendingReply, or None if it wasnt deferred.
+	"""
+	if not self.Deferred: return None
+	with self._DeferredLock:
+	    return self.Deferred.pop (Rcvid, None)
+
+    def _Cancel (self, Entries, Error):
+	for Entry in Entries:
+	    if Entry.OnCancel:
+		try: Entry.OnCancel (Entry, Error)
+		except Exception: traceback.print_exc ()
+
+    def _PendingPulse (self, Code, Value, Scoid):
+	"""
+	Internal function : Clean up the deferred replies of a client that unblocks or has gone.
+	@return True if the pulse was the unblock of a deferred message, it is consumed.
+	"""
+	if Code == PULSE_CODE_UNBLOCK:
+	    Entry = self._Take (Value)		# the value is the rcvid
+	    if Entry == None: return False
+	    self._MsgError (Entry.Rcvid, errno.EINTR)
+	    self._Cancel ([Entry], errno.EINTR)
+	    return True
+	if Code == PULSE_CODE_DISCONNECT:
+	    with self._DeferredLock:
+		Entries = [Entry for Entry in self.Deferred.values () if Entry.Scoid == Scoid]
+		for Entry in Entries: del self.Deferred [Entry.Rcvid]
+	    self._Cancel (Entries, errno.ENOTCONN)
+	return False
+
+    def ExpireDeferred (self, Age, Error = errno.ETIMEDOUT):
+	"""
+	Reply Error to the messages deferred more than Age seconds ago (their OnCancel is called).
+	@return how many there were.
+	"""
+	Limit = time.time () - Age
+	with self._DeferredLock:
+	    Entries = [Entry for Entry in self.Deferred.values () if Entry.Time < Limit]
+	    for Entry in Entries: del self.Deferred [Entry.Rcvid]
+	for Entry in Entries: self._MsgError (Entry.Rcvid, Error)
+	self._Cancel (Entries, Error)
+	return len (Entries)
+
+
+for _Codec in (Codec.Pickle0Codec (), Codec.PickleCodec (), 
+		Codec.MarshalCodec (), Codec.BytesCodec ()):
+    Message.AddCodec (_Codec)
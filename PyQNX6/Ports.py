@@ -0,0 +1,154 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Batched x86 port I/O. One call reads or writes a block, rather than one
+Portio call per byte or word.
+
+    - in8s, in16s, in32s (Port, Count)   Count reads of one port (e.g. a FIFO),
+					  into a bytearray / array('H') / array of 32 bit.
+    - out8s, out16s, out32s (Port, Data) write the whole buffer to one port.
+    - inv, outv (Ports, ...)             one read or write of each of a list of ports.
+					  Not batched, there is one libc call per port.
+
+The repeated forms use the QNX libc in8s() .. out32s(), the thread is given
+I/O privilege (ThreadCtl) when first used. Off target the PyQNX6.Linux
+stand-in provides simulated ports (see PyQNX6.Linux.AttachPort).
+
+e.g. drain a 512 byte FIFO :
+    Data = Ports.in8s (0x3f8, 512)
+'''
+import sys, os, threading
+from array import array
+
+from ctypes import *
+
+from PyQNX6 import Bind
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+_NTO_TCTL_IO = 1
+
+# a 32 bit array type code
+_Array32 = [Code for Code in ('I', 'L') if array (Code).itemsize == 4] [0]
+
+_Types = {1: 'B', 2: 'H', 4: _Array32}	# width -> array type code
+
+# width -> the libc function, see PyQNX6.core.Bind
+_In  = {1: "in8s",  2: "in16s",  4: "in32s"}
+_Out = {1: "out8s", 2: "out16s", 4: "out32s"}
+
+_local = threading.local ()
+
+def _Privilege ():
+    """
+    Port I/O needs the I/O privilege, it is per thread.
+    """
+    if not getattr (_local, 'io', False):
+	Bind ("ThreadCtl") (_NTO_TCTL_IO, 0)
+	_local.io = True
+
+
+def _Buffer (Data, Width, Writable = False):
+    """
+    @return a ctypes array over Data (not a copy), or Data itself if it is a str.
+    A read only buffer (buffer, memoryview of a str etc.) is copied, unless Writable.
+    """
+    if isinstance (Data, str) and not Writable: return Data
+    Length = len (Data) * getattr (Data, 'itemsize', 1)
+    try: return (c_char * Length).from_buffer (Data)
+    except TypeError:
+	if Writable: raise
+	return memoryview (Data).tobytes ()
+
+
+def _Ins (Width, Port, Count, Into):
+    _Privilege ()
+    if Into == None:
+	if Count == None: raise ValueError ("in%ds: give the Count or a buffer to read Into" % (8 * Width))
+	Into = bytearray (Count) if Width == 1 else array (_Types [Width], [0]) * Count
+    Count = len (Into) * getattr (Into, 'itemsize', 1) // Width
+    if Count: Bind (_In [Width]) (_Buffer (Into, Width, True), Count, Port)
+    return Into
+
+def _Outs (Width, Port, Data):
+    _Privilege ()
+    Count = len (Data) * getattr (Data, 'itemsize', 1) // Width
+    if Count: Bind (_Out [Width]) (_Buffer (Data, Width), Count, Port)
+    return Count
+
+
+def in8s (Port, Count = None, Into = None):
+    """
+    Read Port Count times.
+    @param Into: a writable buffer (bytearray, array) to fill instead, its whole length is read.
+    @return the bytearray (or Into).
+    @raise ValueError if neither Count nor Into is given.
+    """
+    return _Ins (1, Port, Count, Into)
+
+def in16s (Port, Count = None, Into = None):
+    """
+    Read the 16 bit Port Count times.
+    @return an array ('H') (or Into).
+    """
+    return _Ins (2, Port, Count, Into)
+
+def in32s (Port, Count = None, Into = None):
+    """
+    Read the 32 bit Port Count times.
+    @return an array of 32 bit values (or Into).
+    """
+    return _Ins (4, Port, Count, Into)
+
+def out8s (Port, Data):
+    """
+    Write each byte of Data (str, bytearray, array) to Port.
+    @return the number of writes.
+    """
+    return _Outs (1, Port, Data)
+
+def out16s (Port, Data):
+    """
+    Write Data (an array ('H'), or bytes holding 16 bit values) to the 16 bit Port.
+    """
+    return _Outs (2, Port, Data)
+
+def out32s (Port, Data):
+    """
+    Write Data (an array of 32 bit values, or bytes holding them) to the 32 bit Port.
+    """
+    return _Outs (4, Port, Data)
+
+
+def inv (Ports, Width = 1):
+    """
+    Read each port of a list once.
+    This saves only the Python overhead, each port is still one libc call.
+    @return an array of the values, in the order of Ports.
+    """
+    _Privilege ()
+    Result = array (_Types [Width], [0]) * len (Ports)
+    Buffer = _Buffer (Result, Width, True)
+    In = Bind (_In [Width])
+    for Index, Port in enumerate (Ports):
+	In (byref (Buffer, Index * Width), 1, Port)
+    return Result
+
+def outv (Ports, Values, Width = 1):
+    """
+    Write Values [i] to Ports [i].
+    This saves only the Python overhead, each port is still one libc call.
+    @return the number of writes.
+    """
+    _Privilege ()
+    Data = array (_Types [Width], Values)
+    Buffer = _Buffer (Data, Width)
+    Out = Bind (_Out [Width])
+    for Index, Port in enumerate (Ports):
+	Out (byref (Buffer, Index * Width), 1, Port)
+    return len (Ports)
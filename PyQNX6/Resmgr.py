@@ -13,7 +13,9 @@ attributes and ocbs can be done using the pythn classes. There are exanmples.
 #import pdb
 
 from ctypes import *
-from PyQNX6 import (QNX, Structure, msg_info_t, pulse_t )
+from PyQNX6 import (QNX, Libc, Structure, msg_info_t, pulse_t, iovec )
+from PyQNX6.core import (PULSE_CODE_UNBLOCK, PULSE_CODE_DISCONNECT, PULSE_CODE_THREADDEATH,
+			 PULSE_CODE_COIDDEATH, PULSE_CODE_MINAVAIL, PULSE_CODE_MAXAVAIL)
 from PyQNX6.Message import Message #*
 
 import time, sys, os
@@ -43,14 +45,6 @@ class resmgr_attr_t (Structure):
 	self.other_func = None
 
 
-class iovec (Structure):
-    """
-    QNX - iovec structure. 
-    """
-    _fields_ = [('iov_base', c_void_p),
-                ('iov_len', c_int)]
-
-
 """ 
 QNX - POSIX message structures
 """
@@ -319,13 +313,16 @@ class Resmgr (Message) : #QNX):
  
     """    
     _RESMGR_NOREPLY = 0x080000000L
-    _PULSE_CODE_UNBLOCK = -32
-    _PULSE_CODE_DISCONNECT = -33
-    _PULSE_CODE_THREADDEATH = -34
-    _PULSE_CODE_COIDDEATH = -35
+    _PULSE_CODE_UNBLOCK = PULSE_CODE_UNBLOCK
+    _PULSE_CODE_DISCONNECT = PULSE_CODE_DISCONNECT
+    _PULSE_CODE_THREADDEATH = PULSE_CODE_THREADDEATH
+    _PULSE_CODE_COIDDEATH = PULSE_CODE_COIDDEATH
     
-    _PULSE_CODE_MINAVAIL  = 0
-    _PULSE_CODE_MAXAVAIL = 127
+    _PULSE_CODE_MINAVAIL  = PULSE_CODE_MINAVAIL
+    _PULSE_CODE_MAXAVAIL = PULSE_CODE_MAXAVAIL
+
+    _iofunc_stat = Libc ("iofunc_stat")
+    _ThreadCtl   = Libc ("ThreadCtl")
 
     _io_offset = {'read':   0x1,   'write': 0x2,       'close_ocb': 0x3,
                  'stat':    0x4,   'notify': 0x5,      'devctl': 0x6,
@@ -360,8 +357,6 @@ class Resmgr (Message) : #QNX):
 	"""
 
 	Message.__init__(self)
-    
-	self._iofunc_stat = self.lib.iofunc_stat
 	    
 	# use the atribute provided (may be larger) or the default. 
 	if Attr == None: Attr = iofunc_attr_t ()
@@ -383,7 +378,7 @@ class Resmgr (Message) : #QNX):
 
 	# for use in message passing/replying to the client. 
 
-	self.lib.ThreadCtl (1, 0)	# allow permissions! 
+	self._ThreadCtl (1, 0)	# allow permissions! 
 	self.Verbose    = Verbose
 	self.DeviceName = Name 
 	self.Flags      = Flags	
@@ -0,0 +1,207 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Typed, fixed layout messages.
+
+A MessageType subclass declares its fields with ctypes types, as a Structure
+does. When the class is created the fields are laid out as a C compiler would
+(a ctypes Structure does the layout) and compiled into one struct.Struct, so
+packing and unpacking is a single call and matches C peers byte for byte.
+
+Every message starts with a 16 bit 'type', as QNX messages do. It holds the
+class TypeId, which is used to find the class of a received message.
+User message types should be above _IO_MAX (0x1ff). A TypeId whose first byte
+is the codec header magic (0xc5, see Codec) is refused, so a coded
+message is never taken for a typed one.
+
+e.g.
+    class Position (MessageType):
+	TypeId = 0x200
+	_fields_ = [('x', c_int32), ('y', c_int32), ('name', c_char*16)]
+
+    Client.MsgSend (Position (1, 2, name="here"))
+    QNXServer ("gps", Handler, Types=[Position])  # Handler gets Position instances
+'''
+import struct, operator
+
+from ctypes import *
+
+from PyQNX6.Codec import CODEC_MAGIC
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+MessageTypes = {}	#: TypeId -> MessageType class, every compiled type.
+
+TypeHeader = struct.Struct ('=H')	#: the leading type field
+
+_Signed   = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+_Unsigned = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+def _Format (Type):
+    """
+    @return a tuple with the struct format for a ctypes field type and the number of values it holds.
+    @raise TypeError for types that cant be sent (pointers etc.)
+    """
+    if issubclass (Type, Array):
+	if Type._type_ is c_char: return ("%ds" % Type._length_, 1)
+	return ("%d%s" % (Type._length_, _Format (Type._type_) [0]), Type._length_)
+
+    Code = getattr (Type, "_type_", None)
+    if Code in ('b', 'h', 'i', 'l', 'q'): return (_Signed [sizeof (Type)], 1)
+    if Code in ('B', 'H', 'I', 'L', 'Q'): return (_Unsigned [sizeof (Type)], 1)
+    if Code in ('f', 'd', 'c', '?'): return (Code, 1)
+    raise TypeError ("%s can not be used in a message" % Type.__name__)
+
+def _Default (Type):
+    if issubclass (Type, Array):
+	if Type._type_ is c_char: return ""
+	return (_Default (Type._type_),) * Type._length_
+    if Type._type_ == 'c': return "\0"
+    if Type._type_ in ('f', 'd'): return 0.0
+    return 0
+
+
+def _Functions (cls):
+    """
+    Generate the Pack and Unpack functions for a laid out class, for speed there is no
+    loop over the fields. Strings (c_char arrays) end at the first NUL, as in ctypes.
+    Other arrays are tuples, whatever their length.
+    """
+    Args, Values, Index = [], [], 1
+    for Name, Count, Type in zip (cls.Names, cls._Counts, [Field [1] for Field in cls._fields_]):
+	if issubclass (Type, Array) and Type._type_ is not c_char:
+	    Args.append ("tuple (self.%s)" % Name)
+	    Values.append ("%r: V[%d:%d]" % (Name, Index, Index + Count))
+	else:
+	    Args.append ("(self.%s,)" % Name)
+	    if issubclass (Type, Array):
+		Values.append ("%r: V[%d].partition ('\\0') [0]" % (Name, Index))
+	    else:
+		Values.append ("%r: V[%d]" % (Name, Index))
+	Index += Count
+
+    Source = ("def Pack (self):\n"
+	      "    return _pack (*((_TypeId,) + %s))\n"
+	      "def Unpack (cls, Buffer, Offset = 0):\n"
+	      "    V = _unpack (Buffer, Offset)\n"
+	      "    Self = _new (cls)\n"
+	      "    Self.__dict__ = {%s}\n"
+	      "    return Self\n") % (" + ".join (Args) or "()", ", ".join (Values))
+    Namespace = {'_pack': cls._Struct.pack, '_unpack': cls._Struct.unpack_from, 
+		 '_new': object.__new__, '_TypeId': cls.TypeId}
+    exec Source in Namespace
+    return (Namespace ['Pack'], Namespace ['Unpack'])
+
+
+class _Compile (type):
+    """
+    Metaclass. Lays out and compiles a MessageType class when it is defined.
+    """
+    def __init__ (cls, Name, Bases, Dict):
+	type.__init__ (cls, Name, Bases, Dict)
+	if cls.TypeId == None: return		# a base class
+	if ord (TypeHeader.pack (cls.TypeId) [0]) == CODEC_MAGIC:
+	    raise ValueError ("%s: TypeId 0x%x would read as a codec header" % (Name, cls.TypeId))
+
+	Fields = [('type', c_uint16)] + list (cls._fields_)
+	Attrs = {'_fields_': Fields}
+	if hasattr (cls, '_pack_'): Attrs ['_pack_'] = cls._pack_
+	cls.Layout = type (Name + "_t", (Structure,), Attrs)
+
+	Format, Pos, Counts = "=", 0, []
+	for FieldName, FieldType in Fields:
+	    Offset = getattr (cls.Layout, FieldName).offset
+	    if Offset > Pos: Format += "%dx" % (Offset - Pos)
+	    (Fmt, Count) = _Format (FieldType)
+	    Format += Fmt
+	    Counts.append (Count)
+	    Pos = Offset + sizeof (FieldType)
+	if sizeof (cls.Layout) > Pos: Format += "%dx" % (sizeof (cls.Layout) - Pos)
+
+	cls._Struct   = struct.Struct (Format)
+	cls.Size      = cls._Struct.size
+	cls.Names     = [Field [0] for Field in cls._fields_]
+	cls._Counts   = Counts [1:]
+	cls._Defaults = [_Default (Field [1]) for Field in cls._fields_]
+	if cls.Names: cls._Get = operator.attrgetter (*cls.Names)
+	(Pack, Unpack) = _Functions (cls)
+	cls.Pack   = Pack
+	cls.Unpack = classmethod (Unpack)
+	MessageTypes [cls.TypeId] = cls
+
+
+class MessageType (object):
+    """
+    Base class for typed messages. See the module documentation.
+    Subclasses define TypeId and _fields_ (and optionally _pack_).
+    Instances are created with the field values, positional or by name.
+    """
+    __metaclass__ = _Compile
+    TypeId   = None
+    _fields_ = []
+
+    def __init__ (self, *Values, **Named):
+	for Name, Value in zip (self.Names, self._Defaults):
+	    setattr (self, Name, Value)
+	for Name, Value in zip (self.Names, Values):
+	    setattr (self, Name, Value)
+	for Name in Named:
+	    if Name not in self.Names: raise TypeError ("%s has no field '%s'" % (self.__class__.__name__, Name))
+	    setattr (self, Name, Named [Name])
+
+    def Values (self):
+	"""
+	@return the field values, in order.
+	"""
+	if len (self.Names) < 2: return tuple ([getattr (self, Name) for Name in self.Names])
+	return self._Get (self)
+
+    # Pack (self) and the Unpack (cls, Buffer, Offset = 0) class method are generated by
+    # the metaclass. Pack returns the message as a str, laid out as the C structure. 
+    # Unpack creates an instance straight from a buffer (str, ctypes buffer etc).
+
+    def __len__ (self):
+	return self.Size
+
+    def __eq__ (self, Other):
+	return type (self) is type (Other) and self.Values () == Other.Values ()
+
+    def __ne__ (self, Other):
+	return not self == Other
+
+    def __repr__ (self):
+	return "<%s %s>" % (self.__class__.__name__,
+		", ".join (["%s=%r" % Item for Item in zip (self.Names, self.Values ())]))
+
+
+def Table (Types):
+    """
+    Build a TypeId dispatch table.
+    @param Types: a list of MessageType classes, True for every compiled type, or None.
+    @return a dict of TypeId -> class
+    """
+    if Types == None: return {}
+    if Types is True: return MessageTypes
+    return dict ([(Type.TypeId, Type) for Type in Types])
+
+def Decode (Buffer, Types = None, Length = None):
+    """
+    Decode a message using its type field.
+    @param Buffer: The received data (str, ctypes buffer etc).
+    @param Types: The dispatch table (see Table), by default every compiled type.
+    @param Length: The length of the message, if less than the buffer.
+    @return the MessageType instance, or None if the type is unknown or the message too short.
+    """
+    if Types == None: Types = MessageTypes
+    if Length == None: Length = len (Buffer)
+    if Length < TypeHeader.size: return None
+    Type = Types.get (TypeHeader.unpack_from (Buffer, 0) [0])
+    if Type == None or Length < Type.Size: return None
+    return Type.Unpack (Buffer)
+
@@ -8,21 +8,28 @@ QNX Target Project.
 '''
 import sys, os
 
-from PyQNX6.Message  import Message  as Message
+from PyQNX6.Message  import Message  as Message, DEFER
+from PyQNX6 import Batch
 
 __version__ = '0.1'
 __author__='Andy Rhind (Symmetry Innovations)'
 
 #####################################
 
-import threading
+import threading, heapq, itertools, time, errno, traceback
+
+from ctypes import pointer
+
+from PyQNX6 import Libc, msg_info_t
 
 
 class QNXServer  (Message):
 
-    def __init__ (self, Name, Function, Global=False, RawMode=False):
+    def __init__ (self, Name, Function, Global=False, RawMode=False, ViewMode=False,
+			CodecName="pickle0", Types=None, StreamMode=False):
         Message.__init__ (self, Name, Attach=True, Global=Global, \
-			RawMode=RawMode)
+			RawMode=RawMode, ViewMode=ViewMode, CodecName=CodecName, Types=Types,
+			StreamMode=StreamMode)
 	self.Name = Name
 	self.Global = Global
 	self.RawMode = RawMode
@@ -34,51 +41,356 @@ class QNXServer  (Message):
 	Done = False
  	while (not Done):
             (Rcvid, Data) 		= self.MsgReceive ()
-	    try: ReturnStatus, Data	= self.Function (self, Rcvid, self.RxData)
-	    except (StopIteration, KeyboardInterrupt, EOFError): 
-		Done = True
-		ReturnStatus, Data = -1, None
-		print  "DONE. Server exiting."
-	    if Rcvid:
-	        Result = self.MsgReply (ReturnStatus, Data)
+	    if isinstance (self.RxData, Batch.Request):	# a Function call per entry
+		Reply = Batch.Call (self.Function, self, self, Rcvid, self.RxData)
+		Done, Result = Reply.Stop, (0, Reply)
+	    else:
+		try: Result		= self.Function (self, Rcvid, self.RxData)
+		except (StopIteration, KeyboardInterrupt, EOFError): 
+		    Done = True
+		    Result = (-1, None)
+	    if Done: print  "DONE. Server exiting."
+	    if Rcvid and Result is not DEFER:	# deferred, replied later (see Message.Defer)
+		ReturnStatus, Data = Result
+		self.MsgReply (ReturnStatus, Data)
        
 
 
 class QNXServerThreaded  (Message):
+    """
+    Threaded server. A pool of worker threads, all receive blocked on the channel,
+    modelled on the QNX thread_pool_create (). 
+    Each worker has its own Message instance (receive buffer, rcvid, msg_info_t),
+    the Function is called with the worker thread, its Message is worker.Server.
 
-    def __init__ (self, Name, Function, Global=False, RawMode=False, Start=False):
+    @param LoWater: start more workers when fewer than this are receive blocked.
+    @param Increment: how many workers to start then.
+    @param HiWater: a worker exits rather than block when this many are already blocked,
+    by default LoWater + Increment.
+    @param Maximum: the most workers there may be, None for no limit.
+
+    By default one worker waits and another is started for each message that arrives while
+    none is waiting, so concurrent requests each get a worker. 
+    """
+    _PULSE_CODE_STOP = 0x7f
+
+    def __init__ (self, Name, Function, Global=False, RawMode=False, Start=False, ViewMode=False,
+			CodecName="pickle0", Types=None, StreamMode=False,
+			LoWater=1, Increment=1, HiWater=None, Maximum=None):
         Message.__init__ (self)
 	self.Name = Name
 	self.Global = Global
 	self.RawMode = RawMode
+	self.ViewMode = ViewMode
+	self.Codec = CodecName
+	self.Types = Types
+	self.StreamMode = StreamMode
 	self.Function = Function
 	self.s = Message (self.Name, Attach=True, Global=self.Global, \
-			RawMode=self.RawMode)
+			RawMode=self.RawMode, ViewMode=ViewMode, CodecName=CodecName, Types=Types)
+
+	self.LoWater   = LoWater
+	self.Increment = Increment
+	self.Maximum   = sys.maxint if Maximum == None else max (Maximum, LoWater)
+	self.HiWater   = LoWater + Increment if HiWater == None else HiWater
+	self.Blocked   = 0	# workers waiting in MsgReceive
+	self.Total     = 0	# workers
+	self.Stopping  = False
+	self.Workers   = []
+	self._Lock     = threading.Lock ()
 	if Start: self.Start()
     
     class _Server (threading.Thread):
-        def __init__ (self, Server, Function):
+	def __init__ (self, Server, Function, Pool = None):
            threading.Thread.__init__ (self)
 	   self.Server = Server
 	   self.Function = Function
+	   self.Pool = Pool
 
         def run (self):
 	    #print "QNXServer class thread- started"
 	    Done = False
  	    while (not Done):
 	        (Rcvid, Data) 		= self.Server.MsgReceive ()
-	        try: ReturnStatus, Data	= self.Function (self, Rcvid, self.Server.RxData)
-		except (StopIteration, KeyboardInterrupt, EOFError): 
+		if self.Pool:
+		    self.Pool._Received ()
+		    if Rcvid == -1 or (Rcvid == 0 and self.Pool.Stopping):
+			self.Pool._Exit ()
+			break
+		if isinstance (self.Server.RxData, Batch.Request):
+			Reply = Batch.Call (self.Function, self, self.Server, Rcvid, self.Server.RxData)
+			Done, Result = Reply.Stop, (0, Reply)
+		else:
+		    try: Result = self.Function (self, Rcvid, self.Server.RxData)
+		    except (StopIteration, KeyboardInterrupt, EOFError): 
 			Done = True
-			ReturnStatus, Data = -1, None
+			Result = (-1, None)
+		if Done:
 			print  "DONE. server exiting."
-		if Rcvid:
-		    Result = self.Server.MsgReply (ReturnStatus, Data)
+			if self.Pool: self.Pool.Stop ()
+		if Rcvid and Result is not DEFER:
+		    ReturnStatus, Data = Result
+		    self.Server.MsgReply (ReturnStatus, Data)
+		if self.Pool and not self.Pool._Waiting (Done):
+		    break
        
-    def Start (self):
-        ThisServer = self._Server (self.s, self.Function)
+    def _Worker (self):
+	"""
+	Start a worker, with its own Message on the channel. Called with the lock held.
+	"""
+	Server = Message (RawMode=self.RawMode, ViewMode=self.ViewMode, CodecName=self.Codec,
+			  Types=self.Types, StreamMode=self.StreamMode)
+	Server.chid = self.s.chid
+	Server.PulseTable = self.PulseTable	# AddPulseHandler on the pool applies to every worker
+	Server.Deferred, Server._DeferredLock = self.Deferred, self._DeferredLock	# one table of deferred replies
+	ThisServer = self._Server (Server, self.Function, self)
+	self.Blocked += 1
+	self.Total   += 1
+	self.Workers = [Worker for Worker in self.Workers if Worker.isAlive ()] + [ThisServer]
         ThisServer.start ()
 	return ThisServer
 
+    def _Received (self):
+	"""
+	A worker has received. Start more if too few are left receive blocked.
+	"""
+	with self._Lock:
+	    self.Blocked -= 1
+	    if self.Blocked < self.LoWater and not self.Stopping:
+		for i in range (min (self.Increment, self.Maximum - self.Total)):
+		    self._Worker ()
+
+    def _Waiting (self, Done = False):
+	"""
+	A worker is about to receive again. 
+	@return False if it should exit instead, above HiWater or stopping.
+	"""
+	with self._Lock:
+	    if Done or self.Stopping or self.Blocked >= self.HiWater:
+		self.Total -= 1
+		return False
+	    self.Blocked += 1
+	    return True
+
+    def _Exit (self):
+	with self._Lock:
+	    self.Total -= 1
+
+    def Start (self):
+	"""
+	Start a worker (LoWater workers the first time).
+	@return the last worker started.
+	"""
+	with self._Lock:
+	    self.Stopping = False
+	    ThisServer = self._Worker ()
+	    while self.Total < self.LoWater:
+		ThisServer = self._Worker ()
+	return ThisServer
+
+    def Stop (self):
+	"""
+	Stop the workers. Those receive blocked are woken by a pulse.
+	"""
+	with self._Lock:
+	    self.Stopping = True
+	    Count = self.Total
+	if not self.ConnectionOk (): self.ConnectAttach (Chid=self.s.chid)
+	for i in range (Count):
+	    self.MsgSendPulse (Code=self._PULSE_CODE_STOP)
+
+    def Join (self, Timeout = None):
+	"""
+	Wait for the workers to exit.
+	"""
+	for Worker in list (self.Workers):
+	    Worker.join (Timeout)
+
+
+class _Work (object):
+    """
+    A received message (or pulse) waiting for a handler.
+    """
+    __slots__ = ('Rcvid', 'Data', 'Codec', 'Priority', 'Info', 'Time')
+
+    def __init__ (self, Rcvid, Data, Codec, Priority, Info):
+	self.Rcvid    = Rcvid
+	self.Data     = Data
+	self.Codec    = Codec
+	self.Priority = Priority
+	self.Info     = Info
+	self.Time     = time.time ()
+
+
+class QNXServerScheduled  (QNXServerThreaded):
+    """
+    Threaded server that runs the highest priority work first. One thread receives, each 
+    message (or pulse) goes on a priority heap and the handler workers take from the top, so
+    urgent messages dont queue behind a flood of bulk ones. The priority is that of the 
+    sender (msg_info_t.priority), or of the pulse.
+
+    @param Workers: The handler threads.
+    @param Reserve: A dict of Priority -> Count. Count of the workers only handle work of
+    at least Priority, so some are always free for it. e.g. {20: 1}
+    @param Aging: Seconds of waiting that count as one priority level, so low priority work
+    isnt starved. None for strict priority.
+    The remaining parameters are as QNXServerThreaded. The Function is called with the worker,
+    its Message (worker.Server) has the rcvid, info and RxData of the message.
+    Waited holds, per priority, the (count, total and longest) wait for a handler.
+    """
+    _getprio = Libc ("getprio")
+
+    def __init__ (self, Name, Function, Global=False, RawMode=False, Start=False, ViewMode=False,
+			CodecName="pickle0", Types=None, StreamMode=False,
+			Workers=4, Reserve=None, Aging=None):
+	QNXServerThreaded.__init__ (self, Name, Function, Global=Global, RawMode=RawMode, 
+			ViewMode=ViewMode, CodecName=CodecName, Types=Types, StreamMode=StreamMode,
+			LoWater=Workers, Maximum=Workers)
+	self.Reserve   = Reserve or {}
+	self.Aging     = Aging
+	self.Ready     = []	# heap of (key, sequence, _Work)
+	self.Waited    = {}	# priority -> [count, total, longest]
+	self.Receiver  = None
+	self._Sequence = itertools.count ()
+	self._Wake     = threading.Condition (self._Lock)
+	self.s.PulseTable = self.PulseTable
+	self.s.Deferred, self.s._DeferredLock = self.Deferred, self._DeferredLock
+	if Start: self.Start()
+
+    class _Handler (threading.Thread):
+	def __init__ (self, Server, Function, Pool, Minimum):
+	    threading.Thread.__init__ (self)
+	    self.Server   = Server
+	    self.Function = Function
+	    self.Pool     = Pool
+	    self.Minimum  = Minimum	# the lowest priority it handles
+	    self.daemon   = True
+
+	def run (self):
+	    while True:
+		Work = self.Pool._Take (self.Minimum)
+		if Work == None: break
+		if not self.Pool._Run (self, Work): break
+
+    def _Receive (self):
+	"""
+	The receive thread. Puts each message and pulse on the heap.
+	A message that cant be decoded is failed with EBADMSG.
+	"""
+	Server = self.s
+	while True:
+	    try:
+		(Rcvid, Len) = Server.MsgReceive (Copy = True)
+	    except Exception:		# it couldnt be decoded, fail it and receive the next
+		traceback.print_exc ()
+		if Server.rcvid > 0: Server.MsgError (errno.EBADMSG, Server.rcvid)
+		continue
+	    if Rcvid == -1 or (Rcvid == 0 and self.Stopping): break
+	    if Rcvid == 0:
+		(Data, Priority) = (Server.pulse.Copy (), self._getprio (0))
+	    else:
+		(Data, Priority) = (Server.RxData, Server.info.priority)
+	    Info = msg_info_t ()
+	    pointer (Info) [0] = Server.info
+	    Work = _Work (Rcvid, Data, Server.RxCodec, Priority, Info)
+	    Key = Work.Time / self.Aging - Priority if self.Aging else -Priority
+	    with self._Lock:
+		heapq.heappush (self.Ready, (Key, next (self._Sequence), Work))
+		self._Wake.notify_all ()
+
+    def _Take (self, Minimum):
+	"""
+	@return the most urgent work of at least the Minimum priority, waiting for it. None when stopping.
+	"""
+	with self._Lock:
+	    while not self.Stopping:
+		if self.Ready:
+		    Entry = self.Ready [0]
+		    if Entry [2].Priority < Minimum:	# a reserved worker, look past the top
+			Eligible = [Item for Item in self.Ready if Item [2].Priority >= Minimum]
+			Entry = Eligible and min (Eligible)
+		    if Entry:
+			if Entry is self.Ready [0]: heapq.heappop (self.Ready)
+			else:
+			    self.Ready.remove (Entry)
+			    heapq.heapify (self.Ready)
+			Work = Entry [2]
+			Wait = time.time () - Work.Time
+			Stats = self.Waited.setdefault (Work.Priority, [0, 0.0, 0.0])
+			Stats [0] += 1
+			Stats [1] += Wait
+			Stats [2] = max (Stats [2], Wait)
+			return Work
+		self._Wake.wait ()
+	return None
+
+    def _Run (self, Worker, Work):
+	"""
+	Run the Function for the work and reply.
+	@return False if the Function asked to stop.
+	"""
+	Server = Worker.Server
+	(Server.rcvid, Server.RxData, Server.RxCodec) = (Work.Rcvid, Work.Data, Work.Codec)
+	pointer (Server.info) [0] = Work.Info
+	Done = False
+	if isinstance (Work.Data, Batch.Request):
+	    Reply = Batch.Call (self.Function, Worker, Server, Work.Rcvid, Work.Data)
+	    Done, Result = Reply.Stop, (0, Reply)
+	else:
+	    try: Result = self.Function (Worker, Work.Rcvid, Work.Data)
+	    except (StopIteration, KeyboardInterrupt, EOFError): 
+		Done = True
+		Result = (-1, None)
+	if Work.Rcvid and Result is not DEFER:
+	    ReturnStatus, Data = Result
+	    Server.MsgReply (ReturnStatus, Data)
+	if Done:
+	    print  "DONE. server exiting."
+	    self.Stop ()
+	return not Done
+
+    def Start (self):
+	"""
+	Start the receive thread and the workers, the reserved ones first.
+	"""
+	with self._Lock:
+	    self.Stopping = False
+	    Minimums = []
+	    for Priority, Count in sorted (self.Reserve.items (), reverse = True):
+		Minimums += [Priority] * Count
+	    Minimums += [-1] * max (0, self.LoWater - len (Minimums))
+	    self.Workers = []
+	    for Minimum in Minimums:
+		Server = Message (RawMode=self.RawMode, ViewMode=self.ViewMode, CodecName=self.Codec,
+				  Types=self.Types, StreamMode=self.StreamMode)
+		Server.PulseTable = self.PulseTable
+		Server.Deferred, Server._DeferredLock = self.Deferred, self._DeferredLock
+		self.Workers.append (self._Handler (Server, self.Function, self, Minimum))
+	    self.Total = len (self.Workers)
+	for Worker in self.Workers: Worker.start ()
+	self.Receiver = threading.Thread (target = self._Receive)
+	self.Receiver.daemon = True
+	self.Receiver.start ()
+	return self.Receiver
 
+    def Stop (self):
+	"""
+	Stop receiving and handling. Messages still waiting are replied EINTR.
+	"""
+	with self._Lock:
+	    if self.Stopping: return
+	    self.Stopping = True
+	    Waiting = [Entry [2] for Entry in self.Ready]
+	    self.Ready = []
+	    self._Wake.notify_all ()
+	for Work in Waiting:
+	    if Work.Rcvid: self.s.MsgError (errno.EINTR, Work.Rcvid)
+	if not self.ConnectionOk (): self.ConnectAttach (Chid=self.s.chid)
+	self.MsgSendPulse (Code=self._PULSE_CODE_STOP)
 
+    def Join (self, Timeout = None):
+	"""
+	Wait for the receive thread and the workers to exit.
+	"""
+	if self.Receiver: self.Receiver.join (Timeout)
+	QNXServerThreaded.Join (self, Timeout)
@@ -0,0 +1,342 @@
+#!/usr/local/bin/python
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Large messages through shared memory.
+
+A SharedMemoryChannel client creates a shared memory object (shm_open) holding
+a ring of slots and hands it to the server once, when it connects. After that
+a payload is written in place into a slot and the MsgSend carries only a small
+descriptor (region, offset, length, generation). The server reads the payload
+where it lies, its reply releases the slot. A multi-megabyte frame costs a
+descriptor rather than a copy through the kernel (and through the codec).
+
+e.g. the sender :
+    Camera = SharedMemoryChannel ("camera", Slots = 4, SlotSize = 8 << 20)
+    Slot = Camera.Alloc ()
+    Grab (Slot.View)				# fill the slot in place
+    (Result, Reply) = Camera.Send (Slot, FrameLen)
+    (Result, Reply) = Camera.SendPayload (Blob)	# or copy a str / buffer into a slot
+
+the receiver :
+    Server = SharedMemoryChannel ("camera", Attach = True)
+    (Rcvid, Len) = Server.MsgReceive ()
+    Frame = Server.RxData			# a memoryview of the slot, until the reply
+    Server.MsgReply (0, "done")
+
+Other messages and pulses pass through MsgReceive as they would for a Message.
+On Linux the shared memory objects are in /dev/shm (see PyQNX6.Linux).
+'''
+import sys, os, errno, mmap, struct, threading
+
+from ctypes import *
+
+from PyQNX6 import Libc, PULSE_CODE_DISCONNECT
+from PyQNX6 import Schema
+from PyQNX6.Message import Message
+
+__version__ = '0.1'
+__author__='Andy Rhind (Symmetry Innovations)'
+
+#####################################
+
+# The region is a header followed by the slots. Each slot is a header (the generation
+# of its current use) and SlotSize bytes of payload, aligned to _ALIGN.
+
+_MAGIC  = 0x4d485351
+_ALIGN  = 64
+_Region = struct.Struct ('=III4xQ')	# magic, slots, header size, slot size
+_Slot   = struct.Struct ('=I')		# generation
+
+
+class ShmOpen (Schema.MessageType):
+    """
+    Client -> server, once. Map the named region. The reply status is the region id.
+    """
+    TypeId = 0xfe00
+    _fields_ = [('name', c_char * 64),
+		('slots', c_uint32),
+		('slotsize', c_uint64)]
+
+class ShmClose (Schema.MessageType):
+    """
+    Client -> server. Unmap the region.
+    """
+    TypeId = 0xfe01
+    _fields_ = [('region', c_uint32)]
+
+class ShmDescriptor (Schema.MessageType):
+    """
+    Client -> server. A payload of length bytes at offset in the region.
+    """
+    TypeId = 0xfe02
+    _fields_ = [('region', c_uint32),
+		('generation', c_uint32),
+		('offset', c_uint64),
+		('length', c_uint64)]
+
+_Types = [ShmOpen, ShmClose, ShmDescriptor]
+
+
+class Slot (object):
+    """
+    A slot of the ring, from Alloc. View is its payload area, writable.
+    """
+    __slots__ = ('Index', 'Offset', 'Generation', 'View', 'Busy')
+
+    def __init__ (self, Index, Offset, View):
+	self.Index      = Index
+	self.Offset     = Offset	#: of the payload, in the region
+	self.Generation = 0
+	self.View       = View
+	self.Busy       = False
+
+    def __len__ (self):
+	return len (self.View)
+
+    def __repr__ (self):
+	return "<Slot %d gen %d%s>" % (self.Index, self.Generation, " busy" if self.Busy else "")
+
+
+class _Map (object):
+    """
+    A mapped region, the shared memory object is opened and mapped as a file.
+    """
+    _shm_open   = Libc ("shm_open")
+    _shm_unlink = Libc ("shm_unlink")
+
+    def __init__ (self, Name, Size = None):
+	Flags = os.O_RDWR
+	if Size != None: Flags |= os.O_CREAT | os.O_EXCL
+	Fd = self._shm_open (Name, Flags, 0600)
+	if Fd == -1:
+	    Error = get_errno ()
+	    raise OSError (Error, "shm_open %s: %s" % (Name, os.strerror (Error)))
+	try:
+	    if Size != None: os.ftruncate (Fd, Size)
+	    else: Size = os.fstat (Fd).st_size
+	    self.Map = mmap.mmap (Fd, Size)
+	finally:
+	    os.close (Fd)
+	self.Name   = Name
+	self.Size   = Size
+	self.Buffer = (c_char * Size).from_buffer (self.Map)
+
+    def Unlink (self):
+	self._shm_unlink (self.Name)
+
+    def Close (self):
+	if self.Map != None:
+	    self.Buffer = None
+	    self.Map.close ()
+	    self.Map = None
+
+
+class SharedMemoryChannel (Message):
+    """
+    A Message whose large payloads go through a shared memory ring. See the module documentation.
+    @param Attach: True for the receiver (name_attach), False for the sender (name_open).
+    @param Slots: The number of slots in the ring (sender).
+    @param SlotSize: The largest payload (sender).
+    The remaining parameters are as Message.
+
+    The sender creates the region, the server maps it when the client connects and the object
+    is then unlinked, so nothing is left behind if either end dies. The server drops a client's
+    regions when it disconnects (a ShmClose message or the disconnect pulse).
+    """
+    _Count = 0	# regions created by this process, for unique names
+
+    def __init__ (self, Name, Attach = False, Global = False, Slots = 8, SlotSize = 1024 * 1024,
+			RawMode = True, CodecName = "pickle0", Types = None):
+	Message.__init__ (self, Name, Attach = Attach, Global = Global, RawMode = RawMode,
+			CodecName = CodecName, Types = Types)
+	self.Types = dict (self.Types)
+	self.Types.update (Schema.Table (_Types))
+	self.Region = None
+	self.Regions = {}	# receiver: region id -> (_Map, scoid)
+	self.Payload = None	# receiver: the descriptor of the last payload received
+	if Attach:
+	    self._Next = 1
+	    self.AddPulseHandler (PULSE_CODE_DISCONNECT, self._Disconnect)
+	else:
+	    self._Create (Slots, SlotSize)
+
+    ######## sender
+
+    def _Create (self, Slots, SlotSize):
+	"""
+	Create the region and give it to the server.
+	"""
+	SharedMemoryChannel._Count += 1
+	Name = "/pyqnx6.shm.%d.%d" % (os.getpid (), SharedMemoryChannel._Count)
+	SlotSize = (SlotSize + _ALIGN - 1) & ~(_ALIGN - 1)
+	self.Map = _Map (Name, _ALIGN + Slots * (_ALIGN + SlotSize))
+	try:
+	    _Region.pack_into (self.Map.Map, 0, _MAGIC, Slots, _ALIGN, SlotSize)
+	    self.Slots = []
+	    for Index in range (Slots):
+		Offset = _ALIGN + Index * (_ALIGN + SlotSize) + _ALIGN
+		View = memoryview (self.Map.Buffer) [Offset:Offset + SlotSize]
+		self.Slots.append (Slot (Index, Offset, View))
+	    self.SlotSize = SlotSize
+	    self._Next = 0
+	    self._Lock = threading.Condition ()
+	    (Result, Len) = Message.MsgSend (self, ShmOpen (Name, Slots, SlotSize))
+	    if Result == -1:
+		Error = get_errno ()
+		raise OSError (Error, "%s: server did not map %s: %s" % (self.__class__.__name__,
+				Name, os.strerror (Error)))
+	    self.Region = Result
+	finally:
+	    self.Map.Unlink ()
+
+    def Alloc (self, Length = 0, Wait = True):
+	"""
+	Take the next free slot of the ring, waiting for one if they are all in use.
+	@param Length: The payload length, for the size check.
+	@param Wait: False to return None rather than wait.
+	@return the Slot, write the payload into Slot.View.
+	@raise ValueError if Length is more than the slot size.
+	"""
+	if Length > self.SlotSize:
+	    raise ValueError ("payload of %d bytes, the slots are %d" % (Length, self.SlotSize))
+	with self._Lock:
+	    while True:
+		for Step in range (len (self.Slots)):
+		    Each = self.Slots [(self._Next + Step) % len (self.Slots)]
+		    if not Each.Busy:
+			self._Next = (Each.Index + 1) % len (self.Slots)
+			Each.Busy = True
+			Each.Generation = (Each.Generation + 1) & 0xffffffff
+			_Slot.pack_into (self.Map.Map, Each.Offset - _ALIGN, Each.Generation)
+			return Each
+		if not Wait: return None
+		self._Lock.wait ()
+
+    def Release (self, Slot):
+	"""
+	Give a slot back to the ring. Send does this when the reply arrives.
+	"""
+	with self._Lock:
+	    Slot.Busy = False
+	    self._Lock.notify ()
+
+    def Send (self, Slot, Length = None, RxLen = 1024, **Args):
+	"""
+	Send the payload in a slot (its descriptor), then release the slot.
+	@param Length: The payload length, by default the whole slot.
+	@return a tuple with the (MsgSend result and the reply data).
+	"""
+	if Length == None: Length = self.SlotSize
+	try:
+	    (Result, Len) = Message.MsgSend (self, ShmDescriptor (self.Region, Slot.Generation,
+				Slot.Offset, Length), RxLen, **Args)
+	finally:
+	    self.Release (Slot)
+	return (Result, self.RxData)
+
+    def SendPayload (self, Data, RxLen = 1024, **Args):
+	"""
+	Copy Data (str, bytearray, memoryview etc.) into a slot and Send it.
+	"""
+	Length = len (Data) * getattr (Data, 'itemsize', 1)
+	Slot = self.Alloc (Length)
+	try:
+	    if not isinstance (Data, str):
+		try: Data = (c_char * Length).from_buffer (Data)
+		except TypeError: Data = memoryview (Data).tobytes ()	# read only
+	    memmove (addressof (self.Map.Buffer) + Slot.Offset, Data, Length)
+	except:
+	    self.Release (Slot)
+	    raise
+	return self.Send (Slot, Length, RxLen, **Args)
+
+    def Close (self):
+	"""
+	Sender: tell the server to unmap the region, unmap it and close the connection.
+	Receiver: unmap every region and detach the name.
+	"""
+	if self.Region != None:
+	    if self.ConnectionOk (): Message.MsgSend (self, ShmClose (self.Region))
+	    self.Region = None
+	    self.Slots = []
+	    self.Map.Close ()
+	    self.name_close ()
+	for Region in self.Regions.keys (): self._Drop (Region)
+	if self.dpp: self.name_detach ()
+
+    ######## receiver
+
+    def MsgReceive (self, RxLen = 1024, RawMode = None, View = None, Copy = False):
+	"""
+	As Message.MsgReceive. A payload sent through the region is returned as (rcvid, length),
+	with RxData a memoryview of the slot (a str if Copy), valid until the reply.
+	self.Payload holds its descriptor. Region set up and close messages are handled here.
+	"""
+	while True:
+	    (Rcvid, Len) = Message.MsgReceive (self, RxLen, RawMode, View, Copy)
+	    if Rcvid <= 0: return (Rcvid, Len)
+
+	    Data = self.RxData
+	    if isinstance (Data, ShmDescriptor):
+		Error = self._Payload (Data, Copy)
+		if Error == 0: return (Rcvid, Data.length)
+		self.MsgError (Error, Rcvid)
+	    elif isinstance (Data, ShmOpen):
+		self._Open (Rcvid, Data)
+	    elif isinstance (Data, ShmClose):
+		self._Drop (Data.region)
+		self.MsgReply (0, Rcvid = Rcvid)
+	    else:
+		self.Payload = None
+		return (Rcvid, Len)
+
+    def _Payload (self, Desc, Copy):
+	"""
+	Check a descriptor and point RxData at its payload.
+	@return 0, or the errno to reply with.
+	"""
+	self.Payload = None
+	Entry = self.Regions.get (Desc.region)
+	if Entry == None: return errno.EINVAL
+	Map = Entry [0]
+	Index = (Desc.offset - Map.Header * 2) // (Map.Header + Map.SlotSize)
+	if Desc.offset != Map.Header * 2 + Index * (Map.Header + Map.SlotSize) or \
+	   not 0 <= Index < Map.Slots or Desc.length > Map.SlotSize: 
+	    return errno.EINVAL
+	(Generation,) = _Slot.unpack_from (Map.Map, Desc.offset - Map.Header)
+	if Generation != Desc.generation: return errno.ESTALE
+	if Copy: self.RxData = Map.Map [Desc.offset:Desc.offset + Desc.length]
+	else:	 self.RxData = memoryview (Map.Buffer) [Desc.offset:Desc.offset + Desc.length]
+	self.Payload = Desc
+	return 0
+
+    def _Open (self, Rcvid, Request):
+	try:
+	    Map = _Map (Request.name)
+	except OSError as e:
+	    self.MsgError (e.errno, Rcvid)
+	    return
+	(Magic, Map.Slots, Map.Header, Map.SlotSize) = _Region.unpack_from (Map.Map, 0)
+	if Magic != _MAGIC or Map.Header < _Region.size or \
+	   (Map.Slots, Map.SlotSize) != (Request.slots, Request.slotsize) or \
+	   Map.Size < Map.Header + Map.Slots * (Map.Header + Map.SlotSize):
+	    Map.Close ()
+	    self.MsgError (errno.EINVAL, Rcvid)
+	    return
+	Region = self._Next
+	self._Next += 1
+	self.Regions [Region] = (Map, self.info.scoid)
+	self.MsgReply (Region, Rcvid = Rcvid)
+
+    def _Drop (self, Region):
+	Entry = self.Regions.pop (Region, None)
+	if Entry != None: Entry [0].Close ()
+
+    def _Disconnect (self, Server, Code, Value, Scoid):
+	"""
+	Pulse handler, a client has gone. Unmap its regions.
+	"""
+	for Region, (Map, Owner) in self.Regions.items ():
+	    if Owner == Scoid: self._Drop (Region)
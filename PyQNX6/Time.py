@@ -1,7 +1,7 @@
 #!/usr/local/bin/python
 
 #import pdb
-import sys, os
+import sys, os, time
 
 from PyQNX6    import *
 from ctypes import *
@@ -19,6 +19,9 @@ class Timer (QNX):
     - timer_stop    ()
     - timer_delete  ()
     """
+    _timer_create  = Libc ("timer_create")
+    _timer_settime = Libc ("timer_settime")
+    _timer_delete  = Libc ("timer_delete")
 
     def __init__ (self, Event = None, Times = None, Abs = False, Start = False):
 	"""
@@ -32,12 +35,8 @@ class Timer (QNX):
 	"""
 	if QNX.lib == None:
 	    QNX.__init__(self)    # init libc
-	self._timer_create = self.lib.timer_create
-	self._timer_create.argtypes = [c_int, POINTER(sigevent), POINTER(c_int)]
-	self._timer_settime = self.lib.timer_settime
-	self._timer_settime.argtypes = [c_int, c_int, POINTER(itimerspec), POINTER (itimerspec)]
-	self._timer_delete = self.lib.timer_delete
 	
+	self._Itime = itimerspec (0, 0)		# reused by timer_settime
 	self.Id    = None
 	self.Event = Event
 	self.Times = Times
@@ -80,8 +79,8 @@ class Timer (QNX):
 	if Abs:   self.Abs   = Abs
 	if Times: self.Times = Times
 	if self.Times == None: raise ValueError, "No Start/Interval time defined"
-	Itime = itimerspec (self.Times[0], self.Times [1])
-	_res =  self._timer_settime (c_int(self.Id), c_int(self.Abs), pointer (Itime), None)
+	self._Itime.Set (self.Times[0], self.Times [1])
+	_res =  self._timer_settime (self.Id, self.Abs, byref (self._Itime), None)
 	return _res
 
     def timer_stop (self):
@@ -94,6 +93,162 @@ class Timer (QNX):
 	
 
 
+class Timeout (object):
+    """
+    A timeout armed on a TimerWheel. Returned by TimerWheel.Add, Cancel () disarms it.
+    """
+    __slots__ = ('Expires', 'Function', 'Args', 'Slot')
+
+    def __init__ (self, Expires, Function, Args):
+	self.Expires  = Expires		# wheel tick
+	self.Function = Function
+	self.Args     = Args
+	self.Slot     = None		# the wheel slot holding it, None once expired or cancelled
+
+    def Cancel (self):
+	"""
+	Disarm the timeout.
+	@return True if it was armed.
+	"""
+	if self.Slot == None: return False
+	self.Slot.discard (self)
+	self.Slot = None
+	return True
+
+    def Active (self):
+	return self.Slot != None
+
+
+class TimerWheel (object):
+    """
+    Many software timeouts driven by one periodic Timer.
+
+    The timeouts are held in a hierarchical timing wheel: Levels wheels of 2**Bits slots,
+    the first counts Ticks, each next one counts whole turns of the one below. Add, Cancel and 
+    expiry are O(1), however many timeouts are armed. A timeout in an outer wheel is moved 
+    (cascaded) inward when its slot comes round.
+
+    The Timer pulses the Server's channel every Tick seconds, the pulse is handled (see 
+    Message.AddPulseHandler) in the server's MsgReceive and the callbacks are run there.
+    With Server None, the wheel is driven by calling Advance () instead.
+
+    e.g.
+	Wheel = TimerWheel (Server, Tick = 0.01)
+	T = Wheel.Add (2.5, Resend, Packet)
+	...
+	T.Cancel ()
+
+    @param Server: The Message (server) whose channel gets the pulses.
+    @param Tick: The resolution in seconds. Timeouts fire on the first tick at or after they are due.
+    @param Code: The pulse code used.
+    @param Bits: log2 of the slots per wheel.
+    @param Levels: The number of wheels. Longer timeouts are held in the outermost wheel and cascaded.
+    """
+    def __init__ (self, Server = None, Tick = 0.01, Code = 0x70, Bits = 6, Levels = 4, Start = True):
+	self.Tick   = Tick
+	self.Code   = Code
+	self.Bits   = Bits
+	self.Mask   = (1 << Bits) - 1
+	self.Levels = Levels
+	self.Wheels = [[set () for i in range (1 << Bits)] for Level in range (Levels)]
+	self.Now    = 0		# ticks processed
+	self.Count  = 0		# timeouts expired
+	self.Epoch  = time.time ()
+	self.Server = Server
+	self.Timer  = None
+	if Server != None:
+	    from PyQNX6.Message import Message
+	    self.Connection = Message ()
+	    self.Connection.ConnectAttach (Chid = Server.chid)
+	    Server.AddPulseHandler (Code, self._Pulse)
+	    self.Timer = Timer (sigevent (SIGEV_PULSE, code = Code, coid = self.Connection.coid))
+	    self.Timer.timer_create ()
+	    if Start: self.Start ()
+
+    def Start (self):
+	"""
+	Start the periodic timer.
+	"""
+	self.Epoch = time.time () - self.Now * self.Tick
+	self.Timer.timer_settime (False, (self.Tick, self.Tick))
+
+    def Stop (self):
+	self.Timer.timer_stop ()
+
+    def Close (self):
+	"""
+	Delete the timer and its connection. Armed timeouts will not fire.
+	"""
+	if self.Timer != None:
+	    self.Timer.timer_delete ()
+	    self.Server.RemovePulseHandler (self.Code)
+	    self.Connection.ConnectDetach ()
+	    self.Timer = None
+
+    def Add (self, Delay, Function, *Args):
+	"""
+	Arm a timeout. Function (*Args) is called once Delay seconds have passed.
+	@return the Timeout, to cancel it.
+	"""
+	Ticks = int (Delay / self.Tick + 0.999999)
+	Entry = Timeout (self.Now + max (Ticks, 1), Function, Args)
+	self._Insert (Entry)
+	return Entry
+
+    def Cancel (self, Entry):
+	return Entry.Cancel ()
+
+    def _Insert (self, Entry):
+	"""
+	Put Entry in the slot of the innermost wheel that spans its expiry.
+	"""
+	Delta, Shift = Entry.Expires - self.Now, 0
+	for Level in range (self.Levels - 1):
+	    if Delta < (1 << (Shift + self.Bits)): break
+	    Shift += self.Bits
+	else:
+	    Level = self.Levels - 1
+	    if Delta >= (1 << (Shift + self.Bits)):	# beyond the wheels, wait in the last slot
+		Entry.Slot = self.Wheels [Level] [((self.Now >> Shift) - 1) & self.Mask]
+		Entry.Slot.add (Entry)
+		return
+	Entry.Slot = self.Wheels [Level] [(Entry.Expires >> Shift) & self.Mask]
+	Entry.Slot.add (Entry)
+
+    def Advance (self, Ticks = 1):
+	"""
+	Process Ticks ticks, running the callbacks of the timeouts due.
+	"""
+	Mask, Bits, Wheels = self.Mask, self.Bits, self.Wheels
+	for i in range (Ticks):
+	    self.Now += 1
+	    Now = self.Now
+	    Level, Shift = 1, Bits
+	    while Level < self.Levels and not (Now >> (Shift - Bits)) & Mask:
+		Slot = Wheels [Level] [(Now >> Shift) & Mask]
+		if Slot:
+		    Wheels [Level] [(Now >> Shift) & Mask] = set ()
+		    for Entry in Slot: self._Insert (Entry)
+		Level, Shift = Level + 1, Shift + Bits
+
+	    Slot = Wheels [0] [Now & Mask]
+	    while Slot:			# a callback may cancel the others
+		Entry = Slot.pop ()
+		Entry.Slot = None
+		self.Count += 1
+		Entry.Function (*Entry.Args)
+
+    def _Pulse (self, Server, Code, Value, Scoid):
+	"""
+	The timer pulse handler. Catches up with the clock, pulses may be late or merged.
+	"""
+	Ticks = int ((time.time () - self.Epoch) / self.Tick) - self.Now
+	if Ticks > 0: self.Advance (Ticks)
+
+    def __len__ (self):
+	return sum ([len (Slot) for Wheel in self.Wheels for Slot in Wheel])
+
+
 if __name__ == '__main__':
     t = Timer ()
     print dir (t)
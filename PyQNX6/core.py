@@ -6,14 +6,37 @@ QNX core classes/data
 
 """
 #import pdb
-import sys, os, time
+import sys, os, time, select
 
 from ctypes import *
+from ctypes import _CFuncPtr
+
+
+def LoadBackend (libname="libc.so"):
+    """
+    Utility: Load the kernel call layer. 
+    On QNX this is libc, elsewhere the PyQNX6.Linux shared memory stand-in.
+    The environment variable PYQNX6_BACKEND overrides the choice, it may be
+    'libc', 'linux' or the name of a module providing the same entry points. 
+
+    Errors are available from ctypes.get_errno() for either.
+    """
+    Backend = os.environ.get ("PYQNX6_BACKEND")
+    if Backend == None:
+	if sys.platform.startswith ("qnx"): Backend = "libc"
+	else: Backend = "linux"
+
+    if Backend == "libc":
+	return CDLL (libname, use_errno=True)
+    if Backend == "linux": Backend = "PyQNX6.Linux"
+    __import__ (Backend)
+    return sys.modules [Backend]
 
 
 class QNX(object):
     """
     QNX Class Placeholder for the functions in libc.
+    'lib' holds the kernel call layer, see LoadBackend.
     """
     lib = None
     def __init__ (self, libname="libc.so"):
@@ -21,10 +44,105 @@ class QNX(object):
 	Initialise the class. If the library isnt already loaded then load the library.
 	"""
 	if QNX.lib == None:
-		QNX.lib = self.lib = cdll.LoadLibrary (libname)
+		QNX.lib = self.lib = LoadBackend (libname)
 	    #self.get_errno_loc = self.lib.errno
 	    #self.get_errno_loc.restype = c_int
 
+    @staticmethod
+    def SetBackend (lib):
+	"""
+	Use lib (a CDLL or a module, see LoadBackend) for the kernel calls.
+	The functions already bound are dropped, they are bound again from lib when next used.
+	"""
+	QNX.lib = lib
+	_Bound.clear ()
+
+
+#########################
+# The libc entry points. Each is looked up and given its prototype once, when first used,
+# and shared by every instance of every class (see Libc).
+
+Prototypes = {
+    # name                  restype   argtypes
+    'ChannelCreate':        (c_int,    [c_int]),
+    'ChannelDestroy':       (c_int,    [c_int]),
+    'ConnectAttach':        (c_int,    [c_int, c_int, c_int, c_int, c_int]),
+    'ConnectDetach':        (c_int,    [c_int]),
+    'ConnectServerInfo':    (c_int,    [c_int, c_int, c_void_p]),
+    'name_attach':          (c_void_p, [c_void_p, c_char_p, c_int]),
+    'name_detach':          (c_int,    [c_void_p, c_int]),
+    'name_open':            (c_int,    [c_char_p, c_int]),
+    'name_close':           (c_int,    [c_int]),
+    'MsgSend':              (c_int,    [c_int, c_void_p, c_int, c_void_p, c_int]),
+    'MsgSendv':             (c_int,    [c_int, c_void_p, c_int, c_void_p, c_int]),
+    'MsgReceive':           (c_int,    [c_int, c_void_p, c_int, c_void_p]),
+    'MsgReceivev':          (c_int,    [c_int, c_void_p, c_int, c_void_p]),
+    'MsgReply':             (c_int,    [c_int, c_int, c_void_p, c_int]),
+    'MsgReplyv':            (c_int,    [c_int, c_int, c_void_p, c_int]),
+    'MsgError':             (c_int,    [c_int, c_int]),
+    'MsgRead':              (c_int,    [c_int, c_void_p, c_int, c_int]),
+    'MsgInfo':              (c_int,    [c_int, c_void_p]),
+    'MsgSendPulse':         (c_int,    [c_int, c_int, c_int, c_int]),
+    'MsgDeliverEvent':      (c_int,    [c_int, c_void_p]),
+    'timer_create':         (c_int,    [c_int, c_void_p, c_void_p]),
+    'timer_settime':        (c_int,    [c_int, c_int, c_void_p, c_void_p]),
+    'timer_delete':         (c_int,    [c_int]),
+    'InterruptAttachEvent': (c_int,    [c_int, c_void_p, c_int]),
+    'InterruptWait':        (c_int,    [c_int, c_void_p]),
+    'InterruptMask':        (c_int,    [c_int, c_int]),
+    'InterruptUnmask':      (c_int,    [c_int, c_int]),
+    'InterruptDetach':      (c_int,    [c_int]),
+    'ThreadCtl':            (c_int,    [c_int, c_void_p]),
+    'ClockCycles':          (c_uint64, []),
+    'getprio':              (c_int,    [c_int]),
+    'setprio':              (c_int,    [c_int, c_int]),
+    'in8s':                 (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'in16s':                (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'in32s':                (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'out8s':                (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'out16s':               (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'out32s':               (c_void_p, [c_void_p, c_uint, c_size_t]),
+    'mmap_device_memory':   (c_void_p, [c_void_p, c_size_t, c_int, c_int, c_uint64]),
+    'munmap_device_memory': (c_int,    [c_void_p, c_size_t]),
+    'mmap_device_io':       (c_size_t, [c_size_t, c_uint64]),
+    'munmap_device_io':     (c_int,    [c_size_t, c_size_t]),
+    'shm_open':             (c_int,    [c_char_p, c_int, c_int]),
+    'shm_unlink':           (c_int,    [c_char_p]),
+    'dispatch_create_channel': (c_void_p, [c_int, c_uint]),
+    'dispatch_destroy':     (c_int,    [c_void_p]),
+    }
+
+_Bound = {}	# name -> the bound function
+
+def Bind (Name):
+    """
+    Utility: Look up the libc function Name and set its prototype (from Prototypes).
+    The function is kept, later calls return the same one.
+    Backends that are python modules (PyQNX6.Linux) are used as they are.
+    """
+    Function = _Bound.get (Name)
+    if Function == None:
+	if QNX.lib == None: QNX ()
+	Function = getattr (QNX.lib, Name)
+	if isinstance (Function, _CFuncPtr) and Name in Prototypes:
+	    (Function.restype, Function.argtypes) = Prototypes [Name]
+	_Bound [Name] = Function
+    return Function
+
+class Libc (object):
+    """
+    A libc function as a class attribute, bound on first use. e.g.
+	class Timer (QNX):
+	    _timer_delete = Libc ("timer_delete")
+    """
+    __slots__ = ('Name',)
+
+    def __init__ (self, Name):
+	self.Name = Name
+
+    def __get__ (self, Instance, Owner):
+	return _Bound.get (self.Name) or Bind (self.Name)
+
 
 class sigval_u (Union):
     """
@@ -66,6 +184,13 @@ class pulse_t  (Structure):
 	Result.scoid  = self.scoid
 	return Result
 
+PULSE_CODE_UNBLOCK     = -32	#: a reply blocked client wants to unblock (_NTO_CHF_UNBLOCK)
+PULSE_CODE_DISCONNECT  = -33	#: a client has detached (_NTO_CHF_DISCONNECT)
+PULSE_CODE_THREADDEATH = -34	#: a thread has died (_NTO_CHF_THREAD_DEATH)
+PULSE_CODE_COIDDEATH   = -35	#: a server has gone (_NTO_CHF_COID_DISCONNECT)
+PULSE_CODE_MINAVAIL    = 0	#: the user pulse codes
+PULSE_CODE_MAXAVAIL    = 127
+
 # definition for the name_attach_t structure
 class name_attach_t (Structure):
     """
@@ -97,6 +222,14 @@ class msg_info_t (Structure):
 		("priority", c_int16), ("flags", c_int16),
 		("reserved", c_uint32)]
 
+class iovec (Structure):
+    """
+    QNX - iovec structure. 
+    Used by the vectored (scatter/gather) message functions.
+    """
+    _fields_ = [('iov_base', c_void_p),
+		('iov_len', c_int)]
+
 
 #########################
 
@@ -178,34 +311,136 @@ class sigevent (Structure):
 	self.sigev_value    = value
 	return self
 
-def Waitfor (Name):
+# Directory change notification (Linux inotify), see _Notifier.
+IN_MOVED_TO = 0x00000080
+IN_CREATE   = 0x00000100
+
+class _Notifier (object):
+    """
+    Wakes a Waitfor when an entry is created in a watched directory.
+    Where there is no inotify (QNX, or the directory is not watchable) Fd is None
+    and Waitfor polls.
+    """
+    def __init__ (self):
+	self.Fd = None
+	self._Watched = set ()
+	try:
+	    self._libc = CDLL (None, use_errno = True)
+	    Fd = self._libc.inotify_init1 (os.O_NONBLOCK)
+	except (OSError, AttributeError):
+	    return
+	if Fd >= 0: self.Fd = Fd
+
+    def Watch (self, Name):
+	"""
+	Watch the directory of Name, or the nearest that exists if it hasnt been created yet.
+	@return True if it is watched.
+	"""
+	if self.Fd == None: return False
+	Dir = os.path.dirname (os.path.abspath (Name))
+	while not os.path.isdir (Dir) and Dir != os.path.dirname (Dir):
+	    Dir = os.path.dirname (Dir)
+	if Dir in self._Watched: return True
+	if self._libc.inotify_add_watch (self.Fd, Dir, IN_CREATE | IN_MOVED_TO) < 0: return False
+	self._Watched.add (Dir)
+	return True
+
+    def Wait (self, Timeout):
+	"""
+	Wait up to Timeout seconds for a change, and drain the events.
+	"""
+	if select.select ([self.Fd], [], [], Timeout) [0]:
+	    try:
+		while os.read (self.Fd, 4096): pass
+	    except OSError: pass
+
+    def Close (self):
+	if self.Fd != None:
+	    os.close (self.Fd)
+	    self.Fd = None
+
+
+def WaitforAll (Names, Timeout = None, Found = None, Poll = 0.1):
+    """
+    Utility: Wait for each of the files Names to exist, all at once.
+    Returns as soon as the last one appears, Found (Name) is called as each does.
+
+    The directories are watched where there is notification (Linux inotify),
+    otherwise they are polled, from 1ms doubling up to Poll seconds.
+    @param Timeout: The most seconds to wait, by default for ever.
+    @return a list of the Names that dont exist yet (empty when all do).
+    """
+    Missing = []
+    for Name in Names:
+	if Name not in Missing: Missing.append (Name)
+    Deadline = None if Timeout == None else time.time () + Timeout
+    Delay = 0.001
+    Notify = _Notifier ()
+    try:
+	while True:
+	    # watch before looking, so an entry made between the two isnt missed
+	    Watched = all ([Notify.Watch (Name) for Name in Missing])
+	    for Name in Missing [:]:
+		if os.path.exists (Name):
+		    Missing.remove (Name)
+		    if Found: Found (Name)
+	    if not Missing: return []
+
+	    Wait = Delay
+	    Delay = min (Delay * 2, Poll)
+	    if Watched: Wait = Poll	# notified, polling only as a safety net
+	    if Deadline != None:
+		Left = Deadline - time.time ()
+		if Left <= 0: return Missing
+		Wait = min (Wait, Left)
+	    if Notify.Fd != None: Notify.Wait (Wait)
+	    else: time.sleep (Wait)
+    finally:
+	Notify.Close ()
+
+def Waitfor (Name, Timeout = None):
     """
     Utility: Wait for the file Name to exist. 
     Will wait for the existance of the named file. 
 
     This is similar in functionality to the QNX 'waitfor' utility.
-    It does not have a timeout option.
+    See WaitforAll.
+    @param Timeout: The most seconds to wait, by default for ever.
+    @return True if it exists, False if the Timeout expired first.
     """
-    __waitfor = True
-    while __waitfor:
-	try:
-	    f = open (Name, "r")
-	    __waitfor = False
-	    f.close()
-	except: 
-	    time.sleep (0.1)
+    return not WaitforAll ([Name], Timeout)
 
-def WaitforAttach (Name, Global = False):
+def _AttachPath (Name, Global = False):
+    """
+    @return the path of the attached Name (under /dev/name, or the stand-in's NamePrefix).
+    """
+    if QNX.lib == None: QNX ()
+    Prefix = getattr (QNX.lib, "NamePrefix", "/dev/name")
+    if Global:  return Prefix + "/global/" + Name
+    else:  return Prefix + "/local/" + Name
+
+def WaitforAttach (Name, Global = False, Timeout = None):
     """
     Utility: Waitfor the attached name to exist.
     Will wait for the existance of the named attach file. 
     This may be used after name_attach call to force the code to wait until
     the name has been registered. 
+    @return True if it exists, False if the Timeout expired first.
     """
+    return Waitfor (_AttachPath (Name, Global), Timeout)
 
-    if Global:  Name = "/dev/name/global/" + Name
-    else:  Name = "/dev/name/local/" + Name
-    Waitfor (Name)
+def WaitforAttachAll (Names, Global = False, Timeout = None, Found = None):
+    """
+    Utility: Wait for each of the attached Names, all at once, rather than one after the other.
+    e.g. before starting a service that needs several others.
+    @param Found: called as Found (Name) as each is attached.
+    @return a list of the Names not attached when the Timeout expired (empty when all are).
+    """
+    Paths = dict ((_AttachPath (Name, Global), Name) for Name in Names)
+    Callback = None
+    if Found: Callback = lambda Path: Found (Paths [Path])
+    Missing = WaitforAll ([_AttachPath (Name, Global) for Name in Names], Timeout, Callback)
+    return [Paths [Path] for Path in Missing]
 	
 	
 #######################################################
@@ -286,3 +521,21 @@ class itimerspec (Structure):
 	"""
 	return int (Seconds *1000000000)
 	
+
+
+def Benchmark (Count=20000):
+    """
+    Construction benchmark. The time to create Connect, Message and Timer instances,
+    e.g. per request objects. 'python -m PyQNX6.core' runs it.
+    """
+    from PyQNX6.Message import Connect, Message
+    from PyQNX6.Time import Timer
+
+    for Class in (Connect, Message, Timer):
+	Start = time.time ()
+	for i in xrange (Count): Class ()
+	print "%-8s %6.2f uS per instance" % (Class.__name__, (time.time () - Start) * 1e6 / Count)
+
+
+if __name__ == '__main__':
+    Benchmark ()
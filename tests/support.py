@@ -0,0 +1,91 @@
+'''
+Symmetry Innovations Pty Lyd
+QNX Target Project.
+
+Test support. The tests run on the PyQNX6.Linux stand-in, with the channel and
+name files in a directory of their own (removed at exit). A server is run in a
+forked child, ServerProcess, so its kernel calls are those of another process
+as they would be on a target.
+
+    python -m unittest discover -s tests -t .
+'''
+import sys, os, time, signal, shutil, tempfile, traceback, atexit
+
+os.environ ["PYQNX6_BACKEND"] = "linux"
+if "PYQNX6_SHM" not in os.environ:
+    os.environ ["PYQNX6_SHM"] = tempfile.mkdtemp (prefix = "pyqnx6.test.",
+			dir = "/dev/shm" if os.path.isdir ("/dev/shm") else None)
+    _Owner = os.getpid ()
+    atexit.register (lambda: os.getpid () == _Owner and shutil.rmtree (os.environ ["PYQNX6_SHM"], True))
+
+sys.path.insert (0, os.path.dirname (os.path.dirname (os.path.abspath (__file__))))
+
+from PyQNX6.core import QNX
+
+_Names = [0]
+
+def Attached (Name, Global = False, Timeout = 10):
+    """
+    Wait for Name to be attached (its file under the name prefix to exist).
+    @return True if it was within Timeout seconds.
+    """
+    if QNX.lib == None: QNX ()
+    Path = os.path.join (QNX.lib.NamePrefix, "global" if Global else "local", Name)
+    Limit = time.time () + Timeout
+    while not os.path.exists (Path):
+	if time.time () > Limit: return False
+	time.sleep (0.01)
+    return True
+
+def Name (Prefix = "test"):
+    """
+    @return a name not used before by this run.
+    """
+    _Names [0] += 1
+    return "%s.%d.%d" % (Prefix, os.getpid (), _Names [0])
+
+
+class ServerProcess (object):
+    """
+    Runs Target () in a forked child, e.g. a server's Run. Stop () kills it.
+    @param Name: Wait for this name to be attached before returning.
+    """
+    def __init__ (self, Target, Name = None, Global = False, Timeout = 10):
+	self.Pid = os.fork ()
+	if self.Pid == 0:
+	    try:
+		Target ()
+	    except BaseException:
+		traceback.print_exc ()
+	    finally:
+		os._exit (0)
+	if Name and not Attached (Name, Global, Timeout):
+	    self.Stop ()
+	    raise AssertionError ("%s wasnt attached" % Name)
+
+    def Stop (self):
+	if self.Pid:
+	    try: os.kill (self.Pid, signal.SIGKILL)
+	    except OSError: pass
+	    os.waitpid (self.Pid, 0)
+	    self.Pid = None
+
+    def Wait (self, Timeout = 10):
+	"""
+	Wait for the child to exit by itself.
+	@return True if it did, else it is killed.
+	"""
+	Limit = time.time () + Timeout
+	while time.time () < Limit:
+	    if os.waitpid (self.Pid, os.WNOHANG) [0]:
+		self.Pid = None
+		return True
+	    time.sleep (0.01)
+	self.Stop ()
+	return False
+
+    def __enter__ (self):
+	return self
+
+    def __exit__ (self, *Exception):
+	self.Stop ()
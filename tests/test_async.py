@@ -0,0 +1,82 @@
+import threading, unittest
+
+from tests.support import Name, ServerProcess
+
+import trollius as asyncio
+from trollius import From, Return
+
+from PyQNX6.Async import AsyncQNXClient, AsyncQNXServer
+from PyQNX6.Client import QNXClient
+
+
+class AsyncTest (unittest.TestCase):
+
+    def test_server_replies (self):
+	Service = Name ("async")
+
+	def Serve ():
+	    @asyncio.coroutine
+	    def Handler (Server, Rcvid, Data):
+		yield From (asyncio.sleep (0.01))
+		raise Return ((0, ("echo", Data)))
+	    Loop = asyncio.new_event_loop ()
+	    asyncio.set_event_loop (Loop)
+	    Server = AsyncQNXServer (Service, Handler, Loop = Loop)
+	    Loop.run_until_complete (Server.Run ())
+
+	with ServerProcess (Serve, Service):
+	    Client = QNXClient (Service)
+	    Replies = [None] * 4
+	    def Send (i):
+		Peer = QNXClient (Service)
+		Replies [i] = Peer.MsgSend (i) [0], Peer.RxData
+	    Threads = [threading.Thread (target = Send, args = (i,)) for i in range (4)]
+	    for Thread in Threads: Thread.start ()
+	    for Thread in Threads: Thread.join (10)
+	    self.assertEqual (Replies, [(0, ("echo", i)) for i in range (4)])
+	    self.assertEqual (Client.MsgSend ("x"), (0, 1))
+	    self.assertEqual (Client.RxData, ("echo", "x"))
+
+    def test_pulses (self):
+	Service = Name ("async")
+
+	def Serve ():
+	    Pulses = []
+	    @asyncio.coroutine
+	    def Handler (Server, Rcvid, Data):
+		if Rcvid == 0:
+		    yield From (asyncio.sleep (0.05))	# the receive thread has received since
+		    Pulses.append ((Data.code, Data.sigval.sival_int))
+		    raise Return ((0, None))
+		yield From (asyncio.sleep (0.2))
+		raise Return ((0, sorted (Pulses)))
+	    Loop = asyncio.new_event_loop ()
+	    asyncio.set_event_loop (Loop)
+	    Loop.run_until_complete (AsyncQNXServer (Service, Handler, Loop = Loop).Run ())
+
+	with ServerProcess (Serve, Service):
+	    Client = QNXClient (Service)
+	    for Value in range (5): Client.MsgSendPulse (Code = 3, Value = Value)
+	    Client.MsgSend ("report")
+	    self.assertEqual (Client.RxData, [(3, Value) for Value in range (5)])
+
+    def test_client_send (self):
+	Service = Name ("async")
+
+	def Serve ():
+	    from PyQNX6.Server import QNXServer
+	    QNXServer (Service, lambda Server, Rcvid, Data: (0, Data * 2)).Run ()
+
+	with ServerProcess (Serve, Service):
+	    Loop = asyncio.new_event_loop ()
+	    @asyncio.coroutine
+	    def Main ():
+		Client = yield From (AsyncQNXClient.Open (Service, Loop = Loop))
+		Replies = yield From (asyncio.gather (*[Client.Send (i) for i in range (5)], loop = Loop))
+		raise Return (Replies)
+	    self.assertEqual (Loop.run_until_complete (Main ()), [(0, i * 2) for i in range (5)])
+	    Loop.close ()
+
+
+if __name__ == '__main__':
+    unittest.main ()
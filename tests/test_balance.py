@@ -0,0 +1,93 @@
+import os, time, errno, unittest
+
+from ctypes import get_errno
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6.Message import DEFER
+from PyQNX6.Server import QNXServer
+from PyQNX6.Client import QNXClient
+from PyQNX6.Connections import ConnectionPool
+from PyQNX6.Balance import BalancedClient, LEAST, TWO_CHOICES
+
+
+def Function (Server, Rcvid, Data):
+    if Data == "missing":
+	Server.MsgError (errno.ENOENT, Rcvid)	# the request's error, not the replica's
+	return DEFER
+    return (0, os.getpid ())
+
+
+class BalanceTest (unittest.TestCase):
+
+    def setUp (self):
+	Prefix = Name ("balance")
+	self.Names = ["%s.%d" % (Prefix, Index) for Index in range (2)]
+	self.Servers = [ServerProcess (lambda: QNXServer (Service, Function).Run (), Service)
+			for Service in self.Names]
+	self.Pids = [Server.Pid for Server in self.Servers]
+	self.Pool = ConnectionPool ()
+	self.assertEqual (BalancedClient.Discover (Prefix), self.Names)
+
+    def tearDown (self):
+	self.Pool.Close ()
+	for Server in self.Servers: Server.Stop ()
+
+    def Client (self, **Args):
+	return BalancedClient (self.Names, Pool = self.Pool, **Args)
+
+    def test_spread (self):
+	for Policy in (LEAST, TWO_CHOICES):
+	    Service = self.Client (Policy = Policy)
+	    Pids = set ([Service.Send ("x") [1] for Count in range (40)])
+	    self.assertEqual (Pids, set (self.Pids))	# ties go to either
+
+    def test_server_error (self):
+	Service = self.Client ()
+	self.assertEqual (Service.Send ("missing") [0], -1)
+	self.assertEqual (get_errno (), errno.ENOENT)
+	Stats = Service.Stats ()
+	self.assertEqual (sum ([Stats [Name] [1] for Name in self.Names]), 1)	# not resent
+	self.assertEqual ([Stats [Name] [2] for Name in self.Names], [0, 0])
+	self.assertFalse ([Name for Name in self.Names if Stats [Name] [5]])	# not ejected
+
+    def test_gone (self):
+	Service = self.Client (Retries = 1)
+	for Name in self.Names: self.Pool.Get (Name)
+	self.Servers [0].Stop ()
+	for Count in range (4):
+	    self.assertEqual (Service.Send ("x"), (0, self.Pids [1]))
+	Stats = Service.Stats ()
+	self.assertEqual (Stats [self.Names [0]] [2], 1)
+	self.assertTrue (Stats [self.Names [0]] [5])
+
+    def test_no_retry (self):
+	Service = self.Client (Retries = 0)
+	for Name in self.Names: self.Pool.Get (Name)
+	Opened = self.Pool.Opened
+	for Server in self.Servers: Server.Stop ()
+	self.assertEqual (Service.Send ("x") [0], -1)
+	self.assertEqual (get_errno (), errno.ESRCH)
+	self.assertEqual (sum ([Stats [1] for Stats in Service.Stats ().values ()]), 1)
+	self.assertEqual (self.Pool.Opened, Opened)	# the pool didnt resend either
+
+    def test_cant_open (self):
+	Service = BalancedClient ([Name ("balance.none")] + self.Names [:1], Pool = self.Pool)
+	for Count in range (3):
+	    self.assertEqual (Service.Send ("x"), (0, self.Pids [0]))
+	self.assertEqual (Service.Replicas [0].Failed, 1)
+
+    def test_latency_without_open (self):
+	def Open (Name, Global, Node):
+	    time.sleep (0.2)
+	    return QNXClient (Name, Global = Global)
+	self.Pool = ConnectionPool (Open = Open)
+	Service = self.Client (Timeout = 0.1)
+	for Count in range (2): self.assertEqual (Service.Send ("x") [0], 0)
+	for Replica in Service.Replicas:
+	    self.assertTrue (Replica.Latency < 0.1, Replica)
+	    self.assertEqual (Replica.Slow, 0)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,102 @@
+import errno, unittest
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6.Codec import StructCodec
+from PyQNX6.Message import Message
+from PyQNX6.Server import QNXServer
+from PyQNX6.Client import QNXClient
+
+Message.AddCodec (StructCodec ('<ii', 17, 'pair'))
+
+Calls = []
+
+def Function (Server, Rcvid, Data):
+    if Rcvid == 0: return None		# a pulse
+    if isinstance (Data [0], int):		# a pair
+	if Data [0] < 0: raise ValueError ("negative")
+	return (0, (Data [0] + Data [1], Data [0] * Data [1]))
+    Calls.append (Data)
+    (Op, Arg) = Data
+    if Op == "echo":  return (len (Calls), Arg)
+    if Op == "big":   return (len (Calls), "x" * Arg)
+    if Op == "raise": raise KeyError (Arg)
+    if Op == "defer": return Server.Defer (Rcvid, OnCancel = lambda Entry, Error: Calls.append (("cancelled", Error)))
+    if Op == "calls": return (0, Calls [:-1])
+
+
+class BatchTest (unittest.TestCase):
+
+    @classmethod
+    def setUpClass (cls):
+	cls.Name = Name ("batch")
+	cls.Server = ServerProcess (lambda: QNXServer (cls.Name, Function).Run (), cls.Name)
+
+    @classmethod
+    def tearDownClass (cls):
+	cls.Server.Stop ()
+
+    def setUp (self):
+	self.Client = QNXClient (self.Name)
+
+    def tearDown (self):
+	self.Client.name_close ()
+
+    def test_calls (self):
+	with self.Client.Batch () as b:
+	    Results = [b.Call (("echo", i)) for i in range (10)]
+	    self.assertRaises (ValueError, Results [0].Result)
+	self.assertEqual ([Entry.Data for Entry in Results], range (10))
+	self.assertEqual (b.Sends, 1)
+	with self.Client.Batch () as b:
+	    Failed = b.Call (("raise", "key"))
+	    After = b.Call (("echo", "after"))
+	self.assertEqual ((Failed.Error, Failed.Data), (errno.EIO, "KeyError: 'key'"))
+	self.assertRaises (OSError, Failed.Result)
+	self.assertEqual (After.Result () [1], "after")
+
+    def test_struct_codec (self):
+	with self.Client.Batch ("pair") as b:
+	    Good = b.Call ((3, 4))
+	    Bad = b.Call ((-1, 4))
+	self.assertEqual (Good.Result (), (0, (7, 12)))
+	self.assertEqual ((Bad.Error, Bad.Data), (errno.EIO, "ValueError: negative"))
+
+    def test_reply_size (self):
+	with self.Client.Batch (RxLen = 4096, ReplyBytes = 1010) as b:
+	    Results = [b.Call (("big", 1000)) for i in range (10)]
+	    Last = b.Call (("echo", "last"), ReplyBytes = 10)
+	self.assertEqual ([Entry.Error for Entry in Results], [0] * 10)
+	self.assertEqual ([len (Entry.Data) for Entry in Results], [1000] * 10)
+	self.assertEqual (Last.Result () [1], "last")
+	self.assertEqual (b.Sends, 3)
+
+    def test_full_reply (self):
+	with self.Client.Batch (RxLen = 4096) as b:
+	    Results = [b.Call (("big", 1000)) for i in range (10)]
+	    Huge = b.Call (("big", 5000))
+	    Last = b.Call (("echo", "last"))
+	self.assertEqual ((Huge.Error, Huge.Data), (errno.E2BIG, None))
+	self.assertEqual (Last.Result () [1], "last")
+	Errors = [Entry.Error for Entry in Results]
+	self.assertEqual (sorted (set (Errors)), [0, errno.E2BIG])
+	self.assertEqual ([len (Entry.Data) for Entry in Results if not Entry.Error], [1000] * Errors.count (0))
+	self.assertTrue (b.Sends > 3, b.Sends)
+	# the calls not run were sent again, each was run once
+	Counts = [Entry.Status for Entry in Results + [Huge, Last] if not Entry.Error]
+	self.assertEqual (len (set (Counts)), len (Counts))
+	self.Client.MsgSend (("calls", None))
+	self.assertEqual (len (self.Client.RxData) - self.Client.RxData.index (("big", 1000)), 12)
+
+    def test_defer (self):
+	with self.Client.Batch () as b:
+	    Deferred = b.Call (("defer", None))
+	    After = b.Call (("echo", 1))
+	self.assertEqual (Deferred.Error, errno.ENOTSUP)
+	self.assertEqual (After.Result () [1], 1)
+	self.Client.MsgSend (("calls", None))
+	self.assertEqual (self.Client.RxData [-2:], [("cancelled", errno.ENOTSUP), ("echo", 1)])
+
+
+if __name__ == '__main__':
+    unittest.main ()
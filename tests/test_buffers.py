@@ -0,0 +1,89 @@
+import threading, unittest
+
+from ctypes import sizeof
+
+import tests.support
+
+from PyQNX6 import Message as Messages
+from PyQNX6.Message import Message, BufferPool
+
+
+class BufferPoolTest (unittest.TestCase):
+
+    def test_sizes (self):
+	self.assertEqual ([BufferPool.Size (Len) for Len in (0, 1024, 1025, 4096, 5000)],
+			  [1024, 1024, 2048, 4096, 8192])
+
+    def test_reuse (self):
+	Pool = BufferPool (Keep = 2, HighWater = 8192)
+	Buffers = [Pool.Get (2000) for i in range (3)]
+	self.assertEqual ([sizeof (Buffer) for Buffer in Buffers], [2048] * 3)
+	for Buffer in Buffers: Pool.Put (Buffer)
+	self.assertEqual (Pool.Stats (), {'hits': 0, 'misses': 3, 'trimmed': 1, 'held': 4096, 'free': {2048: 2}})
+	self.assertTrue (Pool.Get (1500) is Buffers [1])
+	Pool.Put (Pool.Get (8192))			# over the high water
+	self.assertEqual ((Pool.Hits, Pool.Trimmed, Pool.Held), (1, 2, 2048))
+	Pool.Trim ()
+	self.assertEqual ((Pool.Held, Pool.Stats () ['free']), (0, {}))
+
+    def test_per_thread (self):
+	Pools = []
+	Thread = threading.Thread (target = lambda: Pools.append (Messages.Pool ()))
+	Thread.start ()
+	Thread.join ()
+	self.assertTrue (Messages.Pool () is Messages.Pool ())
+	self.assertFalse (Pools [0] is Messages.Pool ())
+
+
+class ReplyLengthTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Server = Message ()
+	self.Server.ChannelCreate ()
+	self.Client = Message ()
+	self.Client.ConnectAttach (Chid = self.Server.chid)
+
+    def tearDown (self):
+	self.Client.ConnectDetach ()
+	self.Server.ChannelDestroy ()
+
+    def Serve (self, Replies, RawMode = True):
+	def Receive ():
+	    for Reply in Replies:
+		self.Server.MsgReceive (RawMode = RawMode)
+		self.Server.MsgReply (0, Reply, RawMode = RawMode)
+	self.Thread = threading.Thread (target = Receive)
+	self.Thread.start ()
+
+    def test_raw (self):
+	self.Serve (["abc", "x" * 100])
+	(Result, Len) = self.Client.MsgSend ("1", 64)
+	self.assertEqual ((Len, self.Client.RxData), (64, "abc" + "\0" * 61))
+	(Result, Len) = self.Client.MsgSend ("2", 64)	# the reply is cut to RxLen
+	self.assertEqual ((Len, self.Client.RxData), (64, "x" * 64))
+	self.Thread.join (5)
+
+    def test_coded (self):
+	self.Serve ([{'a': 1}, range (10)], RawMode = False)
+	self.assertEqual (self.Client.MsgSend ("1", 64, RawMode = False), (0, 1))
+	self.assertEqual (self.Client.RxData, {'a': 1})
+	self.Client.MsgSend ("2", 64, RawMode = False)
+	self.assertEqual (self.Client.RxData, range (10))
+	self.Thread.join (5)
+
+    def test_view_kept_out_of_pool (self):
+	self.Serve (["view"])
+	self.Client.MsgSend ("1", 16, View = True)
+	View = self.Client.RxData
+	Viewed = self.Client._Buffer
+	self.Client._AllocRxBuffer (100000)		# a larger buffer, the old one is not freed
+	self.assertFalse (any (Buffer is Viewed for Free in Messages.Pool ().Free.values () for Buffer in Free))
+	Other = Message ()
+	Other._AllocRxBuffer (16)
+	self.assertFalse (Other._Buffer is Viewed)
+	self.assertEqual (View [:4].tobytes (), "view")
+	self.Thread.join (5)
+
+
+if __name__ == '__main__':
+    unittest.main ()
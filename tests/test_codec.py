@@ -0,0 +1,57 @@
+import unittest
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6 import Codec
+from PyQNX6.Message import Message
+from PyQNX6.Server import QNXServer
+from PyQNX6.Client import QNXClient
+
+Point = Message.AddCodec (Codec.StructCodec ('<iid', 16, 'point'))
+
+
+def Echo (Server, Rcvid, Data):
+    return (Server.RxCodec.Id, Data)
+
+
+class CodecTest (unittest.TestCase):
+
+    @classmethod
+    def setUpClass (cls):
+	cls.Name = Name ("codec")
+	cls.Server = ServerProcess (lambda: QNXServer (cls.Name, Echo).Run (), cls.Name)
+
+    @classmethod
+    def tearDownClass (cls):
+	cls.Server.Stop ()
+
+    def test_builtin (self):
+	Data = {"list": [1, 2.5, "three"], "tuple": (None, True)}
+	for (CodecName, Id) in (("pickle0", 0), ("pickle", 1), ("marshal", 2)):
+	    Client = QNXClient (self.Name, CodecName = CodecName)
+	    self.assertEqual (Client.MsgSend (Data) [0], Id)
+	    self.assertEqual (Client.RxData, Data)
+
+    def test_per_call (self):
+	Client = QNXClient (self.Name)
+	self.assertEqual (Client.MsgSend (["a", "b\0c"], CodecName = "bytes") [0], 3)
+	self.assertEqual (Client.RxData, ["a", "b\0c"])
+	self.assertEqual (Client.MsgSend ("plain") [0], 0)
+
+    def test_struct (self):
+	Client = QNXClient (self.Name, CodecName = Point)
+	self.assertEqual (Client.MsgSend ((1, -2, 0.5)), (16, 1))
+	self.assertEqual (Client.RxData, (1, -2, 0.5))
+
+    def test_unknown (self):
+	self.assertRaises (ValueError, QNXClient (self.Name).MsgSend, "x", CodecName = "nope")
+
+    def test_abstract (self):
+	class Half (Codec.Codec):
+	    def Encode (self, Data): return Data
+	self.assertRaises (TypeError, Codec.Codec)
+	self.assertRaises (TypeError, Half)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,78 @@
+import os, errno, unittest
+
+from ctypes import get_errno
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6.core import QNX
+from PyQNX6.Server import QNXServer
+from PyQNX6.Connections import ConnectionPool
+
+
+def Serve (Service):
+    return lambda: QNXServer (Service, lambda Server, Rcvid, Data: (0, os.getpid ())).Run ()
+
+
+class ConnectionsTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Service = Name ("conn")
+	self.Server = ServerProcess (Serve (self.Service), self.Service)
+	self.Pool = ConnectionPool ()
+
+    def tearDown (self):
+	self.Pool.Close ()
+	self.Server.Stop ()
+
+    def Restart (self):
+	"""
+	Kill the server and start another with the same name. The killed one's name file
+	is left behind, remove it so the wait is for the new one.
+	"""
+	self.Server.Stop ()
+	os.unlink (os.path.join (QNX.lib.NamePrefix, "local", self.Service))
+	self.Server = ServerProcess (Serve (self.Service), self.Service)
+
+    def test_reuse (self):
+	for Count in range (3):
+	    self.assertEqual (self.Pool.Send (self.Service, "x"), (0, self.Server.Pid))
+	self.assertEqual (self.Pool.Opened, 1)
+	self.assertTrue (self.Pool.Get (self.Service) is self.Pool.Get (self.Service))
+
+    def test_checkout (self):
+	with self.Pool.Checkout (self.Service) as Conn:
+	    self.assertEqual (Conn.MsgSend ("x") [0], 0)
+	with self.Pool.Checkout (self.Service) as Again:
+	    self.assertTrue (Again is Conn)
+	self.assertEqual ((self.Pool.Opened, self.Pool.Reused), (1, 1))
+
+    def test_checkin_gone (self):
+	Checkout = self.Pool.Checkout (self.Service)
+	with Checkout as Conn:
+	    self.Server.Stop ()
+	    self.assertEqual (Conn.MsgSend ("x") [0], -1)	# doesnt raise
+	self.assertEqual (self.Pool.Closed, 1)
+	self.Restart ()
+	with self.Pool.Checkout (self.Service) as Conn:
+	    self.assertEqual (Conn.MsgSend ("x") [0], 0)
+	    self.assertEqual (Conn.RxData, self.Server.Pid)
+	self.assertEqual (self.Pool.Opened, 2)
+
+    def test_no_resend (self):
+	self.Pool.Send (self.Service, "x")
+	self.Restart ()
+	self.assertEqual (self.Pool.Send (self.Service, "x") [0], -1)
+	self.assertEqual (get_errno (), errno.ESRCH)
+	self.assertEqual (self.Pool.Reconnects, 1)
+	self.assertEqual (self.Pool.Send (self.Service, "x"), (0, self.Server.Pid))
+	self.assertEqual (self.Pool.Opened, 2)
+
+    def test_resend (self):
+	self.Pool.Send (self.Service, "x")
+	self.Restart ()
+	self.assertEqual (self.Pool.Send (self.Service, "x", Resend = True), (0, self.Server.Pid))
+	self.assertEqual ((self.Pool.Reconnects, self.Pool.Opened), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main ()
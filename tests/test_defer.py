@@ -0,0 +1,107 @@
+import errno, threading, unittest
+
+from ctypes import get_errno
+
+import tests.support
+
+from PyQNX6 import PULSE_CODE_UNBLOCK, PULSE_CODE_DISCONNECT
+from PyQNX6.Message import Message, DEFER
+
+
+class DeferTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Server = Message ()
+	self.Server.ChannelCreate (Message._NTO_CHF_DISCONNECT)
+	self.Client = self.Connect ()
+	self.Threads = []
+	self.Replies = []
+	self.Cancelled = []
+
+    def tearDown (self):
+	self.Server.ChannelDestroy ()		# fails any send still blocked
+	for Thread in self.Threads: Thread.join (5)
+
+    def Connect (self):
+	Client = Message ()
+	Client.ConnectAttach (Chid = self.Server.chid)
+	return Client
+
+    def Send (self, Client, Data):
+	"""
+	Send from a thread, receive it and defer it.
+	@return the rcvid.
+	"""
+	def Send ():
+	    Result = Client.MsgSend (Data, 16) [0]
+	    self.Replies.append ((Result, get_errno () if Result == -1 else Client.RxData.rstrip ("\0")))
+	Thread = threading.Thread (target = Send)
+	Thread.daemon = True
+	Thread.start ()
+	self.Threads.append (Thread)
+	(Rcvid, Len) = self.Server.MsgReceive ()
+	self.assertEqual (self.Server.Defer (Rcvid, Context = Data, OnCancel = self.OnCancel), DEFER)
+	self.assertEqual (self.Server.Deferred [Rcvid].Context, Data)
+	return Rcvid
+
+    # The stand-in cant detach a connection a thread is sending on, the client's
+    # disconnect pulse is sent on it instead (it has the client's scoid).
+
+    def OnCancel (self, Entry, Error):
+	self.Cancelled.append ((Entry.Context, Error))
+
+    def test_reply_later (self):
+	Rcvid = self.Send (self.Client, "later")
+	Thread = threading.Thread (target = self.Server.MsgReply, args = (0, "done"), kwargs = {'Rcvid': Rcvid})
+	Thread.start ()
+	Thread.join (5)
+	self.Threads [0].join (5)
+	self.assertEqual (self.Replies, [(0, "done")])
+	self.assertEqual (self.Server.Deferred, {})
+
+    def test_unblock (self):
+	Rcvid = self.Send (self.Client, "blocked")
+	Other = self.Connect ()
+	Other.MsgSendPulse (Code = PULSE_CODE_UNBLOCK, Value = 99999)		# not deferred
+	Other.MsgSendPulse (Code = PULSE_CODE_UNBLOCK, Value = Rcvid)
+	Other.MsgSendPulse (Code = 5, Value = 1)
+	(Rcvid, Pulse) = self.Server.MsgReceive ()
+	self.assertEqual ((Pulse.code, Pulse.sigval.sival_int), (PULSE_CODE_UNBLOCK, 99999))
+	(Rcvid, Pulse) = self.Server.MsgReceive ()
+	self.assertEqual (Pulse.code, 5)		# the unblock of the deferred message was consumed
+	self.Threads [0].join (5)
+	self.assertEqual (self.Replies, [(-1, errno.EINTR)])
+	self.assertEqual (self.Cancelled, [("blocked", errno.EINTR)])
+	self.assertEqual (self.Server.Deferred, {})
+
+    def test_disconnect_returned (self):
+	self.Send (self.Client, "gone")
+	Kept = self.Send (self.Connect (), "kept")
+	self.Client.MsgSendPulse (Code = PULSE_CODE_DISCONNECT)
+	(Rcvid, Pulse) = self.Server.MsgReceive ()
+	self.assertEqual ((Rcvid, Pulse.code), (0, PULSE_CODE_DISCONNECT))
+	self.assertEqual (self.Cancelled, [("gone", errno.ENOTCONN)])
+	self.assertEqual (self.Server.Deferred.keys (), [Kept])
+
+    def test_disconnect_handler (self):
+	Handled = []
+	self.Server.AddPulseHandler (PULSE_CODE_DISCONNECT, lambda Server, Code, Value, Scoid: Handled.append (Code))
+	self.Send (self.Client, "gone")
+	self.Client.MsgSendPulse (Code = PULSE_CODE_DISCONNECT)
+	Other = self.Connect ()
+	Other.MsgSendPulse (Code = 6)
+	self.assertEqual (self.Server.MsgReceive () [1].code, 6)
+	self.assertEqual (Handled, [PULSE_CODE_DISCONNECT])
+	self.assertEqual (self.Cancelled, [("gone", errno.ENOTCONN)])
+
+    def test_expire (self):
+	self.Send (self.Client, "old")
+	self.assertEqual (self.Server.ExpireDeferred (10), 0)
+	self.assertEqual (self.Server.ExpireDeferred (0), 1)
+	self.Threads [0].join (5)
+	self.assertEqual (self.Replies, [(-1, errno.ETIMEDOUT)])
+	self.assertEqual (self.Cancelled, [("old", errno.ETIMEDOUT)])
+
+
+if __name__ == '__main__':
+    unittest.main ()
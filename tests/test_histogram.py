@@ -0,0 +1,76 @@
+import threading, time, unittest
+
+import tests.support
+
+from PyQNX6 import QNX
+from PyQNX6.Interrupt import Interrupt, Histogram
+
+
+class HistogramTest (unittest.TestCase):
+
+    def test_buckets (self):
+	for Value in (0, 5, 7, 8, 100, 1000, 12345, 10 ** 9, 2 ** 40 + 3):
+	    H = Histogram ()
+	    H.Add (Value)
+	    Upper = H.Percentile (50)
+	    self.assertEqual (Upper, Value)		# capped by the Max
+	    H.Add (Value * 2)
+	    Upper = H.Percentile (50)
+	    self.assertTrue (Value <= Upper <= Value * 1.25 + 1, (Value, Upper))
+
+    def test_percentile (self):
+	H = Histogram ("test")
+	for Value in range (1, 1001): H.Add (Value)
+	self.assertEqual ((H.Count, H.Max, H.Total), (1000, 1000, 500500))
+	for (Percent, Value) in ((50, 500), (90, 900), (99, 990)):
+	    self.assertTrue (Value <= H.Percentile (Percent) <= Value * 1.25, Percent)
+	self.assertEqual (H.Percentile (100), 1000)
+	H.Add (-5)
+	self.assertEqual (H.Counts [0], 1)
+
+    def test_report (self):
+	H = Histogram ("test")
+	self.assertEqual (H.Report (1.0), {'count': 0, 'mean': 0, 'p50': 0, 'p99': 0, 'max': 0})
+	for Value in (100, 200, 300): H.Add (Value)
+	Report = H.Report (1e-6)
+	self.assertEqual (sorted (Report), ['count', 'max', 'mean', 'p50', 'p99'])
+	self.assertEqual (Report ['count'], 3)
+	self.assertAlmostEqual (Report ['mean'], 200e-6)
+	self.assertAlmostEqual (Report ['max'], 300e-6)
+	self.assertTrue ("test n=3" in repr (H))
+	H.Reset ()
+	self.assertEqual ((H.Count, H.Max, H.Name), (0, 0, "test"))
+
+
+class InstrumentTest (unittest.TestCase):
+
+    def test_function (self):
+	Irq, Calls = 12, []
+	I = Interrupt (Irq = Irq)
+	Stats = I.Instrument ()
+	def Handler ():
+	    Calls.append (time.time ())
+	    time.sleep (0.01)
+	    return len (Calls) == 5
+	Thread = threading.Thread (target = I.InterruptFunction, args = (Handler,))
+	Thread.daemon = True
+	Thread.start ()
+	while Thread.is_alive () and I.Id == -1: time.sleep (0.001)
+	for Count in range (1, 6):
+	    QNX.lib.InterruptTrigger (Irq)
+	    Limit = time.time () + 5
+	    while len (Calls) < Count and time.time () < Limit: time.sleep (0.001)
+	Thread.join (5)
+	self.assertFalse (Thread.is_alive ())
+
+	Report = Stats.Report ()
+	self.assertEqual (sorted (Report), sorted (Stats.Names))
+	self.assertEqual ([Report [Name] ['count'] for Name in ('Masked', 'Handler', 'Latency', 'Interval')], [5, 5, 5, 4])
+	self.assertTrue (Report ['Handler'] ['p50'] >= 0.005)
+	self.assertTrue (Report ['Latency'] ['max'] >= Report ['Handler'] ['max'])
+	self.assertEqual (I.Instrument (False), None)
+	self.assertEqual (I.Stats, None)
+
+
+if __name__ == '__main__':
+    unittest.main ()
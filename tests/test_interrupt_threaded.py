@@ -0,0 +1,81 @@
+import time, unittest
+
+import tests.support
+
+from PyQNX6 import QNX
+from PyQNX6.Interrupt import Interrupt, InterruptRing
+
+
+def Until (Test, Timeout = 5):
+    Limit = time.time () + Timeout
+    while not Test ():
+	if time.time () > Limit: return False
+	time.sleep (0.001)
+    return True
+
+
+class InterruptRingTest (unittest.TestCase):
+
+    def test_ring (self):
+	Ring = InterruptRing (5)
+	self.assertEqual (Ring.Size, 8)
+	for Sequence in range (1, 11):
+	    Ring.Push (Sequence, Sequence * 10.0)
+	self.assertEqual ((len (Ring), Ring.Overflows), (8, 2))
+	self.assertEqual (Ring.Drain (3), [(1, 10.0), (2, 20.0), (3, 30.0)])
+	Ring.Push (11, 110.0)
+	self.assertEqual ([Sequence for (Sequence, Stamp) in Ring.Drain ()], [4, 5, 6, 7, 8, 11])
+	self.assertEqual (Ring.Drain (), [])
+
+
+class InterruptThreadedTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Irq = 11
+	self.Interrupt = Interrupt (Irq = self.Irq)
+	self.Records = []
+
+    def tearDown (self):
+	self.Interrupt.Stop ()
+	QNX.lib.InterruptTrigger (self.Irq)	# wakes the wait thread
+	self.Interrupt.Join (5)
+	self.assertFalse ([Thread for Thread in self.Interrupt.Threads if Thread.is_alive ()])
+
+    def Trigger (self, Count):
+	for i in range (Count):
+	    Expected = self.Interrupt.Count + 1
+	    QNX.lib.InterruptTrigger (self.Irq)
+	    self.assertTrue (Until (lambda: self.Interrupt.Count >= Expected))
+
+    def test_slow_handler (self):
+	def Handler (Records):
+	    time.sleep (0.02)
+	    self.Records.extend (Records)
+	self.Interrupt.InterruptThreaded (Handler, Handlers = 2)
+	Start = time.time ()
+	self.Trigger (20)
+	self.assertTrue (time.time () - Start < 0.2)	# the wait thread doesnt wait for the handler
+	self.assertTrue (Until (lambda: len (self.Records) == 20))
+	self.assertEqual (sorted ([Sequence for (Sequence, Stamp) in self.Records]), range (1, 21))
+	self.assertEqual (self.Interrupt.Ring.Overflows, 0)
+
+    def test_handler_errors (self):
+	def Handler (Records):
+	    self.Records.extend (Records)
+	    if len (self.Records) == 1: raise ValueError ("handler failed")
+	self.Interrupt.InterruptThreaded (Handler)
+	self.Trigger (3)
+	self.assertTrue (Until (lambda: len (self.Records) == 3))
+	self.assertEqual (self.Interrupt.Errors, 1)
+
+    def test_overflow (self):
+	def Handler (Records):
+	    time.sleep (0.5)
+	    self.Records.extend (Records)
+	self.Interrupt.InterruptThreaded (Handler, Size = 2, Batch = 1)
+	self.Trigger (6)
+	self.assertTrue (self.Interrupt.Ring.Overflows >= 2)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,48 @@
+import types, unittest
+
+from ctypes import CDLL, c_size_t, c_char_p
+
+import tests.support
+
+from PyQNX6 import core, QNX, Libc
+from PyQNX6.Message import Message
+from PyQNX6.Time import Timer
+
+
+class LibcTest (unittest.TestCase):
+
+    def setUp (self):
+	if QNX.lib == None: QNX ()
+	self.Backend = QNX.lib
+
+    def tearDown (self):
+	QNX.SetBackend (self.Backend)
+	core.Prototypes.pop ('strlen', None)
+
+    def test_shared (self):
+	self.assertTrue (Message._MsgSend is Message ()._MsgSend is QNX.lib.MsgSend)
+	self.assertTrue (Timer._timer_delete is QNX.lib.timer_delete)
+	self.assertTrue (core._Bound ['MsgSend'] is QNX.lib.MsgSend)
+
+    def test_set_backend (self):
+	Calls = []
+	Fake = types.ModuleType ("fake")
+	Fake.MsgSendPulse = lambda *Args: Calls.append (Args) or 0
+	QNX.SetBackend (Fake)
+	self.assertEqual (Message ().MsgSendPulse (3, 10, 1, 2), 0)
+	self.assertEqual (Calls, [(3, 10, 1, 2)])
+	QNX.SetBackend (self.Backend)
+	self.assertTrue (Message._MsgSendPulse is self.Backend.MsgSendPulse)
+
+    def test_prototype (self):
+	core.Prototypes ['strlen'] = (c_size_t, [c_char_p])
+	QNX.SetBackend (CDLL (None, use_errno = True))
+	class User (object):
+	    _strlen = Libc ("strlen")
+	self.assertEqual ((User._strlen.restype, User._strlen.argtypes), (c_size_t, [c_char_p]))
+	self.assertEqual (User ()._strlen ("abcd"), 4)
+	self.assertTrue (User._strlen is core.Bind ("strlen"))
+
+
+if __name__ == '__main__':
+    unittest.main ()
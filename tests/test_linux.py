@@ -0,0 +1,84 @@
+import os, errno, threading, unittest
+
+from ctypes import get_errno
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6.Message import Message
+from PyQNX6.Server import QNXServer
+from PyQNX6.Client import QNXClient
+
+
+def Echo (Server, Rcvid, Data):
+    if Data == "error": 
+	Server.MsgError (errno.EPERM)
+	return (0, None)
+    return (len (Data), Data [::-1] if isinstance (Data, str) else Data)
+
+
+class LinuxBackendTest (unittest.TestCase):
+
+    def test_channel_round_trip (self):
+	Server = Message ()
+	Server.ChannelCreate ()
+	Client = Message ()
+	Client.ConnectAttach (Chid = Server.chid)
+	Received = []
+	def Receive ():
+	    (Rcvid, Len) = Server.MsgReceive ()
+	    Received.append ((Server.RxData, Len))
+	    Server.MsgReply (7, "reply")
+	Thread = threading.Thread (target = Receive)
+	Thread.start ()
+	self.assertEqual (Client.MsgSend ("hello", 64) [0], 7)
+	Thread.join (5)
+	self.assertEqual (Received, [("hello", 5)])
+	self.assertEqual (Client.RxData [:5], "reply")
+	Client.ConnectDetach ()
+	Server.ChannelDestroy ()
+
+    def test_pulse (self):
+	Server = Message ()
+	Server.ChannelCreate ()
+	Server.ConnectAttach ()
+	self.assertEqual (Server.MsgSendPulse (Code = 5, Value = 1234), 0)
+	(Rcvid, Pulse) = Server.MsgReceive ()
+	self.assertEqual ((Rcvid, Pulse.code, Pulse.sigval.sival_int), (0, 5, 1234))
+	Server.ConnectDetach ()
+	Server.ChannelDestroy ()
+
+    def test_named_server (self):
+	Service = Name ("linux")
+	with ServerProcess (lambda: QNXServer (Service, Echo).Run (), Service):
+	    Client = QNXClient (Service)
+	    self.assertEqual (Client.MsgSend ("abc"), (3, 1))
+	    self.assertEqual (Client.RxData, "cba")
+	    self.assertEqual (Client.MsgSend ({"key": [1, 2]}) [0], 1)
+	    self.assertEqual (Client.MsgSend ("error") [0], -1)
+	    self.assertEqual (get_errno (), errno.EPERM)
+
+    def test_server_exits (self):
+	Service = Name ("linux")
+	def Exit (Server, Rcvid, Data):
+	    if Data == "exit": os._exit (0)
+	    return (0, Data)
+	with ServerProcess (lambda: QNXServer (Service, Exit).Run (), Service):
+	    Client = QNXClient (Service)
+	    self.assertEqual (Client.MsgSend ("exit") [0], -1)	# reply blocked as it exits, not waited for
+	    self.assertEqual (get_errno (), errno.ESRCH)
+
+    def test_server_gone (self):
+	Service = Name ("linux")
+	Server = ServerProcess (lambda: QNXServer (Service, Echo).Run (), Service)
+	Client = QNXClient (Service)
+	self.assertEqual (Client.MsgSend ("x") [0], 1)
+	Server.Stop ()
+	self.assertEqual (Client.MsgSend ("x") [0], -1)
+	self.assertEqual (get_errno (), errno.ESRCH)
+
+    def test_no_name (self):
+	self.assertEqual (Message ().name_open (Name ("missing")), None)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,69 @@
+import unittest
+
+from ctypes import *
+
+import tests.support
+
+from PyQNX6.Memory import DeviceMemory
+
+
+class Regs (Structure):
+    _fields_ = [('data', c_uint32), ('status', c_uint32)]
+
+
+class DeviceMemoryTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Memory = DeviceMemory (0x10000, 0x1000)
+
+    def tearDown (self):
+	self.Memory.Close ()
+
+    def test_shared (self):
+	with DeviceMemory (0x10000, 0x1000) as Other:
+	    self.Memory.Write32 (8, 0xdeadbeef)
+	    self.assertEqual (Other.Read32 (8), 0xdeadbeef)
+	    self.assertEqual ((Other.Read8 (8), Other.Read16 (10)), (0xef, 0xdead))
+	    Other.Write64 (16, 2 ** 40 + 1)
+	    self.assertEqual (self.Memory.Read64 (16), 2 ** 40 + 1)
+	self.assertEqual (len (self.Memory), 0x1000)
+
+    def test_overlay (self):
+	Uart = self.Memory.Overlay (Regs, 0x100)
+	Uart.status = 1
+	self.assertEqual (self.Memory.Read32 (0x104), 1)
+	self.Memory.Write32 (0x100, 0x41)
+	self.assertEqual (Uart.data, 0x41)
+	self.assertRaises (IndexError, self.Memory.Overlay, Regs, 0xffc)
+
+    def test_view (self):
+	self.Memory.View [0:4] = "abcd"
+	self.assertEqual (self.Memory.Read (0, 4), "abcd")
+	self.assertEqual (self.Memory.View [0:4].tobytes (), "abcd")
+	self.assertEqual (len (self.Memory.Read (0x800)), 0x800)
+
+    def test_write (self):
+	self.Memory.Write (0x20, "str")
+	self.Memory.Write (0x23, bytearray ("ba"))
+	self.Memory.Write (0x25, buffer ("ro"))			# read only, copied
+	self.Memory.Write (0x27, memoryview ("mv"))
+	self.assertEqual (self.Memory.Read (0x20, 9), "strbaromv")
+
+    def test_bounds (self):
+	self.assertRaises (IndexError, self.Memory.Read32, 0x1000)
+	self.assertRaises (IndexError, self.Memory.Read32, -4)
+	self.assertRaises (IndexError, self.Memory.Write, 0xfff, "ab")
+	self.Memory.Close ()
+	self.assertRaises (ValueError, self.Memory.Read8, 0)
+	self.Memory.Close ()
+
+    def test_array (self):
+	try: import numpy
+	except ImportError: return
+	Array = self.Memory.Array ('uint32', 0x40, 4)
+	Array [:] = [1, 2, 3, 4]
+	self.assertEqual (self.Memory.Read32 (0x4c), 4)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,104 @@
+import collections, threading, time, unittest
+
+import tests.support
+
+from PyQNX6 import QNX
+from PyQNX6.Interrupt import Interrupt
+
+
+def Until (Test, Timeout = 5):
+    Limit = time.time () + Timeout
+    while not Test ():
+	if time.time () > Limit: return False
+	time.sleep (0.001)
+    return True
+
+
+class InterruptPolledTest (unittest.TestCase):
+    """
+    A 'device' with a queue of work, an interrupt is raised when work is queued.
+    """
+    def setUp (self):
+	self.Irq = 13
+	self.Queue = collections.deque ()
+	self.Interrupt = Interrupt (Irq = self.Irq)
+	self.Result = []
+
+    def Start (self, Poll = None, **Args):
+	def Run ():
+	    self.Result.append (self.Interrupt.InterruptPolled (Poll or self.Poll, **Args))
+	self.Thread = threading.Thread (target = Run)
+	self.Thread.daemon = True
+	self.Thread.start ()
+	self.assertTrue (Until (lambda: self.Interrupt.Id != -1))
+
+    def tearDown (self):
+	self.Interrupt.Stop ()
+	QNX.lib.InterruptTrigger (self.Irq)
+	self.Thread.join (5)
+	self.assertFalse (self.Thread.is_alive ())
+
+    def Poll (self, Budget):
+	Done = 0
+	while self.Queue and Done < Budget:
+	    self.Queue.popleft ()
+	    Done += 1
+	return Done
+
+    def Raise (self, Count):
+	self.Queue.extend (range (Count))
+	QNX.lib.InterruptTrigger (self.Irq)
+
+    def test_burst (self):
+	self.Start (Budget = 16, Threshold = 1, Rounds = 100)
+	self.Raise (100)
+	self.assertTrue (Until (lambda: self.Interrupt.Work == 100))
+	Report = self.Interrupt.PollReport ()
+	self.assertEqual (Report ['wakes'], 1)
+	self.assertEqual (Report ['polls'], 8)		# 7 with work, the last finds none
+	self.assertEqual (Report ['exhausted'], 0)
+	self.assertEqual (Report ['work_per_wake'], 100.0)
+	self.assertEqual (Report ['work_per_poll'], 12.5)
+
+    def test_threshold (self):
+	self.Start (Budget = 16, Threshold = 16, Rounds = 100)
+	self.Raise (20)
+	self.assertTrue (Until (lambda: self.Interrupt.Work == 20))
+	self.assertEqual (self.Interrupt.Polls, 2)	# a short poll returns to interrupt mode
+
+    def test_rounds (self):
+	self.Start (Budget = 10, Threshold = 1, Rounds = 3)
+	self.Raise (50)
+	self.assertTrue (Until (lambda: self.Interrupt.Exhausted == 1))
+	self.assertEqual ((self.Interrupt.Polls, self.Interrupt.Work, len (self.Queue)), (3, 30, 20))
+	Wakes = self.Interrupt.Wakes
+	QNX.lib.InterruptTrigger (self.Irq)		# unmasked, so the next interrupt is taken
+	self.assertTrue (Until (lambda: not self.Queue))
+	self.assertTrue (Until (lambda: self.Interrupt.Wakes == Wakes + 1))
+
+    def test_stop (self):
+	self.Start (Budget = 10)
+	self.Interrupt.Stop ()
+	QNX.lib.InterruptTrigger (self.Irq)
+	self.Thread.join (5)
+	self.assertEqual (self.Result, [0])
+	self.assertEqual (self.Interrupt.Id, -1)
+
+    def test_error (self):
+	def Poll (Budget):
+	    raise ValueError ("poll failed")
+	self.Start (Poll)
+	QNX.lib.InterruptTrigger (self.Irq)
+	self.Thread.join (5)
+	self.assertEqual ((self.Result, self.Interrupt.Errors), ([-1], 1))
+
+    def test_instrument (self):
+	Stats = self.Interrupt.Instrument ()
+	self.Start (Budget = 16, Threshold = 1)
+	self.Raise (40)
+	self.assertTrue (Until (lambda: Stats.Masked.Count == 1))
+	self.assertEqual ((Stats.Handler.Count, Stats.Latency.Count), (4, 4))
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,53 @@
+import unittest
+from array import array
+
+import tests.support
+
+from PyQNX6 import QNX, Ports
+
+
+class PortsTest (unittest.TestCase):
+
+    def setUp (self):
+	if QNX.lib == None: QNX ()
+	self.Written = []
+	self.Fifo = iter (range (1, 1000))
+	QNX.lib.AttachPort (0x3f8, lambda Width: next (self.Fifo), lambda Value, Width: self.Written.append ((Value, Width)))
+
+    def tearDown (self):
+	QNX.lib.DetachPort (0x3f8)
+	QNX.lib.DetachPort (0x80)
+
+    def test_in (self):
+	self.assertEqual (Ports.in8s (0x3f8, 4), bytearray ([1, 2, 3, 4]))
+	self.assertEqual (Ports.in16s (0x3f8, 2).tolist (), [5, 6])
+	Into = bytearray (3)
+	self.assertTrue (Ports.in8s (0x3f8, Into = Into) is Into)
+	self.assertEqual (Into, bytearray ([7, 8, 9]))
+	self.assertEqual (Ports.in32s (0x3f8, 0).tolist (), [])
+
+    def test_no_count (self):
+	for In in (Ports.in8s, Ports.in16s, Ports.in32s):
+	    self.assertRaises (ValueError, In, 0x3f8)
+
+    def test_out (self):
+	self.assertEqual (Ports.out8s (0x3f8, "ab"), 2)
+	self.assertEqual (Ports.out16s (0x3f8, array ('H', [0x1234])), 1)
+	self.assertEqual (Ports.out8s (0x3f8, bytearray ("c")), 1)
+	self.assertEqual (self.Written, [(97, 1), (98, 1), (0x1234, 2), (99, 1)])
+
+    def test_out_readonly (self):
+	Data = "\x01\x02\x03\x04"
+	self.assertEqual (Ports.out8s (0x3f8, buffer (Data)), 4)
+	self.assertEqual (Ports.out16s (0x3f8, memoryview (Data)), 2)
+	self.assertEqual (self.Written, [(1, 1), (2, 1), (3, 1), (4, 1), (0x0201, 2), (0x0403, 2)])
+	self.assertRaises (TypeError, Ports.in8s, 0x3f8, Into = buffer (Data))
+
+    def test_vector (self):
+	self.assertEqual (Ports.outv ([0x80, 0x3f8], [0x55, 0x66]), 2)
+	self.assertEqual (self.Written, [(0x66, 1)])
+	self.assertEqual (Ports.inv ([0x80, 0x3f8, 0x80]).tolist (), [0x55, 1, 0x55])
+
+
+if __name__ == '__main__':
+    unittest.main ()
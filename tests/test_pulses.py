@@ -0,0 +1,70 @@
+import time, unittest
+
+from tests.support import Name
+
+from PyQNX6 import PULSE_CODE_DISCONNECT
+from PyQNX6.Message import Message
+from PyQNX6.Server import QNXServerThreaded
+from PyQNX6.Client import QNXClient
+
+
+class PulseTableTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Server = Message ()
+	self.Server.ChannelCreate (Message._NTO_CHF_DISCONNECT)
+	self.Client = Message ()
+	self.Client.ConnectAttach (Chid = self.Server.chid)
+	self.Handled = []
+
+    def tearDown (self):
+	self.Client.ConnectDetach ()
+	self.Server.ChannelDestroy ()
+
+    def Handler (self, Server, Code, Value, Scoid):
+	self.Handled.append ((Server, Code, Value))
+
+    def test_handled_not_returned (self):
+	self.Server.AddPulseHandler (5, self.Handler)
+	for (Code, Value) in ((5, 1), (5, 2), (6, 3)):
+	    self.Client.MsgSendPulse (Code = Code, Value = Value)
+	(Rcvid, Pulse) = self.Server.MsgReceive ()
+	self.assertEqual ((Rcvid, Pulse.code, Pulse.sigval.sival_int), (0, 6, 3))
+	self.assertEqual (self.Handled, [(self.Server, 5, 1), (self.Server, 5, 2)])
+
+    def test_remove (self):
+	self.Server.AddPulseHandler (5, self.Handler)
+	self.Server.RemovePulseHandler (5)
+	self.Client.MsgSendPulse (Code = 5, Value = 1)
+	self.assertEqual (self.Server.MsgReceive () [1].code, 5)
+	self.assertEqual (self.Handled, [])
+
+    def test_system_code (self):
+	self.Server.AddPulseHandler (PULSE_CODE_DISCONNECT, self.Handler)
+	self.Server.AddPulseHandler (7, self.Handler)
+	self.Client.ConnectDetach ()
+	Other = Message ()
+	Other.ConnectAttach (Chid = self.Server.chid)
+	Other.MsgSendPulse (Code = 8)
+	self.assertEqual (self.Server.MsgReceive () [1].code, 8)
+	self.assertEqual ([Code for (Server, Code, Value) in self.Handled], [PULSE_CODE_DISCONNECT])
+	Other.ConnectDetach ()
+
+    def test_pool_workers_share (self):
+	Service = Name ("pulses")
+	Pool = QNXServerThreaded (Service, lambda Worker, Rcvid, Data: (0, len (self.Handled)),
+				  LoWater = 2)
+	Pool.AddPulseHandler (9, self.Handler)
+	Pool.Start ()
+	Client = QNXClient (Service)
+	for Value in range (4): Client.MsgSendPulse (Code = 9, Value = Value)
+	time.sleep (0.1)
+	Client.MsgSend ("count")
+	self.assertEqual (Client.RxData, 4)
+	self.assertEqual (sorted ([Value for (Server, Code, Value) in self.Handled]), range (4))
+	Pool.Stop ()
+	Pool.Join (5)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,75 @@
+import errno, threading, time, unittest
+
+from ctypes import get_errno, set_errno
+
+from tests.support import Name
+
+from PyQNX6.Dispatch import Reactor
+from PyQNX6.Client import QNXClient
+
+
+class ReactorTest (unittest.TestCase):
+
+    def setUp (self):
+	self.R = Reactor ()
+	self.Thread = None
+
+    def tearDown (self):
+	if self.Thread != None and self.Thread.is_alive ():
+	    self.R.Stop ()
+	    self.Thread.join (5)
+
+    def Start (self):
+	self.Thread = threading.Thread (target = self.R.Run)
+	self.Thread.daemon = True
+	self.Thread.start ()
+	Limit = time.time () + 5
+	while not self.R.Running and time.time () < Limit: time.sleep (0.01)
+
+    def Stopped (self):
+	"""
+	Wait for Run to return, then Close.
+	"""
+	self.Thread.join (5)
+	self.assertFalse (self.Thread.is_alive ())
+	set_errno (0)
+	self.R.Close ()
+	self.assertNotEqual (get_errno (), errno.ESRCH)
+	self.assertEqual (self.R.Errors, 0)
+
+    def test_stop (self):
+	self.Start ()
+	time.sleep (0.05)		# blocked in MsgReceive
+	self.R.Stop ()
+	self.Stopped ()
+
+    def test_stop_after (self):
+	self.R.After (0.05, self.R.Stop)
+	self.Start ()
+	self.Stopped ()
+
+    def test_timer (self):
+	Ticks = []
+	def Tick ():
+	    Ticks.append (time.time ())
+	    if len (Ticks) == 3: self.R.Stop ()
+	self.R.Timer (0.01, Tick)
+	self.Start ()
+	self.Stopped ()
+	self.assertTrue (len (Ticks) >= 3)	# one may have been queued before the stop
+
+    def test_stop_from_function (self):
+	Service = Name ("reactor")
+	def Serve (Reactor, Rcvid, Data):
+	    Reactor.Stop ()
+	    return (0, Data)
+	self.R.Attach (Service, Serve)
+	self.Start ()
+	Client = QNXClient (Service)
+	self.assertEqual (Client.MsgSend ("last") [0], 0)
+	self.assertEqual (Client.RxData, "last")
+	self.Stopped ()
+
+
+if __name__ == '__main__':
+    unittest.main ()
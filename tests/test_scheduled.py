@@ -0,0 +1,85 @@
+import errno, threading, time, unittest
+
+from ctypes import get_errno
+
+from tests.support import Name
+
+from PyQNX6 import Codec
+from PyQNX6.Server import QNXServerScheduled
+from PyQNX6.Client import QNXClient
+
+
+class ScheduledTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Handled = []
+	self.Busy = threading.Event ()
+	self.Release = threading.Event ()
+
+    def tearDown (self):
+	self.Release.set ()
+	self.Pool.Stop ()
+	self.Pool.Join (5)
+
+    def Function (self, Worker, Rcvid, Data):
+	if Rcvid == 0:
+	    self.Handled.append (Data.code)
+	    return None
+	if Data == "block":
+	    self.Busy.set ()
+	    self.Release.wait (5)
+	self.Handled.append (Data)
+	return (0, Data)
+
+    def Start (self, **Args):
+	self.Service = Name ("scheduled")
+	self.Pool = QNXServerScheduled (self.Service, self.Function, Start = True, **Args)
+	self.Client = QNXClient (self.Service)
+
+    def Block (self):
+	"""
+	Occupy a worker until Release is set.
+	"""
+	Thread = threading.Thread (target = QNXClient (self.Service).MsgSend, args = ("block",))
+	Thread.daemon = True
+	Thread.start ()
+	self.assertTrue (self.Busy.wait (5))
+
+    def Until (self, Count):
+	Limit = time.time () + 5
+	while len (self.Handled) < Count and time.time () < Limit: time.sleep (0.01)
+
+    def test_priority_order (self):
+	self.Start (Workers = 1)
+	self.Block ()
+	for Priority in (5, 10, 20, 15):
+	    self.Client.MsgSendPulse (Priority = Priority, Code = Priority)
+	    time.sleep (0.05)		# each is received before the next is sent
+	self.Release.set ()
+	self.Until (5)
+	self.assertEqual (self.Handled, ["block", 20, 15, 10, 5])
+	self.assertEqual (sorted (self.Pool.Waited), [5, 10, 15, 20])
+
+    def test_reserve (self):
+	self.Start (Workers = 2, Reserve = {20: 1})
+	self.Block ()			# the unreserved worker
+	self.Client.MsgSendPulse (Priority = 5, Code = 5)
+	self.Client.MsgSendPulse (Priority = 20, Code = 20)
+	self.Until (1)
+	time.sleep (0.1)
+	self.assertEqual (self.Handled, [20])		# 5 waits for the unreserved worker
+	self.Release.set ()
+	self.Until (3)
+	self.assertEqual (self.Handled, [20, "block", 5])
+
+    def test_bad_message (self):
+	self.Start (Workers = 1)
+	Unknown = Codec.Header.pack (Codec.CODEC_MAGIC, 99, 0, 1) + "x"
+	self.assertEqual (self.Client.MsgSend (Unknown, RawMode = True) [0], -1)
+	self.assertEqual (get_errno (), errno.EBADMSG)
+	self.assertEqual (self.Client.MsgSend ("next") [0], 0)
+	self.assertEqual (self.Client.RxData, "next")
+
+
+if __name__ == '__main__':
+    unittest.main ()
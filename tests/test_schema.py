@@ -0,0 +1,61 @@
+import struct, unittest
+
+from ctypes import c_int32, c_uint8, c_int16, c_double, c_char
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6 import Schema
+from PyQNX6.Schema import MessageType
+from PyQNX6.Server import QNXServer
+from PyQNX6.Client import QNXClient
+
+
+class Sample (MessageType):
+    TypeId = 0x210
+    _fields_ = [('Flag', c_uint8), ('Value', c_double), ('One', c_int32 * 1),
+		('Three', c_int16 * 3), ('Label', c_char * 8)]
+
+class Answer (MessageType):
+    TypeId = 0x211
+    _fields_ = [('Total', c_int32)]
+
+
+def Handler (Server, Rcvid, Data):
+    if isinstance (Data, Sample):
+	return (0, Answer (Data.One [0] + sum (Data.Three)))
+    return (1, ("coded", Data))
+
+
+class SchemaTest (unittest.TestCase):
+
+    def test_layout (self):
+	Message = Sample (1, 2.5, (7,), (1, 2, 3), "abc")
+	Data = Message.Pack ()
+	self.assertEqual (len (Data), Sample.Size)
+	self.assertEqual (len (Data), 40)		# C alignment, the double at 8
+	self.assertEqual (struct.unpack_from ("=H", Data) [0], 0x210)
+	Copy = Sample.Unpack (Data)
+	self.assertEqual (Copy, Message)
+	self.assertEqual ((Copy.One, Copy.Three, Copy.Label), ((7,), (1, 2, 3), "abc"))
+	self.assertEqual (Schema.Decode (Data), Message)
+	self.assertEqual (Schema.Decode (Data [:10]), None)
+
+    def test_codec_magic_refused (self):
+	def Define ():
+	    class Clash (MessageType):
+		TypeId = 0x1c5
+	self.assertRaises (ValueError, Define)
+
+    def test_round_trip (self):
+	Service = Name ("schema")
+	with ServerProcess (lambda: QNXServer (Service, Handler, Types = True).Run (), Service):
+	    Client = QNXClient (Service, CodecName = "pickle")
+	    self.assertEqual (Client.MsgSend (Sample (One = (4,), Three = (1, 1, 1))), (0, Answer.Size))
+	    self.assertEqual (Client.RxData, Answer (7))
+	    # a coded message is decoded by its codec, not sniffed for a type
+	    self.assertEqual (Client.MsgSend ("x"), (1, 1))
+	    self.assertEqual (Client.RxData, ("coded", "x"))
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,78 @@
+import os, errno, unittest
+
+from ctypes import get_errno
+
+import tests.support
+
+from PyQNX6.Message import Message
+from PyQNX6.SharedMemory import SharedMemoryChannel, ShmDescriptor
+
+
+def Serve (Name):
+    """
+    Reply to each payload with its length and its first and last bytes.
+    """
+    Server = SharedMemoryChannel (Name, Attach = True)
+    while True:
+	(Rcvid, Len) = Server.MsgReceive ()
+	if Rcvid <= 0: continue
+	Data = Server.RxData
+	if Server.Payload: Data = Data.tobytes ()
+	Server.MsgReply (0, "%d %s %s" % (len (Data), Data [:1], Data [-1:]))
+
+
+class SharedMemoryChannelTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Name = tests.support.Name ("shm")
+	self.Server = tests.support.ServerProcess (lambda: Serve (self.Name), self.Name)
+	self.Channel = SharedMemoryChannel (self.Name, Slots = 2, SlotSize = 4096)
+
+    def tearDown (self):
+	self.Channel.Close ()
+	self.Server.Stop ()
+
+    def Reply (self, Result):
+	self.assertEqual (Result [0], 0)
+	return Result [1].rstrip ("\0")
+
+    def test_payloads (self):
+	Data = "a" + "x" * 3000 + "z"
+	self.assertEqual (self.Reply (self.Channel.SendPayload (Data)), "3002 a z")
+	self.assertEqual (self.Reply (self.Channel.SendPayload (bytearray (Data))), "3002 a z")
+	self.assertEqual (self.Reply (self.Channel.SendPayload (buffer (Data))), "3002 a z")
+	self.assertEqual (self.Reply (self.Channel.SendPayload (memoryview (Data) [1:])), "3001 x z")
+	self.assertFalse ([Slot for Slot in self.Channel.Slots if Slot.Busy])
+
+    def test_in_place (self):
+	Slot = self.Channel.Alloc ()
+	Slot.View [:3] = "abc"
+	self.assertEqual (self.Reply (self.Channel.Send (Slot, 3)), "3 a c")
+	Slot = self.Channel.Alloc ()
+	Slot.View [0], Slot.View [-1] = "q", "r"
+	self.assertEqual (self.Reply (self.Channel.Send (Slot)), "4096 q r")	# the whole slot
+
+    def test_ring (self):
+	Slots = [self.Channel.Alloc (), self.Channel.Alloc ()]
+	self.assertEqual (self.Channel.Alloc (Wait = False), None)
+	self.Channel.Release (Slots [0])
+	self.assertTrue (self.Channel.Alloc (Wait = False) is Slots [0])
+	self.assertRaises (ValueError, self.Channel.Alloc, 4097)
+	self.assertRaises (ValueError, self.Channel.SendPayload, "x" * 5000)
+
+    def test_stale (self):
+	Slot = self.Channel.Alloc ()
+	Stale = ShmDescriptor (self.Channel.Region, Slot.Generation - 1, Slot.Offset, 1)
+	self.assertEqual (Message.MsgSend (self.Channel, Stale) [0], -1)
+	self.assertEqual (get_errno (), errno.ESTALE)
+	Wrong = ShmDescriptor (self.Channel.Region, Slot.Generation, Slot.Offset + 1, 1)
+	self.assertEqual (Message.MsgSend (self.Channel, Wrong) [0], -1)
+	self.assertEqual (get_errno (), errno.EINVAL)
+
+    def test_messages (self):
+	self.assertEqual (Message.MsgSend (self.Channel, "plain") [0], 0)
+	self.assertEqual (self.Channel.RxData.rstrip ("\0"), "5 p n")
+
+
+if __name__ == '__main__':
+    unittest.main ()
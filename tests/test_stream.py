@@ -0,0 +1,72 @@
+import threading, tempfile, unittest
+
+import tests.support
+
+from PyQNX6.Message import Message, MessageStream
+
+
+class StreamTest (unittest.TestCase):
+
+    Data = "".join ([chr (i % 251) for i in range (10000)])
+
+    def setUp (self):
+	self.Server = Message (StreamMode = True)
+	self.Server.ChannelCreate ()
+	self.Client = Message ()
+	self.Client.ConnectAttach (Chid = self.Server.chid)
+	self.Thread = threading.Thread (target = self.Client.MsgSend, args = (self.Data, 16))
+	self.Thread.start ()
+	(self.Rcvid, self.Len) = self.Server.MsgReceive (1024)
+	self.Stream = self.Server.RxData
+
+    def tearDown (self):
+	self.Server.MsgReply (0, "done", Rcvid = self.Rcvid)
+	self.Thread.join (5)
+	self.assertEqual (self.Client.RxData [:4], "done")
+	self.Client.ConnectDetach ()
+	self.Server.ChannelDestroy ()
+
+    def test_stream (self):
+	self.assertTrue (isinstance (self.Stream, MessageStream))
+	self.assertEqual ((self.Len, len (self.Stream)), (10000, 10000))
+
+    def test_read (self):
+	self.assertEqual (self.Stream.Read (100), self.Data [:100])
+	self.assertEqual (self.Stream.Offset, 100)
+	self.assertEqual (self.Stream.Read (1000), self.Data [100:1024])	# the rest of the head
+	Rest = []
+	while True:
+	    Data = self.Stream.Read (4096)
+	    if not Data: break
+	    self.assertTrue (len (Data) <= 4096)
+	    Rest.append (Data)
+	self.assertTrue ("".join (Rest) == self.Data [1024:])
+
+    def test_chunks (self):
+	Chunks = list (self.Stream.Chunks (3000))
+	self.assertEqual ([len (Chunk) for Chunk in Chunks], [1024, 3000, 3000, 2976])
+	self.assertTrue ("".join (Chunks) == self.Data)
+	Chunks = list (self.Server.RxData.Chunks (500))		# at the end
+	self.assertEqual (Chunks, [])
+
+    def test_small_chunks (self):
+	Chunks = [Chunk.tobytes () if isinstance (Chunk, memoryview) else Chunk 
+			for Chunk in self.Stream.Chunks (300, View = True)]
+	self.assertEqual (max ([len (Chunk) for Chunk in Chunks]), 300)
+	self.assertTrue ("".join (Chunks) == self.Data)
+
+    def test_read_into (self):
+	File = tempfile.TemporaryFile ()
+	self.assertEqual (self.Stream.ReadInto (File, 700), 10000)
+	File.seek (0)
+	self.assertTrue (File.read () == self.Data)
+	self.assertEqual (self.Stream.ReadInto (File), 0)
+
+    def test_read_into_function (self):
+	Chunks = []
+	self.Stream.ReadInto (lambda Data, Offset: Chunks.append ((Offset, Data.tobytes () if isinstance (Data, memoryview) else Data)), 4000)
+	self.assertEqual ([(Offset, len (Data)) for (Offset, Data) in Chunks], [(0, 1024), (1024, 4000), (5024, 4000), (9024, 976)])
+
+
+if __name__ == '__main__':
+    unittest.main ()
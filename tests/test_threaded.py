@@ -0,0 +1,61 @@
+import time, threading, unittest
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6.Server import QNXServerThreaded
+from PyQNX6.Client import QNXClient
+
+
+def Slow (Worker, Rcvid, Data):
+    time.sleep (Data)
+    return (0, Worker.name)
+
+
+def Serve (Service, **Args):
+    def Run ():
+	Pool = QNXServerThreaded (Service, Slow, **Args)
+	Pool.Start ()
+	Pool.Join ()
+    return ServerProcess (Run, Service)
+
+
+class ThreadedTest (unittest.TestCase):
+
+    def Concurrent (self, Service, Count, Delay):
+	"""
+	@return the worker names and the elapsed time of Count sends at once.
+	"""
+	Workers = []
+	def Send ():
+	    Client = QNXClient (Service)
+	    Client.MsgSend (Delay)
+	    Workers.append (Client.RxData)
+	Threads = [threading.Thread (target = Send) for i in range (Count)]
+	Start = time.time ()
+	for Thread in Threads: Thread.start ()
+	for Thread in Threads: Thread.join (10)
+	return (Workers, time.time () - Start)
+
+    def test_default_grows (self):
+	Service = Name ("threaded")
+	with Serve (Service):
+	    (Workers, Elapsed) = self.Concurrent (Service, 4, 0.5)
+	self.assertEqual (len (set (Workers)), 4)
+	self.assertTrue (Elapsed < 1.5, Elapsed)
+
+    def test_maximum (self):
+	Service = Name ("threaded")
+	with Serve (Service, Maximum = 2):
+	    (Workers, Elapsed) = self.Concurrent (Service, 4, 0.3)
+	self.assertEqual (len (Workers), 4)
+	self.assertTrue (Elapsed >= 0.55, Elapsed)	# two at a time
+
+    def test_pool_sizes (self):
+	Pool = QNXServerThreaded (Name ("threaded"), Slow, LoWater = 2, Increment = 3)
+	self.assertEqual ((Pool.HiWater, Pool.Maximum > 1000), (5, True))
+	Pool = QNXServerThreaded (Name ("threaded"), Slow, LoWater = 2, HiWater = 4, Maximum = 1)
+	self.assertEqual ((Pool.HiWater, Pool.Maximum), (4, 2))
+
+
+if __name__ == '__main__':
+    unittest.main ()
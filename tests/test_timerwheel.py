@@ -0,0 +1,57 @@
+import random, time, unittest
+
+import tests.support
+
+from PyQNX6.Message import Message
+from PyQNX6.Time import TimerWheel
+
+
+class TimerWheelTest (unittest.TestCase):
+
+    def test_exact_ticks (self):
+	# small wheels (4 slots, 3 levels, 64 ticks) so timeouts cascade and go beyond them
+	Wheel = TimerWheel (Tick = 1.0, Bits = 2, Levels = 3)
+	Random = random.Random (1)
+	Fired, Expected = [], {}
+	for Index in range (500):
+	    Ticks = Random.randint (1, 200)
+	    Wheel.Add (Ticks, lambda Index = Index: Fired.append ((Index, Wheel.Now)))
+	    Expected [Index] = Wheel.Now + Ticks
+	    if Index % 5 == 0: Wheel.Advance (Random.randint (0, 3))
+	Wheel.Advance (400)
+	self.assertEqual (dict (Fired), Expected)
+	self.assertEqual (Wheel.Count, 500)
+
+    def test_cancel (self):
+	Wheel = TimerWheel (Tick = 0.01)
+	Fired = []
+	Kept = Wheel.Add (0.05, Fired.append, "kept")
+	Cancelled = Wheel.Add (0.05, Fired.append, "cancelled")
+	Wheel.Add (0.02, Cancelled.Cancel)
+	Wheel.Advance (10)
+	self.assertEqual (Fired, ["kept"])
+	self.assertFalse (Kept.Cancel ())		# already fired
+
+    def test_pulses (self):
+	Server = Message ()
+	Server.ChannelCreate ()
+	Client = Message ()
+	Client.ConnectAttach (Chid = Server.chid)
+	Wheel = TimerWheel (Server, Tick = 0.01)
+	Fired = []
+	Start = time.time ()
+	for Delay in (0.05, 0.1, 0.15):
+	    Wheel.Add (Delay, lambda Delay = Delay: Fired.append ((Delay, time.time () - Start)))
+	Wheel.Add (0.2, Client.MsgSendPulse, None, 10, 1)	# wakes the receive
+	(Rcvid, Pulse) = Server.MsgReceive ()
+	self.assertEqual ((Rcvid, Pulse.code), (0, 1))
+	self.assertEqual ([Delay for (Delay, At) in Fired], [0.05, 0.1, 0.15])
+	for (Delay, At) in Fired:
+	    self.assertTrue (Delay <= At < Delay + 0.1, (Delay, At))
+	Wheel.Close ()
+	Client.ConnectDetach ()
+	Server.ChannelDestroy ()
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,73 @@
+import array, threading, unittest
+
+from ctypes import Structure, c_int, sizeof
+
+import tests.support
+
+from PyQNX6.Message import Message
+
+
+class Header (Structure):
+    _fields_ = [('Kind', c_int), ('Length', c_int)]
+
+
+class VectoredTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Server = Message ()
+	self.Server.ChannelCreate ()
+	self.Client = Message ()
+	self.Client.ConnectAttach (Chid = self.Server.chid)
+
+    def tearDown (self):
+	self.Client.ConnectDetach ()
+	self.Server.ChannelDestroy ()
+
+    def Serve (self, Function):
+	Thread = threading.Thread (target = Function)
+	Thread.start ()
+	return Thread
+
+    def test_send_parts (self):
+	Frame = bytearray ("frame" * 10)
+	Received = []
+	def Receive ():
+	    (Rcvid, Len) = self.Server.MsgReceive (RawMode = True, View = True, Copy = True)
+	    Received.append (self.Server.RxData)
+	    self.Server.MsgReplyv (3, [Header (2, 4), "done"])
+	Thread = self.Serve (Receive)
+	ReplyHeader, ReplyData = Header (), bytearray (4)
+	Result = self.Client.MsgSendv ([Header (1, len (Frame)), memoryview (Frame), array.array ('B', [1, 2])],
+				       [ReplyHeader, ReplyData])
+	Thread.join (5)
+	self.assertEqual (Result, 3)
+	self.assertEqual (Received [0], buffer (Header (1, 50)) [:] + str (Frame) + "\x01\x02")
+	self.assertEqual ((ReplyHeader.Kind, ReplyHeader.Length, str (ReplyData)), (2, 4, "done"))
+
+    def test_receive_parts (self):
+	Into = [Header (), bytearray (3), bytearray (8)]
+	Received = []
+	def Receive ():
+	    Received.append (self.Server.MsgReceivev (Into))
+	    self.Server.MsgReply (0, "ok")
+	Thread = self.Serve (Receive)
+	self.Client.MsgSend (buffer (Header (9, 3)) [:] + "abcdefg", 16, RawMode = True)
+	Thread.join (5)
+	self.assertEqual (Received [0] [1], sizeof (Header) + 7)
+	self.assertEqual ((Into [0].Kind, str (Into [1]), str (Into [2]) [:4]), (9, "abc", "defg"))
+
+    def test_read_only_parts (self):
+	Received = []
+	def Receive ():
+	    self.Server.MsgReceive (RawMode = True, View = True, Copy = True)
+	    Received.append (self.Server.RxData)
+	    self.Server.MsgReplyv (0, [memoryview ("read only")])
+	Thread = self.Serve (Receive)
+	Reply = bytearray (9)
+	self.Client.MsgSendv ([memoryview ("abc"), buffer ("def")], [Reply])
+	Thread.join (5)
+	self.assertEqual ((Received [0], str (Reply)), ("abcdef", "read only"))
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,64 @@
+import threading, unittest
+
+import tests.support
+
+from PyQNX6.Message import Message
+
+
+class ViewTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Server = Message (ViewMode = True)
+	self.Server.ChannelCreate ()
+	self.Client = Message (ViewMode = True)
+	self.Client.ConnectAttach (Chid = self.Server.chid)
+
+    def tearDown (self):
+	self.Client.ConnectDetach ()
+	self.Server.ChannelDestroy ()
+
+    def Exchange (self, Requests, Replies, RxLen = 16):
+	"""
+	@return what the server received and the client's (result, length, reply) for each.
+	"""
+	Received = []
+	def Receive ():
+	    for Reply in Replies:
+		(Rcvid, Len) = self.Server.MsgReceive ()
+		Received.append ((type (self.Server.RxData), Len, self.Server.RxData.tobytes ()))
+		self.Server.MsgReply (len (Reply), Reply)
+	Thread = threading.Thread (target = Receive)
+	Thread.start ()
+	Sent = []
+	for Request in Requests:
+	    (Result, Len) = self.Client.MsgSend (Request, RxLen)
+	    Sent.append ((Result, Len, self.Client.RxData.tobytes ()))
+	Thread.join (5)
+	return (Received, Sent)
+
+    def test_binary_message (self):
+	(Received, Sent) = self.Exchange (["a\0b\0\0"], ["\0\0ok"])
+	self.assertEqual (Received, [(memoryview, 5, "a\0b\0\0")])
+	self.assertEqual (Sent [0] [:2], (4, 16))
+	self.assertEqual (Sent [0] [2] [:4], "\0\0ok")
+
+    def test_short_reply_after_long (self):
+	(Received, Sent) = self.Exchange (["1", "2"], ["abcdefghijklmnop", "xy"])
+	self.assertEqual (Sent [0], (16, 16, "abcdefghijklmnop"))
+	self.assertEqual (Sent [1], (2, 16, "xy" + "\0" * 14))
+
+    def test_copy (self):
+	Received = []
+	def Receive ():
+	    self.Server.MsgReceive (Copy = True)
+	    Received.append (self.Server.RxData)
+	    self.Server.MsgReply (0, "")
+	Thread = threading.Thread (target = Receive)
+	Thread.start ()
+	self.Client.MsgSend ("kept\0", 16)
+	Thread.join (5)
+	self.assertEqual (Received, ["kept\0"])
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,95 @@
+import os, time, shutil, tempfile, threading, unittest
+
+from tests.support import Name, ServerProcess
+
+from PyQNX6 import core
+from PyQNX6.core import Waitfor, WaitforAll, WaitforAttach, WaitforAttachAll
+from PyQNX6.Message import Message
+
+
+_Notifier = core._Notifier
+
+class _Polled (_Notifier):
+    """
+    No notification, as on QNX.
+    """
+    def __init__ (self):
+	_Notifier.__init__ (self)
+	self.Close ()
+
+
+class WaitforTest (unittest.TestCase):
+
+    def setUp (self):
+	self.Dir = tempfile.mkdtemp ()
+
+    def tearDown (self):
+	shutil.rmtree (self.Dir, True)
+
+    def Later (self, Delay, *Paths):
+	"""
+	Create Paths (and their directories) after Delay seconds.
+	"""
+	def Create ():
+	    time.sleep (Delay)
+	    for Path in Paths:
+		if not os.path.isdir (os.path.dirname (Path)): os.makedirs (os.path.dirname (Path))
+		open (Path, "w").close ()
+	Thread = threading.Thread (target = Create)
+	Thread.start ()
+	return Thread
+
+    def test_exists (self):
+	self.assertTrue (Waitfor (self.Dir, 0))
+	self.assertEqual (WaitforAll ([self.Dir, self.Dir], 0), [])
+
+    def test_timeout (self):
+	Missing = os.path.join (self.Dir, "missing")
+	Start = time.time ()
+	self.assertFalse (Waitfor (Missing, 0.2))
+	self.assertTrue (0.2 <= time.time () - Start < 1)
+	self.assertEqual (WaitforAll ([self.Dir, Missing, Missing], 0.05), [Missing])
+
+    def test_all (self, Polled = False):
+	Paths = [os.path.join (self.Dir, "a"), os.path.join (self.Dir, "sub", "dir", "b")]
+	Found = []
+	Thread = self.Later (0.1, *Paths)
+	Start = time.time ()
+	self.assertEqual (WaitforAll (Paths, 5, Found.append), [])
+	self.assertTrue (time.time () - Start < (1 if Polled else 0.3))
+	self.assertEqual (sorted (Found), sorted (Paths))
+	Thread.join ()
+
+    def test_all_polled (self):
+	core._Notifier = _Polled
+	try: self.test_all (Polled = True)
+	finally: core._Notifier = _Notifier
+
+
+def Attach (Name, Delay):
+    time.sleep (Delay)
+    Server = Message (Name)
+    time.sleep (10)
+
+
+class WaitforAttachTest (unittest.TestCase):
+
+    def test_attach (self):
+	Service = Name ("waitfor")
+	with ServerProcess (lambda: Attach (Service, 0.1)):
+	    self.assertFalse (WaitforAttach (Service, Timeout = 0.01))
+	    self.assertTrue (WaitforAttach (Service, Timeout = 5))
+
+    def test_attach_all (self):
+	Services = [Name ("waitfor") for i in range (3)]
+	Found = []
+	Servers = [ServerProcess (lambda Service = Service: Attach (Service, 0.1)) for Service in Services [:2]]
+	try:
+	    self.assertEqual (WaitforAttachAll (Services, Timeout = 1, Found = Found.append), Services [2:])
+	    self.assertEqual (sorted (Found), sorted (Services [:2]))
+	finally:
+	    for Server in Servers: Server.Stop ()
+
+
+if __name__ == '__main__':
+    unittest.main ()